@@ -0,0 +1,249 @@
+import json
+from functools import wraps
+
+from django.http import Http404, HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+
+from .comment_tree import COMMENTS_PER_PAGE
+from .conditional import can_view
+from .models import College, Thread, Comment
+from .names import get_anon_names, get_display_name, with_author_name
+from .pagination import paginate, InvalidCursor, SORT_FIELDS, DEFAULT_SORT
+from .ranking import ranked_threads, TOP_WINDOWS, DEFAULT_TOP_WINDOW
+from .votes import get_thread_like_statuses
+
+
+# Read-only JSON API, mounted under api/v1/. Every resource can be trimmed
+# to the fields listed in ?fields=, lists are paginated with the same
+# keyset cursors as the HTML pages and whole comment trees are streamed.
+
+# Rows fetched from the database at a time while streaming a tree
+STREAM_CHUNK_SIZE = 500
+
+
+class APIError(Exception):
+    def __init__(self, message, status=400):
+        super(APIError, self).__init__(message)
+        self.message = message
+        self.status = status
+
+
+def json_response(data, status=200):
+    return HttpResponse(json.dumps(data), content_type='application/json', status=status)
+
+
+def api_view(view):
+    """
+    Answers errors with JSON instead of redirects and HTML pages, and only
+    lets signed in users through.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return json_response({'error': 'Authentication required'}, status=401)
+        if request.method != 'GET':
+            return json_response({'error': 'Method not allowed'}, status=405)
+        try:
+            return view(request, *args, **kwargs)
+        except APIError as error:
+            return json_response({'error': error.message}, status=error.status)
+        except InvalidCursor:
+            return json_response({'error': 'Invalid page cursor'}, status=400)
+        except Http404:
+            return json_response({'error': 'Not found'}, status=404)
+    return wrapper
+
+
+def check_college(user, college_id):
+    if not can_view(user, college_id):
+        raise APIError('You do not belong to this college', status=403)
+
+
+def timestamp(value):
+    return value.isoformat() if value else None
+
+
+# Every field a resource can have, computed from the post and a function
+# giving its author's display name
+THREAD_FIELDS = {
+    'pk': lambda thread, name: thread.pk,
+    'slug': lambda thread, name: thread.slug,
+    'url': lambda thread, name: thread.get_absolute_url(),
+    'title': lambda thread, name: thread.title,
+    'body': lambda thread, name: thread.body,
+    'author': lambda thread, name: name(thread),
+    'score': lambda thread, name: thread.score,
+    'commentsCount': lambda thread, name: thread.comments_count,
+    'hits': lambda thread, name: thread.hits,
+    'timestamp': lambda thread, name: timestamp(thread.timestamp),
+    'editedTimestamp': lambda thread, name: timestamp(thread.edited_timestamp),
+}
+
+COMMENT_FIELDS = {
+    'pk': lambda comment, name: comment.pk,
+    'parent': lambda comment, name: comment.parent_id,
+    'depth': lambda comment, name: comment.depth,
+    'body': lambda comment, name: comment.body,
+    'author': lambda comment, name: name(comment),
+    'score': lambda comment, name: comment.score,
+    'repliesCount': lambda comment, name: comment.replies_count,
+    'timestamp': lambda comment, name: timestamp(comment.timestamp),
+    'editedTimestamp': lambda comment, name: timestamp(comment.edited_timestamp),
+}
+
+
+def get_fields(request, available):
+    fields = request.GET.get('fields')
+    if not fields:
+        return list(available)
+    fields = [field for field in fields.split(',') if field]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise APIError('Unknown fields: ' + ', '.join(unknown))
+    return fields
+
+
+def serializer(fields, available, name):
+    return lambda post: {field: available[field](post, name) for field in fields}
+
+
+def namer(user, anon_names={}):
+    return lambda post: get_display_name(user=user, post=post, anon_names=anon_names)
+
+
+def get_thread(user, thread_slug):
+    thread = get_object_or_404(with_author_name(Thread.objects.all()), slug=thread_slug)
+    check_college(user, thread.college_id)
+    return thread
+
+
+@api_view
+def forum_threads(request, college_slug):
+    college = get_object_or_404(College, slug=college_slug)
+    check_college(request.user, college.pk)
+
+    sort = request.GET.get('sort')
+    if sort not in SORT_FIELDS:
+        sort = DEFAULT_SORT
+    window = request.GET.get('t')
+    if window not in TOP_WINDOWS:
+        window = DEFAULT_TOP_WINDOW
+    serialize = serializer(
+        get_fields(request, THREAD_FIELDS),
+        THREAD_FIELDS,
+        namer(request.user),
+    )
+
+    page = paginate(
+        with_author_name(ranked_threads(college, sort, window)),
+        sort=sort,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
+    return json_response({
+        'threads': [serialize(thread) for thread in page],
+        'next': page.next_cursor,
+        'prev': page.prev_cursor,
+    })
+
+
+@api_view
+def thread_detail(request, thread_slug):
+    thread = get_thread(request.user, thread_slug)
+    serialize = serializer(
+        get_fields(request, THREAD_FIELDS),
+        THREAD_FIELDS,
+        namer(request.user, get_anon_names(thread)),
+    )
+    return json_response({'thread': serialize(thread)})
+
+
+@api_view
+def thread_comments(request, thread_slug):
+    """
+    A page of the thread's top-level comments, or of the replies to
+    ?parent=<pk>, best first.
+    """
+    thread = get_thread(request.user, thread_slug)
+    serialize = serializer(
+        get_fields(request, COMMENT_FIELDS),
+        COMMENT_FIELDS,
+        namer(request.user, get_anon_names(thread)),
+    )
+
+    comments = thread.comments.filter(depth=0)
+    parent = request.GET.get('parent')
+    if parent:
+        if not parent.isdigit():
+            raise APIError('Invalid parent')
+        comments = thread.comments.filter(parent_id=int(parent))
+
+    page = paginate(
+        with_author_name(comments),
+        sort='top',
+        after=request.GET.get('after'),
+        per_page=COMMENTS_PER_PAGE,
+    )
+    return json_response({
+        'comments': [serialize(comment) for comment in page],
+        'next': page.next_cursor,
+    })
+
+
+@api_view
+def thread_votes(request, thread_slug):
+    thread = get_thread(request.user, thread_slug)
+    thread_like_status, comment_like_statuses = get_thread_like_statuses(request.user, thread)
+    return json_response({
+        'thread': thread_like_status,
+        'comments': comment_like_statuses,
+    })
+
+
+def stream_comment_tree(comments, serialize, base_depth):
+    """
+    Yields comments (a queryset ordered by path, so every comment comes
+    right after its parent or its previous sibling's subtree) as a JSON
+    tree, one comment at a time. Every comment gets a `replies` list.
+    """
+    yield '{"comments": ['
+    depth = None
+    for comment in comments.iterator(chunk_size=STREAM_CHUNK_SIZE):
+        if depth is not None and comment.depth <= depth:
+            # Closes the previous comment and everything it is nested in
+            # down to this comment's siblings
+            yield ']}' * (depth - comment.depth + 1) + ', '
+        data = json.dumps(serialize(comment))
+        yield data[:-1] + (', ' if len(data) > 2 else '') + '"replies": ['
+        depth = comment.depth
+    if depth is not None:
+        yield ']}' * (depth - base_depth + 1)
+    yield ']}'
+
+
+def tree_response(request, thread, comments, base_depth):
+    serialize = serializer(
+        get_fields(request, COMMENT_FIELDS),
+        COMMENT_FIELDS,
+        namer(request.user, get_anon_names(thread)),
+    )
+    comments = with_author_name(comments).order_by('path')
+    return StreamingHttpResponse(
+        stream_comment_tree(comments, serialize, base_depth),
+        content_type='application/json',
+    )
+
+
+@api_view
+def thread_tree(request, thread_slug):
+    thread = get_thread(request.user, thread_slug)
+    return tree_response(request, thread, thread.comments.all(), base_depth=0)
+
+
+@api_view
+def comment_tree(request, comment_pk):
+    comment = get_object_or_404(Comment.objects.select_related('thread'), pk=comment_pk)
+    thread = comment.thread
+    check_college(request.user, thread.college_id)
+    subtree = thread.comments.filter(path__startswith=comment.path)
+    return tree_response(request, thread, subtree, base_depth=comment.depth)
@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class CollegesConfig(AppConfig):
     name = 'colleges'
+
+    def ready(self):
+        # Connects the cache invalidation and image processing receivers
+        # and registers every background task
+        from . import forum_cache, images, names, tasks
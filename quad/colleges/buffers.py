@@ -0,0 +1,168 @@
+import json
+import logging
+import os
+import threading
+
+from django.db import close_old_connections
+
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicFlusher:
+    """
+    Base for in-process write buffers. Subclasses implement flush(), which
+    is run on a daemon timer thread at most every flush_interval seconds
+    after something was buffered.
+    """
+
+    def __init__(self, flush_interval):
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def flush(self):
+        raise NotImplementedError
+
+    def schedule_flush(self):
+        with self.lock:
+            if self.timer is None:
+                self.timer = threading.Timer(self.flush_interval, self.flush_in_background)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush_in_background(self):
+        with self.lock:
+            self.timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception('Could not flush %s, retrying later', type(self).__name__)
+            self.schedule_flush()
+        finally:
+            close_old_connections()
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Somebody else's process
+        return True
+    return True
+
+
+class LoggedFlusher(PeriodicFlusher):
+    """
+    PeriodicFlusher that appends whatever it buffers to a log file before
+    acknowledging it, so a process that is killed before its next flush
+    loses nothing: the log is replayed by the next process to start.
+
+    Every process logs to log_path suffixed with its pid, and takes over the
+    logs of processes that are gone when it starts. Subclasses implement
+    log_entries(), the JSON entries of everything still buffered, and
+    replay_entry(), which buffers an entry read back from a log.
+    """
+
+    def __init__(self, log_path, flush_interval):
+        super(LoggedFlusher, self).__init__(flush_interval)
+        self.base_log_path = log_path
+        self.log_path = f'{log_path}.{os.getpid()}'
+        self.log = None
+
+    def log_entries(self):
+        raise NotImplementedError
+
+    def replay_entry(self, entry):
+        raise NotImplementedError
+
+    def open_log(self):
+        if self.log:
+            self.log.close()
+        self.log = open(self.log_path, 'a')
+
+    def append_log(self, entry, sync=True):
+        """
+        Appends entry to the log. Without sync it only reaches the operating
+        system, which keeps it through the process being killed but not
+        through the machine going down.
+        """
+        self.log.write(json.dumps(entry) + '\n')
+        self.log.flush()
+        if sync:
+            os.fsync(self.log.fileno())
+
+    def rewrite_log(self):
+        """
+        Replaces the log with one of the entries still buffered. The new log
+        is written next to it and renamed over it, so a crash leaves one or
+        the other whole. Needs self.lock.
+        """
+        temp_path = self.log_path + '.tmp'
+        with open(temp_path, 'w') as temp:
+            for entry in self.log_entries():
+                temp.write(json.dumps(entry) + '\n')
+            temp.flush()
+            os.fsync(temp.fileno())
+        os.replace(temp_path, self.log_path)
+        # Makes the rename itself durable
+        directory = os.open(os.path.dirname(os.path.abspath(self.log_path)), os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        self.open_log()
+
+    def orphaned_logs(self):
+        """
+        The paths of this process's log, the logs of processes that are no
+        longer running and the unsuffixed log of older versions, with the
+        temporary files left behind by interrupted rewrites.
+        """
+        logs, leftovers = [], []
+        directory = os.path.dirname(os.path.abspath(self.base_log_path))
+        prefix = os.path.basename(self.base_log_path)
+        for name in os.listdir(directory):
+            if name == prefix:
+                logs.append(os.path.join(directory, name))
+                continue
+            if not name.startswith(prefix + '.'):
+                continue
+            pid, _, extension = name[len(prefix) + 1:].partition('.')
+            if not pid.isdigit() or extension not in ('', 'tmp'):
+                continue
+            if int(pid) != os.getpid() and process_alive(int(pid)):
+                continue
+            (leftovers if extension else logs).append(os.path.join(directory, name))
+        return logs, leftovers
+
+    def replay(self):
+        """
+        Buffers the entries of the orphaned logs and returns how many there
+        were.
+        """
+        replayed = 0
+        logs, leftovers = self.orphaned_logs()
+        for path in logs:
+            with open(path) as log:
+                for line in log:
+                    try:
+                        self.replay_entry(json.loads(line))
+                        replayed += 1
+                    except (ValueError, KeyError):
+                        # A torn last line is all a crash mid-write can leave
+                        logger.warning('Skipping unreadable log entry %r in %s', line, path)
+
+        # The entries taken over are in this process's log before the logs
+        # they came from go away
+        with self.lock:
+            self.rewrite_log()
+        for path in logs + leftovers:
+            if path != self.log_path:
+                os.remove(path)
+
+        if replayed:
+            self.schedule_flush()
+        return replayed
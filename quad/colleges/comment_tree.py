@@ -0,0 +1,206 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.functions import Substr
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import escape, format_html
+from django.utils.http import urlencode
+
+from .fragments import render_fragments, stitch
+from .models import PATH_SEGMENT_LENGTH
+from .names import with_author_name
+from .pagination import paginate, encode_cursor
+
+
+# Cached subtrees still contain naturaltime stamps ("5 minutes ago"), so they
+# are only kept for a short while even when nothing in them changed
+COMMENT_TREE_CACHE_TIMEOUT = getattr(settings, 'COMMENT_TREE_CACHE_TIMEOUT', 60)
+
+# A page of comments is bounded in every direction: this many top-level
+# comments (or replies, for a branch), this many levels of replies below
+# them, this many replies per comment and never more comments than
+# MAX_LOADED_COMMENTS. Anything cut off gets a "load more" link.
+COMMENTS_PER_PAGE = 20
+REPLY_LEVELS = 3
+REPLIES_PER_COMMENT = 5
+MAX_LOADED_COMMENTS = 300
+
+
+def load_comment_page(thread, parent=None, after=None):
+    """
+    Returns a page of the top-level comments of thread (or of the replies
+    to parent), the comments below them within REPLY_LEVELS, and the
+    cursor of the next page. Raises InvalidCursor for a bad `after`.
+    """
+    if parent is None:
+        siblings = thread.comments.filter(depth=0)
+    else:
+        siblings = parent.children.all()
+    page = paginate(
+        with_author_name(siblings),
+        sort='top',
+        after=after,
+        per_page=COMMENTS_PER_PAGE,
+    )
+    roots = list(page)
+    return roots, load_descendants(thread, roots), page.next_cursor
+
+
+# Everything under roots (which are siblings) down to REPLY_LEVELS below
+# them, shallowest and best-scored first
+def load_descendants(thread, roots):
+    if not roots:
+        return []
+    depth = roots[0].depth
+    return list(
+        with_author_name(thread.comments.all()).annotate(
+            root_path=Substr('path', 1, PATH_SEGMENT_LENGTH * (depth + 1)),
+        ).filter(
+            depth__gt=depth,
+            depth__lte=depth + REPLY_LEVELS,
+            root_path__in=[root.path for root in roots],
+        ).order_by('depth', '-score', '-pk')[:MAX_LOADED_COMMENTS]
+    )
+
+
+# Same order as a page of comments from colleges.pagination
+def sort_by_score(comments):
+    comments.sort(key=lambda comment: (-comment.score, -comment.pk))
+
+
+def build_comment_tree(roots, descendants, names):
+    """
+    Links descendants (ordered by depth) below roots and returns every
+    comment that made it into the tree. Every comment gets a `replies`
+    list sorted by current score, `more_url`/`more_count` when some of
+    its replies were cut off, and a `subtree_version` that changes
+    whenever anything in its subtree would render differently. names maps comment
+    pks to the public display names.
+    """
+    nodes = {}
+    for comment in roots:
+        comment.replies = []
+        nodes[comment.pk] = comment
+    for comment in descendants:
+        parent = nodes.get(comment.parent_id)
+        if parent is not None:
+            comment.replies = []
+            nodes[comment.pk] = comment
+            parent.replies.append(comment)
+
+    # Trims every comment's replies breadth first, so the kept comments end
+    # up listed with every parent before its children
+    tree = list(roots)
+    for comment in tree:
+        sort_by_score(comment.replies)
+        shown = comment.replies[:REPLIES_PER_COMMENT]
+        comment.replies = shown
+        comment.more_count = comment.replies_count - len(shown)
+        comment.more_url = None
+        if comment.more_count > 0:
+            comment.more_url = reverse('comment_replies', args=[comment.pk])
+            if shown:
+                cursor = encode_cursor(shown[-1], 'score')
+                comment.more_url += '?' + urlencode({'after': cursor})
+        tree.extend(shown)
+
+    # Walking backwards versions every subtree before its parent
+    for comment in reversed(tree):
+        stamp = [
+            comment.version,
+            names[comment.pk],
+            comment.more_url,
+            comment.more_count,
+        ]
+        stamp.extend(reply.subtree_version for reply in comment.replies)
+        comment.subtree_version = md5(repr(stamp).encode()).hexdigest()
+
+    return tree
+
+
+# Walks a subtree iteratively and lists what the flat comment template has
+# to output: a card per comment, "load more" links and closing tags. Node
+# events get their card's HTML once the cards are rendered.
+def flatten_comment_tree(root):
+    events = []
+    stack = [('node', root)]
+    while stack:
+        kind, comment = stack.pop()
+        if kind == 'node':
+            comment.has_footer = bool(comment.replies or comment.more_url)
+            events.append({'kind': 'node', 'node': comment})
+            if comment.has_footer:
+                stack.append(('end', comment))
+                stack.extend(('node', reply) for reply in reversed(comment.replies))
+        else:
+            if comment.more_url:
+                events.append({'kind': 'more', 'node': comment})
+            events.append({'kind': 'end', 'node': comment})
+    return events
+
+
+def subtree_cache_key(comment):
+    return f'comment-subtree:{comment.pk}:{comment.subtree_version}'
+
+
+def render_comment_subtrees(roots):
+    """
+    Returns the shared HTML of every subtree in roots, rendering only the
+    ones that are not cached under their current version. A subtree that
+    changed is stitched back together from its comments' cards, of which
+    only the changed ones are rendered again.
+    """
+    keys = {root.pk: subtree_cache_key(root) for root in roots}
+    cached = cache.get_many(keys.values())
+
+    events = {
+        root.pk: flatten_comment_tree(root)
+        for root in roots if keys[root.pk] not in cached
+    }
+    nodes = [
+        event for root_events in events.values()
+        for event in root_events if event['kind'] == 'node'
+    ]
+    cards = render_fragments(
+        'comment',
+        'forum/comment_card.html',
+        [event['node'] for event in nodes],
+    )
+    for event in nodes:
+        event['html'] = cards[event['node'].pk]
+
+    rendered = {}
+    chunks = []
+    for root in roots:
+        html = cached.get(keys[root.pk])
+        if html is None:
+            html = render_to_string('forum/comment.html', {'events': events[root.pk]})
+            rendered[keys[root.pk]] = html
+        chunks.append(html)
+
+    if rendered:
+        cache.set_many(rendered, COMMENT_TREE_CACHE_TIMEOUT)
+    return ''.join(chunks)
+
+
+def owner_links(comment):
+    return format_html(
+        ' • <a href="{}">Edit</a> • <a href="{}">Delete</a>',
+        reverse('edit_comment', args=[comment.pk]),
+        reverse('delete_comment', args=[comment.pk]),
+    )
+
+
+# Fills the viewer-specific slots of the shared comment HTML
+def personalize_comments(html, comments, user, names):
+    slots = {}
+    for comment in comments:
+        pk = str(comment.pk)
+        if comment.author_id is not None and comment.author_id == user.pk:
+            slots[('name', pk)] = '[me]'
+            slots[('owner', pk)] = owner_links(comment)
+        else:
+            slots[('name', pk)] = escape(names[comment.pk])
+    return stitch(html, slots)
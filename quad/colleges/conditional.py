@@ -0,0 +1,99 @@
+from hashlib import md5
+
+from django.contrib.messages import get_messages
+from django.db.models import Max, OuterRef, Subquery
+
+from .models import College, Thread
+
+
+# Validators for django.views.decorators.http.condition. Each page's
+# validator comes from a single query on indexed columns, run before the
+# view so an unchanged page is answered with a 304 without loading any
+# comments. condition() asks for the ETag and the Last-Modified time
+# separately, so the query's result is kept on the request.
+#
+# A forum's Last-Modified only follows posts and edits. Votes change the
+# ETag, which clients that have it send instead of If-Modified-Since. Thread
+# pages only have an ETag, from the thread's generation column.
+
+
+# A single aggregate of the rows of queryset belonging to the outer row
+def aggregate_subquery(queryset, group, aggregate):
+    return Subquery(
+        queryset.order_by().values(group).annotate(value=aggregate).values('value')
+    )
+
+
+def make_etag(request, values):
+    # Pages embed the viewer's CSRF token and only have to be equivalent,
+    # not byte for byte identical, so the ETag is weak
+    values = values + (request.user.pk, request.META.get('CSRF_COOKIE'))
+    return 'W/"{}"'.format(md5(repr(values).encode()).hexdigest())
+
+
+def latest(*timestamps):
+    return max((timestamp for timestamp in timestamps if timestamp), default=None)
+
+
+def cached_validator(compute):
+    """
+    Turns compute(request, **kwargs), which returns an (etag, last_modified)
+    pair or None, into the two callables condition() expects, sharing one
+    call per request. Nothing is validated while the user has messages
+    waiting, since the page is where they are shown.
+    """
+    def validator(request, *args, **kwargs):
+        if not hasattr(request, '_page_validator'):
+            request._page_validator = None
+            if not len(get_messages(request)):
+                request._page_validator = compute(request, *args, **kwargs)
+        return request._page_validator or (None, None)
+
+    def etag(request, *args, **kwargs):
+        return validator(request, *args, **kwargs)[0]
+
+    def last_modified(request, *args, **kwargs):
+        return validator(request, *args, **kwargs)[1]
+
+    return etag, last_modified
+
+
+def can_view(user, college_id):
+    return user.college_id == college_id or user.is_staff
+
+
+def compute_forum_validator(request, college_slug):
+    threads = Thread.objects.filter(college=OuterRef('pk'))
+    row = College.objects.filter(slug=college_slug).annotate(
+        last_posted=Subquery(threads.order_by('-timestamp').values('timestamp')[:1]),
+        last_edited=aggregate_subquery(threads, 'college', Max('edited_timestamp')),
+    ).values_list(
+        'pk', 'last_posted', 'last_edited', 'generation', 'logo', 'images_generation',
+    ).first()
+    if row is None or not can_view(request.user, row[0]):
+        return None
+
+    # The generation changes with every post, edit and vote in the college
+    # (see colleges.forum_cache), which covers scores and ranks. The images
+    # generation changes along with the logo's variants.
+    params = tuple(request.GET.get(param) for param in ('sort', 't', 'after', 'before'))
+    etag = make_etag(request, row + params)
+    return etag, latest(row[1], row[2])
+
+
+def compute_thread_validator(request, thread_slug):
+    row = Thread.objects.filter(slug=thread_slug).values_list(
+        'pk', 'college_id', 'generation', 'college__logo', 'college__images_generation',
+    ).first()
+    if row is None or not can_view(request.user, row[1]):
+        return None
+
+    # The generation changes with every edit, comment and vote in the
+    # thread, the viewer's own votes included. The hero at the top of the
+    # page shows the college's logo and its variants.
+    etag = make_etag(request, row)
+    return etag, None
+
+
+forum_etag, forum_last_modified = cached_validator(compute_forum_validator)
+thread_etag = cached_validator(compute_thread_validator)[0]
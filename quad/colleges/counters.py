@@ -0,0 +1,161 @@
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    F,
+    FloatField,
+    IntegerField,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Coalesce
+
+from .models import College, Thread, Comment, DELETED_BODY
+from .ranking import hot_rank
+from .signals import send_threads_changed
+
+
+# Denormalized counters. Every one of them is shifted with an F() expression
+# in the transaction that writes the post it counts, so concurrent writers
+# can't lose each other's updates:
+#
+#   Thread.comments_count   comments on the thread that aren't deleted
+#   College.threads_count   threads in the college that aren't deleted
+#   College.comments_count  comments in the college that aren't deleted
+#   MyUser.posts_count      threads and comments the user wrote
+#   MyUser.karma            the total score of those posts
+#
+# Deleting a post removes its author, so deleted posts count towards nobody.
+# rebuild_counters() recomputes everything from scratch.
+
+RANK_BATCH_SIZE = 500
+
+
+def shift_user(author_id, posts=0, karma=0):
+    if author_id is not None:
+        get_user_model().objects.filter(pk=author_id).update(
+            posts_count=F('posts_count') + posts,
+            karma=F('karma') + karma,
+        )
+
+
+# Shifts the karma of many users in a single UPDATE, deltas maps user pks
+# to karma changes
+def shift_karma(deltas):
+    deltas = {pk: delta for pk, delta in deltas.items() if pk is not None and delta}
+    if deltas:
+        get_user_model().objects.filter(pk__in=deltas).update(karma=F('karma') + Case(
+            *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        ))
+
+
+# The hot rank counts comments, so it is refreshed along with the count
+def shift_comments_count(thread, delta):
+    rows = Thread.objects.filter(pk=thread.pk)
+    rows.update(comments_count=F('comments_count') + delta, generation=F('generation') + 1)
+    score, comments_count, timestamp, generation = rows.values_list(
+        'score', 'comments_count', 'timestamp', 'generation'
+    ).get()
+    thread.comments_count = comments_count
+    thread.generation = generation
+    thread.rank = hot_rank(score, comments_count, timestamp)
+    rows.update(rank=thread.rank)
+
+    College.objects.filter(pk=thread.college_id).update(
+        comments_count=F('comments_count') + delta
+    )
+    send_threads_changed({thread.college_id})
+
+
+def count_thread_created(thread):
+    College.objects.filter(pk=thread.college_id).update(
+        threads_count=F('threads_count') + 1
+    )
+    shift_user(thread.author_id, posts=1, karma=thread.score)
+
+
+def count_thread_deleted(thread, author_id):
+    College.objects.filter(pk=thread.college_id).update(
+        threads_count=F('threads_count') - 1
+    )
+    shift_user(author_id, posts=-1, karma=-thread.score)
+
+
+def count_comment_created(comment, thread):
+    shift_comments_count(thread, 1)
+    shift_user(comment.author_id, posts=1, karma=comment.score)
+
+
+def count_comment_deleted(comment, thread, author_id):
+    shift_comments_count(thread, -1)
+    shift_user(author_id, posts=-1, karma=-comment.score)
+
+
+def count_of(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+            value=Count('pk'),
+        ).values('value'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def sum_of(queryset, field, summed):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+            value=Sum(summed),
+        ).values('value'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+@transaction.atomic
+def rebuild_counters():
+    """
+    Recomputes every counter with one UPDATE per table and returns how many
+    threads had a wrong comment count. Only those threads are re-ranked.
+    """
+    live_threads = Thread.objects.exclude(body=DELETED_BODY)
+    live_comments = Comment.objects.exclude(body=DELETED_BODY)
+
+    stale = list(Thread.objects.annotate(
+        actual=count_of(live_comments, 'thread'),
+    ).exclude(comments_count=F('actual')).values_list('pk', flat=True))
+    for start in range(0, len(stale), RANK_BATCH_SIZE):
+        rows = Thread.objects.filter(pk__in=stale[start:start + RANK_BATCH_SIZE])
+        rows.update(
+            comments_count=count_of(live_comments, 'thread'),
+            generation=F('generation') + 1,
+        )
+        ranks = [
+            When(pk=pk, then=Value(hot_rank(score, comments_count, timestamp)))
+            for pk, score, comments_count, timestamp in rows.values_list(
+                'pk', 'score', 'comments_count', 'timestamp'
+            )
+        ]
+        rows.update(rank=Case(*ranks, default=F('rank'), output_field=FloatField()))
+
+    College.objects.update(
+        threads_count=count_of(live_threads, 'college'),
+        comments_count=count_of(live_comments, 'thread__college'),
+    )
+    get_user_model().objects.update(
+        posts_count=(
+            count_of(Thread.objects.all(), 'author') +
+            count_of(Comment.objects.all(), 'author')
+        ),
+        karma=(
+            sum_of(Thread.objects.all(), 'author', 'score') +
+            sum_of(Comment.objects.all(), 'author', 'score')
+        ),
+    )
+
+    if stale:
+        send_threads_changed(set(College.objects.values_list('pk', flat=True)))
+    return len(stale)
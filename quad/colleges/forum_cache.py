@@ -0,0 +1,81 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .models import College, Thread
+
+
+class LRUCache:
+    """
+    Thread-safe in-process LRU cache whose entries expire after ttl
+    seconds. Keeps hit and miss counts.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None:
+                expires, value = item
+                if expires > time.monotonic():
+                    self.items.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.items[key]
+            self.misses += 1
+            return None
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        with self.lock:
+            self.items[key] = (time.monotonic() + self.ttl, value)
+            self.items.move_to_end(key)
+            while len(self.items) > self.max_size:
+                self.items.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def stats(self):
+        with self.lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': len(self.items),
+                'max_size': self.max_size,
+            }
+
+
+forum_cache = LRUCache(settings.FORUM_CACHE_SIZE, settings.FORUM_CACHE_TTL)
+
+
+# Every college's cached listings are keyed on its generation column,
+# which is bumped in the same transaction as every change to its threads,
+# like Thread.generation. Every process reads it with the college's row,
+# so nothing has to reach the other processes' caches, and stale entries
+# age out of the LRU on their own.
+def invalidate_colleges(college_ids):
+    College.objects.filter(pk__in=college_ids).update(generation=F('generation') + 1)
+
+
+def forum_page_key(college, *params):
+    return (college.pk, college.generation) + params
+
+
+@receiver(post_save, sender=Thread)
+def thread_saved(sender, instance, **kwargs):
+    invalidate_colleges({instance.college_id})
@@ -0,0 +1,80 @@
+import re
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+
+# Shared HTML fragments are rendered once for every viewer, with a slot
+# marker wherever the markup depends on who is looking (display names,
+# edit/delete links). User content is always escaped, so it can never
+# produce a marker of its own.
+SLOT_FORMAT = '<!--slot:{kind}:{key}-->'
+SLOT_RE = re.compile(r'<!--slot:(\w+):(\w+)-->')
+
+FRAGMENT_CACHE_TIMEOUT = getattr(settings, 'FRAGMENT_CACHE_TIMEOUT', 60)
+
+
+def slot(kind, key):
+    return mark_safe(SLOT_FORMAT.format(kind=kind, key=key))
+
+
+# Fills every slot in html from slots, a dict keyed by (kind, key) strings.
+# Slots without a value are dropped.
+def stitch(html, slots):
+    return mark_safe(SLOT_RE.sub(lambda match: str(slots.get(match.groups(), '')), html))
+
+
+def fragment_cache_key(name, post):
+    return f'fragment:{name}:{post.version}'
+
+
+def render_fragments(name, template_name, posts):
+    """
+    Returns a dict mapping the pk of every post (a thread or comment) to
+    its shared HTML, rendering template_name only for the posts whose
+    current version is not cached yet.
+    """
+    keys = {post.pk: fragment_cache_key(name, post) for post in posts}
+    fragments = cache.get_many(keys.values())
+
+    rendered = {}
+    for post in posts:
+        key = keys[post.pk]
+        if key not in fragments:
+            rendered[key] = render_to_string(template_name, {'post': post})
+    if rendered:
+        cache.set_many(rendered, FRAGMENT_CACHE_TIMEOUT)
+        fragments.update(rendered)
+
+    return {pk: mark_safe(fragments[key]) for pk, key in keys.items()}
+
+
+def thread_owner_links(thread):
+    return format_html(
+        '<a class="btn btn-info" href="{}">Edit</a> '
+        '<a class="btn btn-danger" href="{}">Delete</a>',
+        reverse('edit_thread', args=[thread.slug]),
+        reverse('delete_thread', args=[thread.slug]),
+    )
+
+
+def render_thread_post(thread, user, name):
+    """
+    Returns the thread's post as user sees it, with name as its author.
+    The view count changes with nearly every request, so it is a slot too.
+    """
+    html = render_fragments('thread', 'forum/thread_post.html', [thread])[thread.pk]
+    pk = str(thread.pk)
+    slots = {
+        ('name', pk): escape(name),
+        ('hits', pk): format_html(
+            '{} view{}', thread.hits, '' if thread.hits == 1 else 's'
+        ),
+    }
+    if thread.author_id is not None and thread.author_id == user.pk:
+        slots[('owner', pk)] = thread_owner_links(thread)
+    return stitch(html, slots)
@@ -0,0 +1,113 @@
+import atexit
+import threading
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Case, When, Value, IntegerField
+
+from .buffers import LoggedFlusher
+from .models import Thread
+
+
+class HitCounter(LoggedFlusher):
+    """
+    Counts thread views in memory so that reading a thread never writes to
+    the database. Every flush adds the counted views of all threads in one
+    UPDATE ... CASE statement, relative to the stored count, so concurrent
+    flushes from several processes never overwrite each other.
+
+    Views are counted by thread slug, which a page answered with a 304 has
+    without loading the thread. Every view is appended to the log (see
+    LoggedFlusher) without an fsync, which would cost more than the write
+    it saves: a killed process loses no views, only a machine that goes
+    down can. Views are added rather than set, so a crash between a flush's
+    commit and the rewrite of the log counts the flushed views twice.
+    """
+
+    def __init__(self, log_path, flush_interval):
+        super(HitCounter, self).__init__(log_path, flush_interval)
+        self.flush_lock = threading.Lock()
+        self.hits = Counter()
+        self.replay()
+
+    def log_entries(self):
+        return [{'slug': slug, 'hits': count} for slug, count in self.hits.items()]
+
+    def replay_entry(self, entry):
+        self.hits[entry['slug']] += entry['hits']
+
+    def record(self, thread_slug):
+        with self.lock:
+            self.hits[thread_slug] += 1
+            self.append_log({'slug': thread_slug, 'hits': 1}, sync=False)
+        self.schedule_flush()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                hits, self.hits = self.hits, Counter()
+            if not hits:
+                return 0
+
+            try:
+                with transaction.atomic():
+                    Thread.objects.filter(slug__in=hits).update(hits=F('hits') + Case(
+                        *[When(slug=slug, then=Value(count)) for slug, count in hits.items()],
+                        default=Value(0),
+                        output_field=IntegerField(),
+                    ))
+            except Exception:
+                with self.lock:
+                    self.hits.update(hits)
+                raise
+
+            # The log only has to cover what is still counted now
+            with self.lock:
+                self.rewrite_log()
+            return sum(hits.values())
+
+
+hit_counter = None
+hit_counter_lock = threading.Lock()
+
+
+def get_hit_counter():
+    global hit_counter
+    with hit_counter_lock:
+        if hit_counter is None:
+            hit_counter = HitCounter(
+                log_path=settings.HIT_COUNTER_LOG,
+                flush_interval=settings.HIT_COUNTER_FLUSH_INTERVAL,
+            )
+            atexit.register(hit_counter.flush)
+    return hit_counter
+
+
+def count_hit(request, thread_slug):
+    """
+    Counts a view of the thread. With HIT_COUNTER_DEDUP_SECONDS set, repeated
+    views from the same session within that window only count once.
+    """
+    dedup_seconds = settings.HIT_COUNTER_DEDUP_SECONDS
+    if dedup_seconds:
+        viewer = request.session.session_key or f'user-{request.user.pk}'
+        if not cache.add(f'thread-hit:{viewer}:{thread_slug}', True, dedup_seconds):
+            return
+    get_hit_counter().record(thread_slug)
+
+
+def counts_hits(view_func):
+    """
+    Counts a view of every thread page view_func shows. Goes outside
+    condition(), so pages answered with a 304 count too.
+    """
+    @wraps(view_func)
+    def view(request, thread_slug, *args, **kwargs):
+        response = view_func(request, thread_slug, *args, **kwargs)
+        if response.status_code in (200, 304):
+            count_hit(request, thread_slug)
+        return response
+    return view
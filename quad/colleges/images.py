@@ -0,0 +1,189 @@
+import hashlib
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from PIL import Image, ImageOps, features
+
+from .models import College, CollegeImageVariant
+from .taskqueue import task
+
+
+logger = logging.getLogger(__name__)
+
+# Uploaded logos and banners are served as resized WebP and JPEG variants,
+# stripped of metadata and named after a hash of their content so they can
+# be cached forever. Variants are built by a background task once the
+# upload is committed, and the original is served until they are ready.
+
+IMAGE_FIELDS = ('logo', 'banner')
+
+# MIME types of the formats variants are built in, best first
+VARIANT_FORMATS = {
+    'webp': 'image/webp',
+    'jpeg': 'image/jpeg',
+}
+
+VARIANTS_CACHE_TIMEOUT = 60 * 60
+
+
+def variant_formats():
+    # Pillow can be built without WebP support
+    return [fmt for fmt in VARIANT_FORMATS if fmt != 'webp' or features.check('webp')]
+
+
+def variant_widths(field, source_width):
+    """
+    The widths of field's variants for an image source_width pixels wide.
+    Images are never scaled up, so a small one gets one variant at its own
+    width.
+    """
+    widths = [width for width in settings.IMAGE_VARIANT_WIDTHS[field] if width < source_width]
+    return widths or [source_width]
+
+
+def encode(image, fmt):
+    output = BytesIO()
+    if fmt == 'jpeg':
+        if image.mode in ('RGBA', 'LA', 'P'):
+            image = image.convert('RGBA')
+            background = Image.new('RGB', image.size, 'white')
+            background.paste(image, mask=image.split()[-1])
+            image = background
+        elif image.mode != 'RGB':
+            image = image.convert('RGB')
+        image.save(output, 'JPEG', quality=settings.IMAGE_VARIANT_QUALITY, optimize=True, progressive=True)
+    else:
+        if image.mode not in ('RGB', 'RGBA'):
+            image = image.convert('RGBA')
+        image.save(output, 'WEBP', quality=settings.IMAGE_VARIANT_QUALITY, method=6)
+    return output.getvalue()
+
+
+class UnreadableImage(Exception):
+    pass
+
+
+def decode(data):
+    """
+    Decodes an uploaded image read into memory. Whatever Pillow raises
+    while doing so means it can't read the file, not that reading failed,
+    since the file was read before.
+    """
+    try:
+        image = Image.open(BytesIO(data))
+        image.load()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as error:
+        raise UnreadableImage(error) from error
+    return image
+
+
+def build_variants(college, field):
+    """
+    Replaces the variants of college's field with ones of its current
+    image, unless they already are.
+    """
+    upload = getattr(college, field)
+    old = list(CollegeImageVariant.objects.filter(college=college, field=field))
+    if upload and old and all(variant.source == upload.name for variant in old):
+        return
+
+    new = []
+    if upload:
+        with upload.open('rb') as source:
+            image = decode(source.read())
+        # Photos store their rotation in EXIF, which is dropped below
+        image = ImageOps.exif_transpose(image)
+        for width in variant_widths(field, image.width):
+            height = max(round(image.height * width / image.width), 1)
+            resized = image.resize((width, height), Image.LANCZOS)
+            # Leaves out EXIF, ICC profiles, comments and the like
+            resized.info = {}
+            for fmt in variant_formats():
+                data = encode(resized, fmt)
+                digest = hashlib.sha256(data).hexdigest()[:16]
+                variant = CollegeImageVariant(
+                    college=college,
+                    field=field,
+                    source=upload.name,
+                    format=fmt,
+                    width=width,
+                    height=height,
+                    size=len(data),
+                )
+                # Names follow the content, so a file that is already
+                # there is the very same image
+                name = CollegeImageVariant.image.field.generate_filename(
+                    variant, f'{college.slug}-{field}-{width}.{digest}.{fmt}'
+                )
+                storage = variant.image.storage
+                if not storage.exists(name):
+                    name = storage.save(name, ContentFile(data))
+                variant.image.name = name
+                new.append(variant)
+
+    with transaction.atomic():
+        CollegeImageVariant.objects.filter(pk__in=[variant.pk for variant in old]).delete()
+        CollegeImageVariant.objects.bulk_create(new)
+        # Moves every process on to a new cache entry, and pages showing the
+        # images on to new ETags
+        College.objects.filter(pk=college.pk).update(
+            images_generation=F('images_generation') + 1
+        )
+    kept = {variant.image.name for variant in new}
+    for variant in old:
+        if variant.image.name not in kept:
+            variant.image.delete(save=False)
+
+
+# Entries are never invalidated, they are keyed on the college's
+# images_generation, which every process reads from the database
+def variants_key(college_id, generation):
+    return f'college-images:{college_id}:{generation}'
+
+
+def get_image_variants(college_id, generation):
+    """
+    Returns {field: {format: [(url, width, height)]}} of the college's
+    variants, narrowest first. generation is the college's
+    images_generation.
+    """
+    def load():
+        variants = {}
+        for field, fmt, name, width, height in CollegeImageVariant.objects.filter(
+            college_id=college_id
+        ).order_by('width').values_list('field', 'format', 'image', 'width', 'height'):
+            url = CollegeImageVariant.image.field.storage.url(name)
+            variants.setdefault(field, {}).setdefault(fmt, []).append((url, width, height))
+        return variants
+    return cache.get_or_set(variants_key(college_id, generation), load, VARIANTS_CACHE_TIMEOUT)
+
+
+# Runs off the request path, see colleges.taskqueue
+@task(key=lambda college_id: f'college-images:{college_id}')
+def build_college_images(college_id):
+    college = College.objects.filter(pk=college_id).first()
+    if college is None:
+        return
+    for field in IMAGE_FIELDS:
+        try:
+            build_variants(college, field)
+        except UnreadableImage:
+            # No retry would fix it, unlike errors of the storage, which
+            # fail the task so it is retried
+            logger.exception('Could not build the %s variants of %s', field, college)
+
+
+@receiver(post_save, sender=College)
+def college_saved(sender, instance, **kwargs):
+    if any(getattr(instance, field) for field in IMAGE_FIELDS) or (
+        CollegeImageVariant.objects.filter(college=instance).exists()
+    ):
+        build_college_images.enqueue(college_id=instance.pk)
@@ -0,0 +1,180 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.http import StreamingHttpResponse
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+
+from .fragments import render_fragments, stitch
+
+
+# Pushes small changes to open thread pages as Server-Sent Events: new
+# comments with their rendered card, score changes, edits and deletes.
+# Events go through a broker, which only has to offer subscribe() and
+# publish(), so the in-process LocalBroker can be swapped for one that
+# reaches every worker through LIVE_BROKER.
+
+# Seconds between keepalive comments, which also notice gone clients
+KEEPALIVE_SECONDS = 15
+
+
+class LocalBroker:
+    """
+    In-process pub/sub. Callbacks are called in the publishing thread, so
+    they have to hand messages off rather than process them.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}  # channel -> set of callbacks
+
+    def subscribe(self, channel, callback):
+        """
+        Calls callback(message) with every message published on channel
+        until the returned function is called.
+        """
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(callback)
+
+        def unsubscribe():
+            with self.lock:
+                callbacks = self.subscribers.get(channel, set())
+                callbacks.discard(callback)
+                if not callbacks:
+                    self.subscribers.pop(channel, None)
+        return unsubscribe
+
+    def publish(self, channel, message):
+        with self.lock:
+            callbacks = list(self.subscribers.get(channel, ()))
+        for callback in callbacks:
+            callback(message)
+
+
+broker = None
+broker_lock = threading.Lock()
+
+
+def get_broker():
+    global broker
+    with broker_lock:
+        if broker is None:
+            broker = import_string(settings.LIVE_BROKER)()
+    return broker
+
+
+def thread_channel(thread_id):
+    return f'thread:{thread_id}'
+
+
+def publish(thread_id, event, data):
+    """
+    Sends event to everybody watching the thread once the current
+    transaction commits.
+    """
+    message = json.dumps({'event': event, 'data': data})
+    transaction.on_commit(
+        lambda: get_broker().publish(thread_channel(thread_id), message)
+    )
+
+
+def publish_score(target, pk, thread_id, score):
+    publish(thread_id, 'score', {'target': target, 'pk': pk, 'score': score})
+
+
+def publish_comment(comment, name):
+    """
+    Sends a new comment's card as everybody but its author sees it, with
+    name as the author's public name.
+    """
+    card = render_fragments('comment', 'forum/comment_card.html', [comment])[comment.pk]
+    html = stitch(card, {('name', str(comment.pk)): escape(name)}) + '</div>'
+    publish(comment.thread_id, 'comment', {
+        'pk': comment.pk,
+        'parent': comment.parent_id,
+        'html': html,
+    })
+
+
+def publish_edit(target, post, thread_id):
+    data = {'target': target, 'pk': post.pk, 'body': post.body}
+    if target == 'thread':
+        data['title'] = post.title
+    publish(thread_id, 'edit', data)
+
+
+def publish_delete(target, pk, thread_id):
+    publish(thread_id, 'delete', {'target': target, 'pk': pk})
+
+
+def live_updates(request):
+    """
+    Whether request came through quad.handlers.PooledASGIHandler, which
+    sends event streams from the event loop. Any other server would hold a
+    worker per open thread page for as long as the stream lasts, so pages
+    served by one don't open it.
+    """
+    return getattr(request, 'sends_async_streams', False)
+
+
+def format_event(message):
+    message = json.loads(message)
+    return f"event: {message['event']}\ndata: {json.dumps(message['data'])}\n\n"
+
+
+class EventStreamResponse(StreamingHttpResponse):
+    """
+    Server-Sent Events of one channel, for LIVE_STREAM_SECONDS after which
+    the browser reconnects on its own.
+
+    quad.handlers.PooledASGIHandler sends async_stream() from the event
+    loop, so a listener costs no thread. Other servers would iterate the
+    response like a normal streaming one, holding a thread per listener,
+    so they aren't given one (see live_updates()).
+    """
+
+    def __init__(self, channel):
+        self.channel = channel
+        super(EventStreamResponse, self).__init__(
+            self.sync_stream(),
+            content_type='text/event-stream',
+        )
+        self['Cache-Control'] = 'no-cache'
+        # Keeps proxies from buffering the stream
+        self['X-Accel-Buffering'] = 'no'
+
+    def sync_stream(self):
+        messages = queue.Queue()
+        unsubscribe = get_broker().subscribe(self.channel, messages.put)
+        try:
+            deadline = time.monotonic() + settings.LIVE_STREAM_SECONDS
+            while time.monotonic() < deadline:
+                try:
+                    yield format_event(messages.get(timeout=KEEPALIVE_SECONDS))
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            unsubscribe()
+
+    async def async_stream(self):
+        loop = asyncio.get_event_loop()
+        messages = asyncio.Queue()
+        unsubscribe = get_broker().subscribe(
+            self.channel,
+            lambda message: loop.call_soon_threadsafe(messages.put_nowait, message),
+        )
+        try:
+            deadline = loop.time() + settings.LIVE_STREAM_SECONDS
+            while loop.time() < deadline:
+                try:
+                    message = await asyncio.wait_for(messages.get(), KEEPALIVE_SECONDS)
+                    yield format_event(message).encode()
+                except asyncio.TimeoutError:
+                    yield b': keepalive\n\n'
+        finally:
+            unsubscribe()
@@ -0,0 +1,223 @@
+import json
+import math
+import time
+import tracemalloc
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+
+from colleges.models import College, Comment
+from quad.instrumentation import RequestMetrics
+
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(values, p):
+    """
+    Nearest-rank percentile of the sorted list values.
+    """
+    return values[max(math.ceil(p / 100 * len(values)) - 1, 0)]
+
+
+def endpoints(college, thread, comment):
+    """
+    Every benchmarked request as (name, method, url, data), where data is a
+    function of the request's number so votes can alternate.
+    """
+    no_data = lambda n: None
+    like = lambda n: {'hasLiked': json.dumps(n % 2 == 0)}
+    return [
+        ('forum', 'get', reverse('forum', args=[college.slug]), no_data),
+        ('forum_new', 'get', reverse('forum', args=[college.slug]) + '?sort=new', no_data),
+        ('search', 'get', reverse('search_forum', args=[college.slug]) + '?q=housing', no_data),
+        ('thread', 'get', reverse('thread', args=[thread.slug]), no_data),
+        ('more_comments', 'get', reverse('more_comments', args=[thread.slug]), no_data),
+        ('comment_replies', 'get', reverse('comment_replies', args=[comment.pk]), no_data),
+        ('api_threads', 'get', reverse('api_forum_threads', args=[college.slug]), no_data),
+        ('api_tree', 'get', reverse('api_thread_tree', args=[thread.slug]), no_data),
+        ('like_thread', 'post', reverse('like_thread', args=[thread.slug]), like),
+        ('like_comment', 'post', reverse('like_comment', args=[comment.pk]), like),
+        ('vote_batch', 'post', reverse('vote_batch'), lambda n: {'votes': json.dumps([
+            {'target_type': 'thread', 'pk': thread.pk, 'hasLiked': n % 2 == 0},
+            {'target_type': 'comment', 'pk': comment.pk, 'hasLiked': n % 2 == 0},
+        ])}),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        'Requests the forum, thread, comment, search, API and vote endpoints '
+        'as one signed in user and reports the p50/p95/p99 latency, queries '
+        'and peak memory of each. Results can be saved as a baseline and '
+        'later runs compared against it. Fill the database first, e.g. with '
+        'generate_forum_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--college', help='Slug of the college, by default the one with most threads.')
+        parser.add_argument('--email', help='User to sign in as, by default one of the college.')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--requests', type=int, default=100, help='Timed requests per endpoint.')
+        parser.add_argument('--warmup', type=int, default=5, help='Untimed requests per endpoint first.')
+        parser.add_argument(
+            '--memory-requests',
+            type=int,
+            default=5,
+            help='Requests per endpoint traced for memory, apart from the timed ones.',
+        )
+        parser.add_argument('--only', nargs='+', metavar='ENDPOINT', help='Endpoints to run.')
+        parser.add_argument('--save', metavar='FILE', help='Write the results to FILE as a baseline.')
+        parser.add_argument('--compare', metavar='FILE', help='Compare against a saved baseline.')
+        parser.add_argument(
+            '--threshold',
+            type=float,
+            default=20,
+            help='Percent a latency or memory figure may grow over the baseline.',
+        )
+
+    def handle(self, *args, **options):
+        college, thread, comment = self.pick_targets(options['college'])
+        user = self.pick_user(college, options['email'])
+        client = Client(HTTP_HOST=options['host'])
+        client.force_login(user)
+
+        selected = endpoints(college, thread, comment)
+        if options['only']:
+            unknown = set(options['only']) - {name for name, *_ in selected}
+            if unknown:
+                raise CommandError('Unknown endpoints: ' + ', '.join(sorted(unknown)))
+            selected = [endpoint for endpoint in selected if endpoint[0] in options['only']]
+
+        self.stdout.write(
+            f'{college.short_name}, thread {thread.slug} ({thread.comments_count} comments), '
+            f'as {user.email}'
+        )
+        results = {}
+        for name, method, url, data in selected:
+            results[name] = self.run(
+                client, method, url, data,
+                options['warmup'], options['requests'], options['memory_requests'],
+            )
+        self.report(results)
+
+        if options['save']:
+            with open(options['save'], 'w') as baseline:
+                json.dump(results, baseline, indent=2, sort_keys=True)
+            self.stdout.write(f'Saved the results to {options["save"]}')
+        if options['compare']:
+            with open(options['compare']) as baseline:
+                regressions = self.compare(results, json.load(baseline), options['threshold'])
+            if regressions:
+                raise CommandError(f'{regressions} regressions against {options["compare"]}')
+
+    def pick_targets(self, college_slug):
+        colleges = College.objects.all()
+        if college_slug:
+            colleges = colleges.filter(slug=college_slug)
+        college = colleges.order_by('-threads_count', 'pk').first()
+        if college is None:
+            raise CommandError('No college to benchmark, run generate_forum_data first')
+        thread = college.threads.order_by('-comments_count', 'pk').first()
+        if thread is None:
+            raise CommandError(f'{college} has no threads')
+        comment = Comment.objects.filter(thread=thread).order_by('-replies_count', 'pk').first()
+        if comment is None:
+            raise CommandError(f'Thread {thread} has no comments')
+        return college, thread, comment
+
+    def pick_user(self, college, email):
+        users = get_user_model().objects.filter(college=college, is_active=True)
+        if email:
+            users = get_user_model().objects.filter(email=email)
+        user = users.order_by('pk').first()
+        if user is None:
+            raise CommandError('No user to sign in as')
+        return user
+
+    def run(self, client, method, url, data, warmup, requests, memory_requests):
+        request = getattr(client, method)
+        for n in range(warmup):
+            request(url, data(n))
+
+        latencies = []
+        queries = []
+        statuses = Counter()
+        for n in range(requests):
+            metrics = RequestMetrics()
+            with connection.execute_wrapper(metrics.record_query):
+                start = time.perf_counter()
+                response = request(url, data(n))
+                # Streamed bodies run their queries while they are read
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                latencies.append(1000 * (time.perf_counter() - start))
+            queries.append(metrics.queries)
+            statuses[response.status_code] += 1
+
+        # Tracing slows every allocation down, so memory is measured on
+        # requests of its own
+        peaks = []
+        tracemalloc.start()
+        try:
+            for n in range(memory_requests):
+                tracemalloc.clear_traces()
+                response = request(url, data(n))
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                peaks.append(tracemalloc.get_traced_memory()[1])
+        finally:
+            tracemalloc.stop()
+
+        latencies.sort()
+        result = {f'p{p}': percentile(latencies, p) for p in PERCENTILES}
+        result['queries'] = sum(queries) / len(queries) if queries else 0
+        result['memory_kib'] = max(peaks) / 1024 if peaks else 0
+        result['statuses'] = {str(status): count for status, count in statuses.items()}
+        return result
+
+    def report(self, results):
+        self.stdout.write(
+            f'{"endpoint":<16}{"p50 ms":>9}{"p95 ms":>9}{"p99 ms":>9}'
+            f'{"queries":>9}{"peak KiB":>10}  statuses'
+        )
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:<16}{result["p50"]:>9.1f}{result["p95"]:>9.1f}{result["p99"]:>9.1f}'
+                f'{result["queries"]:>9.1f}{result["memory_kib"]:>10.0f}  '
+                + ' '.join(f'{status}x{count}' for status, count in sorted(result['statuses'].items()))
+            )
+
+    def compare(self, results, baseline, threshold):
+        """
+        Prints how every figure changed against baseline and returns the
+        number of regressions: latency or memory growing by more than
+        threshold percent, or any extra query.
+        """
+        regressions = 0
+        for name, result in results.items():
+            if name not in baseline:
+                self.stdout.write(f'{name}: not in the baseline')
+                continue
+            changes = []
+            for key in ('p50', 'p95', 'p99', 'queries', 'memory_kib'):
+                before, after = baseline[name][key], result[key]
+                change = 100 * (after - before) / before if before else 0
+                if key == 'queries':
+                    regressed = after > before
+                else:
+                    regressed = change > threshold
+                regressions += regressed
+                changes.append(f'{key} {before:.1f} -> {after:.1f} ({change:+.0f}%)' + (
+                    ' REGRESSED' if regressed else ''
+                ))
+            line = f'{name}: ' + ', '.join(changes)
+            if any('REGRESSED' in change for change in changes):
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+        return regressions
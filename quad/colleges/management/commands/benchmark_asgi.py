@@ -0,0 +1,160 @@
+import asyncio
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+
+from quad.handlers import PooledASGIHandler
+
+
+class Command(BaseCommand):
+    help = (
+        'Serves a page to many concurrent slow clients through a threaded '
+        'WSGI server and through the pooled ASGI handler, and compares them. '
+        'Both get the same number of threads to run views on.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Page to request, e.g. /colleges/thread/<slug>.')
+        parser.add_argument('--email', help='User to sign in as.')
+        parser.add_argument('--host', default='localhost')
+        parser.add_argument('--requests', type=int, default=200)
+        parser.add_argument('--concurrency', type=int, default=50, help='Clients at once.')
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=settings.ASGI_READ_THREADS,
+            help='WSGI server threads. ASGI uses ASGI_READ_THREADS.',
+        )
+        parser.add_argument(
+            '--client-delay',
+            type=float,
+            default=0.05,
+            help='Seconds every client takes to read a response.',
+        )
+
+    def handle(self, *args, **options):
+        self.path, _, self.query = options['path'].partition('?')
+        self.host = options['host']
+        self.delay = options['client_delay']
+        self.cookie = self.session_cookie(options['email'])
+
+        clients = options['concurrency']
+        per_client = max(options['requests'] // clients, 1)
+
+        for name, run in (('WSGI', self.run_wsgi), ('ASGI', self.run_asgi)):
+            start = time.perf_counter()
+            results = run(clients, per_client, options['threads'])
+            self.report(name, results, time.perf_counter() - start)
+
+    def session_cookie(self, email):
+        if not email:
+            return ''
+        try:
+            user = get_user_model().objects.get(email=email)
+        except get_user_model().DoesNotExist:
+            raise CommandError(f'No user with email {email}')
+        client = Client()
+        client.force_login(user)
+        return '; '.join(f'{name}={morsel.value}' for name, morsel in client.cookies.items())
+
+    def run_wsgi(self, clients, per_client, threads):
+        handler = WSGIHandler()
+        # A threaded WSGI server holds one of its threads until the client
+        # has read the whole response
+        server_threads = threading.Semaphore(threads)
+
+        def request():
+            environ = {
+                'REQUEST_METHOD': 'GET',
+                'PATH_INFO': self.path,
+                'QUERY_STRING': self.query,
+                'SCRIPT_NAME': '',
+                'SERVER_NAME': self.host,
+                'SERVER_PORT': '80',
+                'SERVER_PROTOCOL': 'HTTP/1.1',
+                'HTTP_HOST': self.host,
+                'HTTP_COOKIE': self.cookie,
+                'wsgi.input': BytesIO(),
+                'wsgi.url_scheme': 'http',
+                'wsgi.errors': self.stderr,
+            }
+            status = []
+            start = time.perf_counter()
+            with server_threads:
+                body = handler(environ, lambda code, headers: status.append(code))
+                try:
+                    for _ in body:
+                        pass
+                    time.sleep(self.delay)
+                finally:
+                    body.close()
+            return time.perf_counter() - start, int(status[0].split()[0])
+
+        def client(_):
+            return [request() for _ in range(per_client)]
+
+        with ThreadPoolExecutor(max_workers=clients) as pool:
+            return [result for results in pool.map(client, range(clients)) for result in results]
+
+    def run_asgi(self, clients, per_client, threads):
+        handler = PooledASGIHandler()
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': self.path,
+            'query_string': self.query.encode(),
+            'headers': [
+                (b'host', self.host.encode()),
+                (b'cookie', self.cookie.encode()),
+            ],
+            'server': (self.host, 80),
+            'scheme': 'http',
+        }
+
+        async def request():
+            status = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                if message['type'] == 'http.response.start':
+                    status.append(message['status'])
+                elif not message.get('more_body'):
+                    await asyncio.sleep(self.delay)
+
+            start = time.perf_counter()
+            await handler(dict(scope), receive, send)
+            return time.perf_counter() - start, status[0]
+
+        async def client():
+            return [await request() for _ in range(per_client)]
+
+        async def run():
+            results = await asyncio.gather(*(client() for _ in range(clients)))
+            return [result for client_results in results for result in client_results]
+
+        try:
+            return asyncio.run(run())
+        finally:
+            handler.read_executor.shutdown()
+            handler.write_executor.shutdown()
+
+    def report(self, name, results, elapsed):
+        latencies = sorted(latency for latency, _ in results)
+        statuses = Counter(status for _, status in results)
+        self.stdout.write(
+            f'{name}: {len(results)} requests in {elapsed:.2f}s '
+            f'({len(results) / elapsed:.1f} req/s), '
+            f'mean {1000 * sum(latencies) / len(latencies):.1f}ms, '
+            f'max {1000 * latencies[-1]:.1f}ms, '
+            f'statuses {dict(statuses)}'
+        )
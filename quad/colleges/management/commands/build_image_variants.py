@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from colleges.images import IMAGE_FIELDS, build_variants
+from colleges.models import College
+
+
+class Command(BaseCommand):
+    help = (
+        'Builds the resized variants of every college logo and banner that '
+        "doesn't have up to date ones, e.g. images uploaded before variants "
+        'existed.'
+    )
+
+    def handle(self, *args, **options):
+        for college in College.objects.all():
+            for field in IMAGE_FIELDS:
+                build_variants(college, field)
+        self.stdout.write(self.style.SUCCESS('Built the college image variants'))
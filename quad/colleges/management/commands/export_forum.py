@@ -0,0 +1,35 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from colleges.models import College
+from colleges.transfer import export_college, open_dump, write_records
+
+
+class Command(BaseCommand):
+    help = (
+        "Streams a college's forum (threads, comment trees, votes and "
+        'anonymous names) out as JSON Lines, for import_forum.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('college_slug')
+        parser.add_argument(
+            '-o', '--output',
+            help='File to write, gzipped if it ends with .gz. Defaults to stdout.',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            college = College.objects.get(slug=options['college_slug'])
+        except College.DoesNotExist:
+            raise CommandError(f"No college with slug {options['college_slug']}")
+
+        if not options['output']:
+            write_records(export_college(college), sys.stdout)
+            return
+        with open_dump(options['output'], 'w') as out:
+            count = write_records(export_college(college), out)
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {count} records of {college} to {options['output']}"
+        ))
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from colleges.vote_buffer import get_vote_buffer
+
+
+class Command(BaseCommand):
+    help = (
+        'Replays the vote buffer logs of processes that are no longer '
+        'running and writes every buffered vote to the database, e.g. after '
+        'a crash.'
+    )
+
+    def handle(self, *args, **options):
+        flushed = get_vote_buffer().flush()
+        self.stdout.write(self.style.SUCCESS(
+            f'Flushed {flushed} buffered votes from {settings.VOTE_BUFFER_LOG}.*'
+        ))
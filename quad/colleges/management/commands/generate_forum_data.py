@@ -0,0 +1,263 @@
+import random
+import time
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils.text import slugify
+from django.utils.timezone import now
+
+from colleges.counters import rebuild_counters
+from colleges.models import (
+    College,
+    CollegeEmail,
+    Thread,
+    Comment,
+    AnonymousName,
+    ThreadVote,
+    CommentVote,
+    MAX_COMMENT_DEPTH,
+    path_segment,
+)
+from colleges.ranking import hot_rank
+from colleges.search import get_search_backend, thread_row, comment_row
+
+
+WORDS = (
+    'housing dorm class exam professor lab library dining hall roommate '
+    'parking campus club party study group internship career fair major '
+    'minor semester finals midterm lecture tuition scholarship gym game '
+    'advice question help anyone know best worst cheap late night coffee'
+).split()
+
+SHAPES = ('wide', 'deep', 'mixed')
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+class Command(BaseCommand):
+    help = (
+        'Fills the database with generated colleges, users, threads, comment '
+        'trees and votes for benchmarks. Rows are written with bulk inserts '
+        'and explicit pks, so millions of them load in minutes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--colleges', type=int, default=3)
+        parser.add_argument('--users', type=int, default=200, help='Users per college.')
+        parser.add_argument('--threads', type=int, default=200, help='Threads per college.')
+        parser.add_argument(
+            '--comments',
+            type=int,
+            default=30,
+            help='Average comments per thread, most threads get a few and some many.',
+        )
+        parser.add_argument(
+            '--shape',
+            choices=SHAPES,
+            default='mixed',
+            help='wide: only top-level comments, deep: reply chains as deep as '
+                 'allowed, mixed: replies to random earlier comments.',
+        )
+        parser.add_argument('--thread-votes', type=int, default=20, help='Average votes per thread.')
+        parser.add_argument('--comment-votes', type=int, default=3, help='Average votes per comment.')
+        parser.add_argument('--anonymous', type=float, default=0.2, help='Share of anonymous posts.')
+        parser.add_argument('--days', type=int, default=30, help='Posts are spread over this many days.')
+        parser.add_argument('--password', default='password', help='Password of every user.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per INSERT.')
+
+    def handle(self, *args, **options):
+        if options['users'] < 1:
+            raise CommandError('Every college needs at least one user')
+        self.options = options
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        self.password = make_password(options['password'])
+        self.now = now()
+        self.start = self.now - timedelta(days=options['days'])
+        self.search_backend = get_search_backend()
+
+        # Rows are written in this order, so each one's foreign keys are
+        # already in the database
+        self.models = [
+            College,
+            CollegeEmail,
+            get_user_model(),
+            Thread,
+            Comment,
+            AnonymousName,
+            ThreadVote,
+            CommentVote,
+        ]
+        self.next_pk = {
+            model: (model.objects.aggregate(last=Max('pk'))['last'] or 0) + 1
+            for model in self.models
+        }
+        self.pending = {model: [] for model in self.models}
+        self.pending_index = []
+        self.written = {model: 0 for model in self.models}
+
+        started = time.perf_counter()
+        for _ in range(options['colleges']):
+            with transaction.atomic():
+                college = self.generate_college()
+                self.flush()
+            self.stdout.write(
+                f'{college.short_name}: {self.written[Thread]} threads, '
+                f'{self.written[Comment]} comments so far '
+                f'({time.perf_counter() - started:.1f}s)'
+            )
+
+        # The database hands out pks after the explicit ones from now on
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), self.models):
+                cursor.execute(sql)
+        rebuild_counters()
+
+        self.stdout.write(self.style.SUCCESS(
+            'Generated ' + ', '.join(
+                f'{count} {model._meta.verbose_name_plural}'
+                for model, count in self.written.items()
+            ) + f' in {time.perf_counter() - started:.1f}s'
+        ))
+
+    def new_pk(self, model):
+        pk = self.next_pk[model]
+        self.next_pk[model] += 1
+        return pk
+
+    def add(self, obj):
+        obj.pk = self.new_pk(type(obj))
+        self.pending[type(obj)].append(obj)
+        return obj
+
+    def flush(self):
+        for model, objs in self.pending.items():
+            if objs:
+                # An explicit batch_size isn't capped to what the database
+                # takes in one statement, e.g. SQLite's 999 parameters
+                batch_size = min(self.batch_size, max(connection.ops.bulk_batch_size(
+                    model._meta.concrete_fields, objs
+                ), 1))
+                model.objects.bulk_create(objs, batch_size=batch_size)
+                self.written[model] += len(objs)
+                objs.clear()
+        if self.pending_index:
+            for start in range(0, len(self.pending_index), self.batch_size):
+                self.search_backend.upsert(self.pending_index[start:start + self.batch_size])
+            self.pending_index.clear()
+
+    def flush_if_full(self):
+        if any(len(objs) >= self.batch_size for objs in self.pending.values()):
+            self.flush()
+
+    def timestamp_after(self, start):
+        return start + (self.now - start) * self.rng.random()
+
+    def votes(self, VoteClass, field, post, voter_ids, average):
+        """
+        Adds a skewed number of votes on post, mostly likes for some posts
+        and mostly dislikes for others, and returns its score.
+        """
+        count = min(int(self.rng.expovariate(1 / average)) if average else 0, len(voter_ids))
+        like_ratio = self.rng.betavariate(4, 1.5)
+        score = 0
+        for voter_id in self.rng.sample(voter_ids, count):
+            is_like = self.rng.random() < like_ratio
+            score += 1 if is_like else -1
+            self.add(VoteClass(voter_id=voter_id, is_like=is_like, **{field: post.pk}))
+        return score
+
+    def generate_college(self):
+        number = self.next_pk[College]
+        college = self.add(College(
+            full_name=f'Generated College {number}',
+            short_name=f'GEN{number}',
+            slug=f'gen{number}',
+        ))
+        domain = f'gen{number}.edu'
+        self.add(CollegeEmail(college_id=college.pk, domain=domain))
+
+        user_ids = []
+        for _ in range(self.options['users']):
+            pk = self.next_pk[get_user_model()]
+            self.add(get_user_model()(
+                email=f'user{pk}@{domain}',
+                password=self.password,
+                college_id=college.pk,
+            ))
+            user_ids.append(pk)
+            self.flush_if_full()
+
+        for _ in range(self.options['threads']):
+            self.generate_thread(college, user_ids)
+            # Threads are only ever flushed whole, so their comments'
+            # reply counts are final when they are written
+            self.flush_if_full()
+        return college
+
+    def generate_thread(self, college, user_ids):
+        rng = self.rng
+        thread = self.add(Thread(
+            author_id=rng.choice(user_ids),
+            college_id=college.pk,
+            title=sentence(rng, 3, 10).capitalize(),
+            body=sentence(rng, 5, 60),
+            timestamp=self.timestamp_after(self.start),
+            is_anonymous=rng.random() < self.options['anonymous'],
+            hits=rng.randint(0, 1000),
+        ))
+        thread.slug = f'{slugify(thread.title)[:40]}-{thread.pk}'
+        thread.score = self.votes(
+            ThreadVote, 'thread_id', thread, user_ids, self.options['thread_votes']
+        )
+        posters = {thread.author_id}
+
+        average = self.options['comments']
+        comments = []
+        for _ in range(int(rng.expovariate(1 / average)) if average else 0):
+            parent = self.pick_parent(comments)
+            comment = self.add(Comment(
+                author_id=rng.choice(user_ids),
+                thread_id=thread.pk,
+                parent_id=parent.pk if parent else None,
+                body=sentence(rng, 3, 40),
+                timestamp=self.timestamp_after(parent.timestamp if parent else thread.timestamp),
+                is_anonymous=rng.random() < self.options['anonymous'],
+            ))
+            comment.path = (parent.path if parent else '') + path_segment(comment.pk)
+            comment.depth = parent.depth + 1 if parent else 0
+            comment.score = self.votes(
+                CommentVote, 'comment_id', comment, user_ids, self.options['comment_votes']
+            )
+            if parent:
+                parent.replies_count += 1
+            comments.append(comment)
+            posters.add(comment.author_id)
+            self.pending_index.append(comment_row(comment, college.pk))
+
+        thread.comments_count = len(comments)
+        thread.rank = hot_rank(thread.score, thread.comments_count, thread.timestamp)
+        self.pending_index.append(thread_row(thread))
+        for user_id in posters:
+            self.add(AnonymousName(user_id=user_id, thread_id=thread.pk))
+
+    def pick_parent(self, comments):
+        shape = self.options['shape']
+        if not comments or shape == 'wide':
+            return None
+        if shape == 'deep':
+            last = comments[-1]
+            return last if last.depth < MAX_COMMENT_DEPTH else None
+        if self.rng.random() < 0.3:
+            return None
+        # Recent comments get most of the replies
+        parent = comments[-1 - min(int(self.rng.expovariate(0.2)), len(comments) - 1)]
+        return parent if parent.depth < MAX_COMMENT_DEPTH else None
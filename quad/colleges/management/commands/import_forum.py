@@ -0,0 +1,52 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from colleges.counters import rebuild_counters
+from colleges.transfer import ForumImporter, TransferError, open_dump
+
+
+class Command(BaseCommand):
+    help = (
+        'Loads a college exported with export_forum as a new college, with '
+        'bulk inserts. Authors and voters are matched by email and created '
+        'if they are missing. Counters are rebuilt at the end.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('input', help="File to read, gzipped if it ends with .gz, or '-' for stdin.")
+        parser.add_argument('--batch-size', type=int, default=500, help='Rows per INSERT.')
+
+    def handle(self, *args, **options):
+        path = options['input']
+        try:
+            with transaction.atomic():
+                importer = ForumImporter(options['batch_size'])
+                if path == '-':
+                    self.load(importer, sys.stdin)
+                else:
+                    with open_dump(path, 'r') as lines:
+                        self.load(importer, lines)
+                importer.finish()
+                rebuild_counters()
+        except TransferError as error:
+            raise CommandError(error)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {importer.college}: ' + ', '.join(
+                f'{count} {model._meta.verbose_name_plural}'
+                for model, count in importer.written.items()
+            )
+        ))
+
+    def load(self, importer, lines):
+        for number, line in enumerate(lines, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                raise TransferError(f'Line {number} is not valid JSON')
+            importer.add(record)
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from colleges.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Recomputes the comment counts of threads, the thread and comment '
+        'counts of colleges and the post counts and karma of users.'
+    )
+
+    def handle(self, *args, **options):
+        fixed = rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Rebuilt counters, {fixed} threads had a wrong comment count'
+        ))
@@ -0,0 +1,58 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from colleges.models import Thread, Comment
+from colleges.search import (
+    DELETED_BODY,
+    get_search_backend,
+    thread_rowid,
+    comment_rowid,
+)
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the full-text search index of every thread and comment.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of posts written to the index at once.',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        backend = get_search_backend()
+
+        threads = Thread.objects.exclude(body=DELETED_BODY).values_list(
+            'pk', 'college_id', 'title', 'body'
+        )
+        comments = Comment.objects.exclude(body=DELETED_BODY).values_list(
+            'pk', 'thread__college_id', 'thread_id', 'body'
+        )
+        rows = (
+            (thread_rowid(pk), college_id, pk, None, title, body)
+            for pk, college_id, title, body in threads.iterator(chunk_size=batch_size)
+        )
+        comment_rows = (
+            (comment_rowid(pk), college_id, thread_id, pk, '', body)
+            for pk, college_id, thread_id, body in comments.iterator(chunk_size=batch_size)
+        )
+
+        indexed = 0
+        with transaction.atomic():
+            backend.clear()
+            for source in (rows, comment_rows):
+                batch = []
+                for row in source:
+                    batch.append(row)
+                    if len(batch) == batch_size:
+                        backend.upsert(batch)
+                        indexed += len(batch)
+                        batch = []
+                if batch:
+                    backend.upsert(batch)
+                    indexed += len(batch)
+
+        self.stdout.write(self.style.SUCCESS(f'Indexed {indexed} posts'))
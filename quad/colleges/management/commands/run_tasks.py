@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from colleges.taskqueue import claim_next, purge_finished, run_claimed
+
+
+# Seconds between purges of finished tasks
+PURGE_INTERVAL = 60 * 60
+
+
+class Command(BaseCommand):
+    help = (
+        'Runs background tasks from the database as they come due. Start '
+        'as many workers as needed, they never run the same task at once.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run every task that is due, then exit.',
+        )
+        parser.add_argument(
+            '--sleep',
+            type=float,
+            default=1,
+            help='Seconds to wait when no task is due.',
+        )
+
+    def handle(self, *args, **options):
+        succeeded = failed = 0
+        last_purge = 0
+        while True:
+            close_old_connections()
+            if time.monotonic() - last_purge > PURGE_INTERVAL:
+                purge_finished(settings.TASK_RETENTION_DAYS)
+                last_purge = time.monotonic()
+
+            task = claim_next()
+            if task is None:
+                if options['once']:
+                    break
+                time.sleep(options['sleep'])
+                continue
+
+            start = time.perf_counter()
+            if run_claimed(task):
+                succeeded += 1
+            else:
+                failed += 1
+            if options['verbosity'] >= 2:
+                self.stdout.write(
+                    f'{task.name} #{task.pk} attempt {task.attempts}: '
+                    f'{1000 * (time.perf_counter() - start):.1f}ms'
+                )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Ran {succeeded + failed} tasks, {failed} of them failed'
+        ))
@@ -0,0 +1,47 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Avg, Count, Max, Q
+
+from colleges.models import Task
+
+
+WAIT_SAMPLE_SIZE = 1000
+
+
+class Command(BaseCommand):
+    help = (
+        'Reports every background task by name: how many are pending, done '
+        'and failed, how long they ran and how long they waited for a worker.'
+    )
+
+    def handle(self, *args, **options):
+        stats = Task.objects.values('name').annotate(
+            pending=Count('pk', filter=Q(status=Task.PENDING)),
+            running=Count('pk', filter=Q(status=Task.RUNNING)),
+            done=Count('pk', filter=Q(status=Task.DONE)),
+            failed=Count('pk', filter=Q(status=Task.FAILED)),
+            retries=Count('pk', filter=Q(attempts__gt=1)),
+            avg_duration=Avg('duration', filter=Q(status=Task.DONE)),
+            max_duration=Max('duration', filter=Q(status=Task.DONE)),
+        ).order_by('name')
+
+        # How long tasks waited for a worker, from the latest ones that ran
+        # on their first attempt. SQLite can't average timestamps itself.
+        waits = {}
+        for name, created, started in Task.objects.filter(
+            status=Task.DONE, attempts=1
+        ).order_by('-pk').values_list('name', 'created', 'started')[:WAIT_SAMPLE_SIZE]:
+            waits.setdefault(name, []).append((started - created).total_seconds())
+
+        self.stdout.write(
+            f'{"task":<40}{"pending":>8}{"running":>8}{"done":>8}{"failed":>8}'
+            f'{"retried":>8}{"avg ms":>9}{"max ms":>9}{"avg wait s":>11}'
+        )
+        for row in stats:
+            name_waits = waits.get(row['name'], [])
+            wait = sum(name_waits) / len(name_waits) if name_waits else 0
+            self.stdout.write(
+                f'{row["name"]:<40}{row["pending"]:>8}{row["running"]:>8}{row["done"]:>8}'
+                f'{row["failed"]:>8}{row["retries"]:>8}'
+                f'{1000 * (row["avg_duration"] or 0):>9.1f}{1000 * (row["max_duration"] or 0):>9.1f}'
+                f'{wait:>11.2f}'
+            )
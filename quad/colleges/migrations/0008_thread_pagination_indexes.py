@@ -0,0 +1,21 @@
+# Generated by Django 3.0.1 on 2026-10-18 11:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0007_auto_20191231_2217'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['college', 'timestamp', 'id'], name='thread_college_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['college', 'score', 'id'], name='thread_college_top_idx'),
+        ),
+    ]
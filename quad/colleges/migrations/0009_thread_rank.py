@@ -0,0 +1,60 @@
+# Generated by Django 3.0.1 on 2026-10-18 11:35
+
+from datetime import datetime
+from math import log10
+
+from django.db import migrations, models
+from django.utils.timezone import utc
+
+
+# colleges.ranking.hot_rank as it was when this migration was written, so
+# later changes to the formula don't change what the migration does
+RANK_EPOCH = datetime(2019, 12, 1, tzinfo=utc)
+HOT_DECAY_SECONDS = 45000
+COMMENT_WEIGHT = 0.5
+BATCH_SIZE = 500
+
+
+def hot_rank(score, comments_count, timestamp):
+    points = score + COMMENT_WEIGHT * comments_count
+    order = log10(max(abs(points), 1))
+    sign = (points > 0) - (points < 0)
+    seconds = (timestamp - RANK_EPOCH).total_seconds()
+    return round(sign * order + seconds / HOT_DECAY_SECONDS, 7)
+
+
+def backfill_rank(apps, schema_editor):
+    Thread = apps.get_model('colleges', 'Thread')
+    threads = Thread.objects.only('score', 'comments_count', 'timestamp')
+    batch = []
+    for thread in threads.iterator(chunk_size=BATCH_SIZE):
+        thread.rank = hot_rank(thread.score, thread.comments_count, thread.timestamp)
+        batch.append(thread)
+        if len(batch) == BATCH_SIZE:
+            Thread.objects.bulk_update(batch, ['rank'])
+            batch = []
+    Thread.objects.bulk_update(batch, ['rank'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0008_thread_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='rank',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['college', 'rank', 'id'], name='thread_college_hot_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='thread',
+            index=models.Index(fields=['college', 'comments_count', 'id'], name='thread_college_discussed_idx'),
+        ),
+        migrations.RunPython(backfill_rank, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 3.0.1 on 2026-10-18 11:36
+
+from django.db import migrations, models
+from django.db.models import Count, Max
+
+
+# Keeps only the most recent vote of every (voter, target) pair so that the
+# unique constraints below can be created on existing data
+def remove_duplicate_votes(apps, schema_editor):
+    for model_name, fk_string in [('ThreadVote', 'thread'), ('CommentVote', 'comment')]:
+        VoteClass = apps.get_model('colleges', model_name)
+        duplicates = VoteClass.objects.values('voter', fk_string).annotate(
+            latest=Max('pk'),
+            votes=Count('pk'),
+        ).filter(votes__gt=1)
+        for duplicate in duplicates:
+            VoteClass.objects.filter(
+                voter=duplicate['voter'],
+                **{fk_string: duplicate[fk_string]}
+            ).exclude(pk=duplicate['latest']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0009_thread_rank'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_votes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='commentvote',
+            constraint=models.UniqueConstraint(fields=('voter', 'comment'), name='unique_comment_vote'),
+        ),
+        migrations.AddConstraint(
+            model_name='threadvote',
+            constraint=models.UniqueConstraint(fields=('voter', 'thread'), name='unique_thread_vote'),
+        ),
+    ]
@@ -0,0 +1,73 @@
+# Generated by Django 3.0.1 on 2026-10-18 11:42
+
+from django.db import migrations, models
+from django.utils.http import int_to_base36
+import django.db.models.deletion
+
+
+BATCH_SIZE = 500
+
+
+# One level of the tree at a time, roots first, so every comment's parent
+# already has its path. Each level is read in one query, with the parents'
+# paths joined in, and written in batched UPDATEs.
+def build_comment_paths(apps, schema_editor):
+    Comment = apps.get_model('colleges', 'Comment')
+    level = Comment.objects.filter(parent__isnull=True)
+    depth = 0
+    while True:
+        batch = [
+            Comment(pk=pk, path=(parent_path or '') + int_to_base36(pk).zfill(6), depth=depth)
+            for pk, parent_path in level.values_list('pk', 'parent__path')
+        ]
+        if not batch:
+            break
+        Comment.objects.bulk_update(batch, ['path', 'depth'], batch_size=BATCH_SIZE)
+        level = Comment.objects.filter(path='', parent__path__gt='')
+        depth += 1
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0010_unique_votes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.RunPython(build_comment_paths, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='comment',
+            name='level',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='lft',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='rght',
+        ),
+        migrations.RemoveField(
+            model_name='comment',
+            name='tree_id',
+        ),
+        migrations.AlterField(
+            model_name='comment',
+            name='parent',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, related_name='children', to='colleges.Comment'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['thread', 'path'], name='comment_thread_path_idx'),
+        ),
+    ]
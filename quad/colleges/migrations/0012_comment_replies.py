@@ -0,0 +1,37 @@
+# Generated by Django 3.0.1 on 2026-10-18 11:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_replies(apps, schema_editor):
+    Comment = apps.get_model('colleges', 'Comment')
+    replies = Comment.objects.filter(
+        parent=OuterRef('pk'),
+    ).order_by().values('parent').annotate(count=Count('pk')).values('count')
+    Comment.objects.update(replies_count=Coalesce(Subquery(replies), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0011_comment_materialized_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='replies_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_replies, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['thread', 'depth', 'score', 'id'], name='comment_thread_top_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='comment',
+            index=models.Index(fields=['parent', 'score', 'id'], name='comment_replies_top_idx'),
+        ),
+    ]
@@ -0,0 +1,54 @@
+from django.db import migrations
+
+
+# The search index as colleges.search first created it. Copied rather than
+# imported, so this migration runs the same whatever that module and the
+# models it imports become.
+SEARCH_TABLE = 'colleges_search'
+
+CREATE_INDEX = {
+    'sqlite': [
+        f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+        'college, title, body, '
+        'thread_id UNINDEXED, comment_id UNINDEXED, '
+        "tokenize = 'porter unicode61')",
+    ],
+    'postgresql': [
+        f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+        'rowid bigint PRIMARY KEY, '
+        'college_id integer NOT NULL, '
+        'thread_id integer NOT NULL, '
+        'comment_id integer NULL, '
+        'title text NOT NULL, '
+        'body text NOT NULL, '
+        'document tsvector NOT NULL)',
+        f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx '
+        f'ON {SEARCH_TABLE} USING GIN (document)',
+        f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_college_idx '
+        f'ON {SEARCH_TABLE} (college_id)',
+    ],
+}
+
+DROP_INDEX = f'DROP TABLE IF EXISTS {SEARCH_TABLE}'
+
+
+# Other databases have no index, they are searched by scanning the posts
+def create_search_index(apps, schema_editor):
+    for statement in CREATE_INDEX.get(schema_editor.connection.vendor, []):
+        schema_editor.execute(statement, params=None)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_INDEX:
+        schema_editor.execute(DROP_INDEX, params=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0012_comment_replies'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
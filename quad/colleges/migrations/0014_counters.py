@@ -0,0 +1,63 @@
+# Generated by Django 3.0.1 on 2026-10-18 11:53
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+DELETED_BODY = '[deleted]'
+
+
+def aggregate(queryset, field, value):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(
+            value=value,
+        ).values('value'),
+        output_field=IntegerField(),
+    ), 0)
+
+
+def count_posts(apps, schema_editor):
+    College = apps.get_model('colleges', 'College')
+    Thread = apps.get_model('colleges', 'Thread')
+    Comment = apps.get_model('colleges', 'Comment')
+    MyUser = apps.get_model('users', 'MyUser')
+
+    live_threads = Thread.objects.exclude(body=DELETED_BODY)
+    live_comments = Comment.objects.exclude(body=DELETED_BODY)
+    College.objects.update(
+        threads_count=aggregate(live_threads, 'college', Count('pk')),
+        comments_count=aggregate(live_comments, 'thread__college', Count('pk')),
+    )
+    MyUser.objects.update(
+        posts_count=(
+            aggregate(Thread.objects.all(), 'author', Count('pk')) +
+            aggregate(Comment.objects.all(), 'author', Count('pk'))
+        ),
+        karma=(
+            aggregate(Thread.objects.all(), 'author', Sum('score')) +
+            aggregate(Comment.objects.all(), 'author', Sum('score'))
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0013_search_index'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='college',
+            name='comments_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='college',
+            name='threads_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_posts, migrations.RunPython.noop),
+    ]
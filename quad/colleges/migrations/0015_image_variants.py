@@ -0,0 +1,32 @@
+# Generated by Django 3.0.1 on 2026-10-18 12:08
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0014_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollegeImageVariant',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(max_length=10)),
+                ('source', models.CharField(max_length=255)),
+                ('format', models.CharField(max_length=4)),
+                ('width', models.PositiveIntegerField()),
+                ('height', models.PositiveIntegerField()),
+                ('size', models.PositiveIntegerField()),
+                ('image', models.FileField(max_length=255, upload_to='images/variants/')),
+                ('college', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='image_variants', to='colleges.College')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='collegeimagevariant',
+            constraint=models.UniqueConstraint(fields=('college', 'field', 'format', 'width'), name='unique_college_image_variant'),
+        ),
+    ]
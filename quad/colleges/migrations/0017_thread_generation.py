@@ -0,0 +1,18 @@
+# Generated by Django 3.0.1 on 2026-10-18 12:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0016_tasks'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='thread',
+            name='generation',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
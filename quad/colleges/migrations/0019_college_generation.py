@@ -0,0 +1,18 @@
+# Generated by Django 3.0.1 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('colleges', '0018_college_images_generation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='college',
+            name='generation',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -1,12 +1,26 @@
 from django.contrib.auth import get_user_model
 from django.db import models
+from django.db.models import F
 from django.urls import reverse
 from django.utils.text import slugify
 from django.utils.timezone import now
+from django.utils.http import int_to_base36
 from django.utils.translation import gettext_lazy as _
-from mptt.models import MPTTModel, TreeForeignKey
 
-from .utils import unique_slugify
+from .ranking import hot_rank
+from .utils import save_with_unique_slug
+
+
+# Body of threads and comments deleted by their authors. Deleted posts are
+# left out of every counter.
+DELETED_BODY = '[deleted]'
+
+
+# Identifies what a thread post or comment card renders for everybody:
+# edits and deletes set edited_timestamp and votes change the score
+def post_version(post):
+    edited = post.edited_timestamp.timestamp() if post.edited_timestamp else 0
+    return f'{post.pk}.{edited}.{post.score}'
 
 
 class College(models.Model):
@@ -16,9 +30,27 @@ class College(models.Model):
     banner = models.ImageField(null=True, blank=True, upload_to='images/')
     slug = models.SlugField(unique=True)
 
+    # Denormalized from the college's threads, see colleges.counters
+    threads_count = models.IntegerField(default=0, editable=False)
+    comments_count = models.IntegerField(default=0, editable=False)
+    # Bumped by every post, edit and vote that changes the college's
+    # listings, see colleges.forum_cache
+    generation = models.PositiveIntegerField(default=0, editable=False)
+    # Bumped whenever the image variants change, see colleges.images
+    images_generation = models.PositiveIntegerField(default=0, editable=False)
+
+    # Only ever changed by UPDATEs, which saving an older copy of the
+    # college must not undo
+    UPDATED_FIELDS = ('threads_count', 'comments_count', 'generation', 'images_generation')
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.short_name)
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.UPDATED_FIELDS
+            ]
         super(College, self).save(*args, **kwargs)
 
     def __str__(self):
@@ -28,6 +60,31 @@ class College(models.Model):
         return reverse('forum', kwargs={'college_slug': self.slug})
 
 
+# A resized copy of a college's logo or banner, see colleges.images
+class CollegeImageVariant(models.Model):
+    college = models.ForeignKey(
+        College,
+        on_delete=models.CASCADE,
+        related_name='image_variants',
+    )
+    field = models.CharField(max_length=10)
+    # Name of the upload the variant was made from
+    source = models.CharField(max_length=255)
+    format = models.CharField(max_length=4)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    size = models.PositiveIntegerField()
+    image = models.FileField(max_length=255, upload_to='images/variants/')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['college', 'field', 'format', 'width'],
+                name='unique_college_image_variant',
+            ),
+        ]
+
+
 class CollegeEmail(models.Model):
     domain = models.URLField(max_length=31)
     college = models.ForeignKey(
@@ -59,11 +116,52 @@ class Thread(models.Model):
 
     hits = models.IntegerField(default=0)
     comments_count = models.IntegerField(default=0)
+    # Precomputed "hot" rank, see colleges.ranking
+    rank = models.FloatField(default=0)
+    # Bumped by every edit, comment and vote that changes the thread's
+    # page, which is all its ETag needs, see colleges.conditional
+    generation = models.PositiveIntegerField(default=0, editable=False)
     slug = models.SlugField(unique=True)
 
+    class Meta:
+        # Backs the keyset pagination in colleges.pagination
+        indexes = [
+            models.Index(
+                fields=['college', 'rank', 'id'],
+                name='thread_college_hot_idx',
+            ),
+            models.Index(
+                fields=['college', 'timestamp', 'id'],
+                name='thread_college_new_idx',
+            ),
+            models.Index(
+                fields=['college', 'score', 'id'],
+                name='thread_college_top_idx',
+            ),
+            models.Index(
+                fields=['college', 'comments_count', 'id'],
+                name='thread_college_discussed_idx',
+            ),
+        ]
+
     def save(self, *args, **kwargs):
-        self.slug = unique_slugify(Thread, self.slug, self.title)
-        super(Thread, self).save(*args, **kwargs)
+        # Saves of a few fields leave the counters and rank, kept current
+        # with F() updates, as they are in the database
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'rank' in update_fields:
+            self.rank = hot_rank(self.score, self.comments_count, self.timestamp)
+        if self._state.adding and not self.slug:
+            save_with_unique_slug(
+                self,
+                self.title,
+                lambda: super(Thread, self).save(*args, **kwargs),
+            )
+        else:
+            super(Thread, self).save(*args, **kwargs)
+
+    @property
+    def version(self):
+        return post_version(self)
 
     def __str__(self):
         return self.slug
@@ -72,7 +170,18 @@ class Thread(models.Model):
         return reverse('thread', kwargs={'thread_slug': self.slug})
 
 
-class Comment(MPTTModel):
+# Every comment stores the pks of its ancestors and itself as fixed-width
+# base 36 segments, so a thread's comments sorted by path come out in tree
+# order. Six characters fit every positive 32-bit pk.
+PATH_SEGMENT_LENGTH = 6
+MAX_COMMENT_DEPTH = 255 // PATH_SEGMENT_LENGTH - 1
+
+
+def path_segment(pk):
+    return int_to_base36(pk).zfill(PATH_SEGMENT_LENGTH)
+
+
+class Comment(models.Model):
     author = models.ForeignKey(
         get_user_model(),
         on_delete=models.SET_NULL,
@@ -92,17 +201,50 @@ class Comment(MPTTModel):
     edited_timestamp = models.DateTimeField(null=True)
     is_anonymous = models.BooleanField(default=False)
 
-    # mptt-django fields
-    parent = TreeForeignKey(
+    # Materialized path hierarchy, replies are sorted by score when read
+    parent = models.ForeignKey(
         'self',
         on_delete=models.CASCADE,
         related_name='children',
         null=True,
-        db_index=True,
     )
+    path = models.CharField(max_length=255, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    replies_count = models.IntegerField(default=0, editable=False)
 
-    class MPTTMeta:
-        order_insertion_by = ['-score']
+    class Meta:
+        indexes = [
+            models.Index(fields=['thread', 'path'], name='comment_thread_path_idx'),
+            # Back the pages of top-level comments and of replies
+            models.Index(
+                fields=['thread', 'depth', 'score', 'id'],
+                name='comment_thread_top_idx',
+            ),
+            models.Index(
+                fields=['parent', 'score', 'id'],
+                name='comment_replies_top_idx',
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super(Comment, self).save(*args, **kwargs)
+
+        # The path needs the pk, so it is written right after the insert.
+        # Neither write touches any other comment.
+        if adding:
+            parent_path = self.parent.path if self.parent else ''
+            self.path = parent_path + path_segment(self.pk)
+            self.depth = self.parent.depth + 1 if self.parent else 0
+            Comment.objects.filter(pk=self.pk).update(path=self.path, depth=self.depth)
+            if self.parent:
+                Comment.objects.filter(pk=self.parent.pk).update(
+                    replies_count=F('replies_count') + 1
+                )
+
+    @property
+    def version(self):
+        return post_version(self)
 
 
 class AnonymousName(models.Model):
@@ -135,6 +277,14 @@ class ThreadVote(Vote):
         related_name='thread_votes'
     )
 
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['voter', 'thread'],
+                name='unique_thread_vote',
+            ),
+        ]
+
 
 class CommentVote(Vote):
     comment = models.ForeignKey(
@@ -142,3 +292,57 @@ class CommentVote(Vote):
         on_delete=models.CASCADE,
         related_name='comment_votes'
     )
+
+    class Meta:
+        # The constraint's (voter, comment) index also serves the per-thread
+        # vote lookups in colleges.votes.get_thread_like_statuses
+        constraints = [
+            models.UniqueConstraint(
+                fields=['voter', 'comment'],
+                name='unique_comment_vote',
+            ),
+        ]
+
+
+# A side effect run outside the request that caused it, see colleges.taskqueue
+class Task(models.Model):
+    PENDING = 'pending'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (PENDING, 'Pending'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    name = models.CharField(max_length=127)
+    kwargs = models.TextField(default='{}')  # JSON
+    idempotency_key = models.CharField(max_length=127, null=True, blank=True)
+    status = models.CharField(max_length=7, choices=STATUSES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField()
+    run_after = models.DateTimeField(default=now)
+    created = models.DateTimeField(default=now, editable=False)
+    started = models.DateTimeField(null=True)
+    finished = models.DateTimeField(null=True)
+    # Seconds the last attempt ran
+    duration = models.FloatField(null=True)
+    last_error = models.TextField(blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_status_due_idx'),
+        ]
+        constraints = [
+            # Coalesces pending tasks, running ones may be enqueued again
+            models.UniqueConstraint(
+                fields=['idempotency_key'],
+                condition=models.Q(status='pending'),
+                name='unique_pending_task_key',
+            ),
+        ]
+
+    def __str__(self):
+        return f'{self.name} ({self.status})'
@@ -0,0 +1,48 @@
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import AnonymousName
+
+
+# A thread's anonymous names only change when somebody new posts in it,
+# which bumps the thread's generation in the same transaction. The map is
+# cached under the generation, so every process moves on to a new entry
+# without being told, and entries of old generations expire soon.
+ANON_NAMES_CACHE_TIMEOUT = 5 * 60
+
+
+def anon_names_key(thread_id, generation):
+    return f'anon-names:{thread_id}:{generation}'
+
+
+def get_anon_names(thread):
+    """
+    Returns a dict mapping the pks of the users who posted in thread to
+    their anonymous names.
+    """
+    def load():
+        anons = AnonymousName.objects.filter(thread=thread).values_list('user_id', 'id')
+        return {user_id: f'[anonymous {anon_id}]' for user_id, anon_id in anons}
+    key = anon_names_key(thread.pk, thread.generation)
+    return cache.get_or_set(key, load, ANON_NAMES_CACHE_TIMEOUT)
+
+
+# Posts only need their author's name, so it is read with them instead of
+# joining in the whole user row
+def with_author_name(queryset):
+    return queryset.annotate(author_name=F('author__email'))
+
+
+# Passing user=None gives the name everybody but the author sees. post has
+# to come from a queryset passed through with_author_name.
+def get_display_name(user, post, anon_names={}):
+    author_id = post.author_id
+
+    if author_id is None:
+        return '[deleted]'
+    elif user is not None and author_id == user.pk:
+        return '[me]'
+    elif post.is_anonymous:
+        return anon_names.get(author_id, '[anonymous]')
+
+    return post.author_name
@@ -0,0 +1,98 @@
+from django.core import signing
+from django.db.models import Q
+
+
+THREADS_PER_PAGE = 25
+
+# Maps every forum sort to the Thread field it is keyed on. Every listing is
+# ordered by (field, id) descending, which is covered by a composite index
+# on (college, field, id), so fetching a page never has to skip rows.
+SORT_FIELDS = {
+    'hot': 'rank',
+    'new': 'timestamp',
+    'top': 'score',
+    'discussed': 'comments_count',
+}
+DEFAULT_SORT = 'hot'
+
+CURSOR_SALT = 'colleges.pagination'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, items, sort, next_cursor=None, prev_cursor=None):
+        self.items = items
+        self.sort = sort
+        self.next_cursor = next_cursor
+        self.prev_cursor = prev_cursor
+
+    def __iter__(self):
+        return iter(self.items)
+
+    def __len__(self):
+        return len(self.items)
+
+
+def encode_cursor(obj, field):
+    value = getattr(obj, field)
+    # Timestamps go through str() so they survive the JSON round trip
+    if not isinstance(value, (int, float)):
+        value = str(value)
+    return signing.dumps([field, value, obj.pk], salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(model, field, cursor):
+    try:
+        cursor_field, value, pk = signing.loads(cursor, salt=CURSOR_SALT)
+        # A cursor only makes sense for the sort it was issued for
+        if cursor_field != field:
+            raise ValueError(cursor_field)
+        value = model._meta.get_field(field).to_python(value)
+        pk = int(pk)
+    except Exception:
+        raise InvalidCursor(cursor)
+    return value, pk
+
+
+def paginate(queryset, sort=DEFAULT_SORT, after=None, before=None,
+             per_page=THREADS_PER_PAGE):
+    """
+    Returns a single KeysetPage of queryset ordered by SORT_FIELDS[sort] and
+    then by id, both descending. `after` continues past the last row of the
+    previous page, `before` walks back from the first row of the next one.
+    """
+    if sort not in SORT_FIELDS:
+        sort = DEFAULT_SORT
+    field = SORT_FIELDS[sort]
+    model = queryset.model
+
+    if before:
+        value, pk = decode_cursor(model, field, before)
+        queryset = queryset.filter(
+            Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+        ).order_by(field, 'pk')
+    else:
+        if after:
+            value, pk = decode_cursor(model, field, after)
+            queryset = queryset.filter(
+                Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk})
+            )
+        queryset = queryset.order_by(f'-{field}', '-pk')
+
+    # Fetches one extra row to find out whether there is another page
+    items = list(queryset[:per_page + 1])
+    has_more = len(items) > per_page
+    items = items[:per_page]
+
+    if before:
+        items.reverse()
+        has_prev, has_next = has_more, True
+    else:
+        has_prev, has_next = bool(after), has_more
+
+    next_cursor = encode_cursor(items[-1], field) if items and has_next else None
+    prev_cursor = encode_cursor(items[0], field) if items and has_prev else None
+    return KeysetPage(items, sort, next_cursor, prev_cursor)
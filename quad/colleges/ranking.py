@@ -0,0 +1,43 @@
+from datetime import datetime, timedelta
+from math import log10
+
+from django.utils.timezone import now, utc
+
+
+# Anything posted before this counts as posted at this instant
+RANK_EPOCH = datetime(2019, 12, 1, tzinfo=utc)
+
+# Seconds of recency that are worth a tenfold increase in points. Because
+# every thread's rank only moves forward with its own timestamp, older
+# threads decay relative to newer ones without ever being recomputed.
+HOT_DECAY_SECONDS = 45000
+
+# How many points a single comment is worth towards a thread's hot rank
+COMMENT_WEIGHT = 0.5
+
+TOP_WINDOWS = {
+    'day': timedelta(days=1),
+    'week': timedelta(weeks=1),
+    'all': None,
+}
+DEFAULT_TOP_WINDOW = 'all'
+
+
+def hot_rank(score, comments_count, timestamp):
+    points = score + COMMENT_WEIGHT * comments_count
+    order = log10(max(abs(points), 1))
+    sign = (points > 0) - (points < 0)
+    seconds = (timestamp - RANK_EPOCH).total_seconds()
+    return round(sign * order + seconds / HOT_DECAY_SECONDS, 7)
+
+
+# Narrows a college's threads for the 'top' sort to the requested window.
+# The window is a plain timestamp filter on top of the (college, score, id)
+# index scan, so no rank has to be computed when the listing is read.
+def ranked_threads(college, sort, window=None):
+    threads = college.threads.all()
+    if sort == 'top':
+        delta = TOP_WINDOWS.get(window)
+        if delta:
+            threads = threads.filter(timestamp__gte=now() - delta)
+    return threads
@@ -0,0 +1,323 @@
+import re
+
+from django.db import connection as default_connection
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Thread, Comment, DELETED_BODY
+
+
+SEARCH_TABLE = 'colleges_search'
+RESULTS_PER_PAGE = 20
+
+# Matches are wrapped in these by the database and turned into <mark> tags
+# only after the text around them has been escaped
+MATCH_START = '\x02'
+MATCH_END = '\x03'
+
+
+class SQLiteSearchBackend:
+    """
+    FTS5 index. Every row's college is stored as a `c<pk>` token in its own
+    column so a search is scoped to a college inside the full-text match.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5('
+                'college, title, body, '
+                'thread_id UNINDEXED, comment_id UNINDEXED, '
+                "tokenize = 'porter unicode61')"
+            )
+
+    def drop_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+
+    def delete(self, rowids):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid = %s',
+                [(rowid,) for rowid in rowids],
+            )
+
+    def upsert(self, rows):
+        self.delete([row[0] for row in rows])
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} '
+                '(rowid, college, thread_id, comment_id, title, body) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                [
+                    (rowid, f'c{college_id}', thread_id, comment_id, title, body)
+                    for rowid, college_id, thread_id, comment_id, title, body in rows
+                ],
+            )
+
+    def search(self, college_id, query, limit, offset):
+        terms = ' '.join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+        if not terms:
+            return []
+        with self.connection.cursor() as cursor:
+            # Titles weigh ten times as much as bodies
+            cursor.execute(
+                f'SELECT thread_id, comment_id, '
+                f'highlight({SEARCH_TABLE}, 1, %s, %s), '
+                f"snippet({SEARCH_TABLE}, 2, %s, %s, '…', 24) "
+                f'FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s '
+                f'ORDER BY bm25({SEARCH_TABLE}, 0.0, 10.0, 1.0) LIMIT %s OFFSET %s',
+                [
+                    MATCH_START, MATCH_END, MATCH_START, MATCH_END,
+                    f'college : c{college_id} AND ({terms})',
+                    limit, offset,
+                ],
+            )
+            return cursor.fetchall()
+
+
+class PostgresSearchBackend:
+    """
+    Plain table with a weighted tsvector column behind a GIN index.
+    """
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} ('
+                'rowid bigint PRIMARY KEY, '
+                'college_id integer NOT NULL, '
+                'thread_id integer NOT NULL, '
+                'comment_id integer NULL, '
+                'title text NOT NULL, '
+                'body text NOT NULL, '
+                'document tsvector NOT NULL)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx '
+                f'ON {SEARCH_TABLE} USING GIN (document)'
+            )
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_college_idx '
+                f'ON {SEARCH_TABLE} (college_id)'
+            )
+
+    def drop_index(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'DROP TABLE IF EXISTS {SEARCH_TABLE}')
+
+    def clear(self):
+        with self.connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE {SEARCH_TABLE}')
+
+    def delete(self, rowids):
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {SEARCH_TABLE} WHERE rowid = ANY(%s)',
+                [list(rowids)],
+            )
+
+    def upsert(self, rows):
+        with self.connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {SEARCH_TABLE} '
+                '(rowid, college_id, thread_id, comment_id, title, body, document) '
+                'VALUES (%s, %s, %s, %s, %s, %s, '
+                "setweight(to_tsvector('english', %s), 'A') || "
+                "setweight(to_tsvector('english', %s), 'B')) "
+                'ON CONFLICT (rowid) DO UPDATE SET '
+                'title = EXCLUDED.title, body = EXCLUDED.body, '
+                'document = EXCLUDED.document',
+                [row + (row[4], row[5]) for row in rows],
+            )
+
+    def search(self, college_id, query, limit, offset):
+        options = f'StartSel={MATCH_START}, StopSel={MATCH_END}'
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT thread_id, comment_id, '
+                "ts_headline('english', title, query, %s), "
+                "ts_headline('english', body, query, %s) "
+                f"FROM {SEARCH_TABLE}, plainto_tsquery('english', %s) query "
+                'WHERE college_id = %s AND document @@ query '
+                'ORDER BY ts_rank(document, query) DESC LIMIT %s OFFSET %s',
+                [options, options + ', MaxWords=24', query, college_id, limit, offset],
+            )
+            return cursor.fetchall()
+
+
+class ScanSearchBackend:
+    """
+    Fallback for databases without a backend of their own. There is no
+    index: every search scans the college's posts with icontains for each
+    word and returns the newest matches first.
+    """
+
+    snippet_words = 24
+
+    def __init__(self, connection):
+        self.connection = connection
+
+    def create_index(self):
+        pass
+
+    def drop_index(self):
+        pass
+
+    def clear(self):
+        pass
+
+    def delete(self, rowids):
+        pass
+
+    def upsert(self, rows):
+        pass
+
+    def mark(self, text, terms):
+        pattern = re.compile('|'.join(re.escape(term) for term in terms), re.IGNORECASE)
+        return pattern.sub(lambda match: MATCH_START + match.group() + MATCH_END, text)
+
+    def snippet(self, text, terms):
+        words = text.split()
+        first = next((
+            number for number, word in enumerate(words)
+            if any(term in word.lower() for term in terms)
+        ), 0)
+        start = max(first - 4, 0)
+        end = start + self.snippet_words
+        return (
+            ('…' if start else '') +
+            self.mark(' '.join(words[start:end]), terms) +
+            ('…' if end < len(words) else '')
+        )
+
+    def search(self, college_id, query, limit, offset):
+        terms = [term.lower() for term in query.split()]
+        if not terms:
+            return []
+        thread_matches = Q()
+        comment_matches = Q()
+        for term in terms:
+            thread_matches &= Q(title__icontains=term) | Q(body__icontains=term)
+            comment_matches &= Q(body__icontains=term)
+
+        # Each side holds at most the rows up to the end of the page
+        end = offset + limit
+        threads = Thread.objects.filter(
+            thread_matches, college_id=college_id,
+        ).exclude(body=DELETED_BODY).order_by('-timestamp').values_list(
+            'timestamp', 'pk', 'title', 'body',
+        )[:end]
+        comments = Comment.objects.filter(
+            comment_matches, thread__college_id=college_id,
+        ).exclude(body=DELETED_BODY).order_by('-timestamp').values_list(
+            'timestamp', 'thread_id', 'pk', 'body',
+        )[:end]
+        rows = sorted(
+            [(created, pk, None, title, body) for created, pk, title, body in threads] +
+            [(created, thread_id, pk, '', body) for created, thread_id, pk, body in comments],
+            key=lambda row: row[0],
+            reverse=True,
+        )[offset:end]
+        return [
+            (thread_id, comment_id, self.mark(title, terms), self.snippet(body, terms))
+            for _, thread_id, comment_id, title, body in rows
+        ]
+
+
+SEARCH_BACKENDS = {
+    'sqlite': SQLiteSearchBackend,
+    'postgresql': PostgresSearchBackend,
+}
+
+
+def get_search_backend(connection=None):
+    connection = connection or default_connection
+    return SEARCH_BACKENDS.get(connection.vendor, ScanSearchBackend)(connection)
+
+
+# Threads and comments share one index, so their pks are interleaved into
+# distinct row ids
+def thread_rowid(pk):
+    return pk * 2
+
+
+def comment_rowid(pk):
+    return pk * 2 + 1
+
+
+def thread_row(thread):
+    return (thread_rowid(thread.pk), thread.college_id, thread.pk, None, thread.title, thread.body)
+
+
+def comment_row(comment, college_id):
+    return (comment_rowid(comment.pk), college_id, comment.thread_id, comment.pk, '', comment.body)
+
+
+def index_thread(thread):
+    backend = get_search_backend()
+    if thread.body == DELETED_BODY:
+        backend.delete([thread_rowid(thread.pk)])
+    else:
+        backend.upsert([thread_row(thread)])
+
+
+def index_comment(comment, college_id):
+    backend = get_search_backend()
+    if comment.body == DELETED_BODY:
+        backend.delete([comment_rowid(comment.pk)])
+    else:
+        backend.upsert([comment_row(comment, college_id)])
+
+
+def highlight(text):
+    text = escape(text or '')
+    return mark_safe(text.replace(MATCH_START, '<mark>').replace(MATCH_END, '</mark>'))
+
+
+class SearchResult:
+    def __init__(self, thread, comment_id, title, snippet):
+        self.thread = thread
+        self.comment_id = comment_id
+        self.title = title
+        self.snippet = snippet
+
+
+def search(college, query, page=1, per_page=RESULTS_PER_PAGE):
+    """
+    Returns the page'th page of posts in college matching query, best
+    matches first, and whether there is another page.
+    """
+    rows = get_search_backend().search(
+        college.pk,
+        query,
+        limit=per_page + 1,
+        offset=(page - 1) * per_page,
+    )
+    has_next = len(rows) > per_page
+    rows = rows[:per_page]
+
+    threads = Thread.objects.in_bulk({thread_id for thread_id, _, _, _ in rows})
+    results = []
+    for thread_id, comment_id, title, snippet in rows:
+        thread = threads.get(thread_id)
+        if thread is None:
+            continue
+        results.append(SearchResult(
+            thread,
+            comment_id,
+            highlight(title) if comment_id is None else escape(thread.title),
+            highlight(snippet),
+        ))
+    return results, has_next
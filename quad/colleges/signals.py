@@ -0,0 +1,19 @@
+from django.db import transaction
+from django.dispatch import Signal
+
+from .forum_cache import invalidate_colleges
+from .models import Thread
+
+
+# Sent after the scores, ranks or counters of threads changed without a
+# Thread.save(), with the pks of the colleges those threads belong to
+threads_changed = Signal(providing_args=['college_ids'])
+
+
+# Listeners only hear about changes once they are committed, the colleges'
+# generations change along with them
+def send_threads_changed(college_ids):
+    invalidate_colleges(college_ids)
+    transaction.on_commit(
+        lambda: threads_changed.send(sender=Thread, college_ids=college_ids)
+    )
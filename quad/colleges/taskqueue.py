@@ -0,0 +1,182 @@
+import json
+import logging
+import time
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+from django.utils.timezone import now
+
+from .models import Task
+
+
+logger = logging.getLogger(__name__)
+
+# A small task queue kept in the database. Side effects that don't have to
+# be part of a request's transaction are enqueued as Task rows in it, so
+# they are committed or rolled back along with the write that caused them,
+# and run_tasks workers pick them up once they are committed.
+#
+# Tasks must be safe to run more than once: a failed task is retried with
+# exponential backoff, and a task whose worker died is picked up again
+# after TASK_LEASE_SECONDS. Pending tasks with the same idempotency key are
+# coalesced into one.
+#
+# With TASKS_EAGER (on in DEBUG), tasks run in the process that enqueued
+# them as soon as its transaction commits, so only retries need a worker.
+
+registry = {}
+
+# Inserting a task whose pending twin was claimed meanwhile is retried this
+# many times
+MAX_ENQUEUE_ATTEMPTS = 3
+
+
+def task(key=None, max_attempts=None):
+    """
+    Registers a function as a task and gives it an enqueue(**kwargs)
+    method. key, if given, is called with the same kwargs and returns the
+    idempotency key. kwargs have to be JSON serializable.
+    """
+    def register(func):
+        name = f'{func.__module__}.{func.__name__}'
+        registry[name] = func
+
+        def enqueue_task(**kwargs):
+            return enqueue(
+                name,
+                kwargs,
+                idempotency_key=key(**kwargs) if key else None,
+                max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+            )
+        func.task_name = name
+        func.enqueue = enqueue_task
+        return func
+    return register
+
+
+def pending_task(idempotency_key):
+    return Task.objects.filter(idempotency_key=idempotency_key, status=Task.PENDING).first()
+
+
+def enqueue(name, kwargs, idempotency_key=None, max_attempts=None):
+    """
+    Adds a task to the current transaction, or returns the pending one with
+    the same idempotency key.
+    """
+    for attempt in range(MAX_ENQUEUE_ATTEMPTS):
+        new_task = Task(
+            name=name,
+            kwargs=json.dumps(kwargs),
+            idempotency_key=idempotency_key,
+            max_attempts=max_attempts or settings.TASK_MAX_ATTEMPTS,
+        )
+        try:
+            with transaction.atomic():
+                new_task.save()
+            break
+        except IntegrityError:
+            if idempotency_key is None or attempt == MAX_ENQUEUE_ATTEMPTS - 1:
+                raise
+            pending = pending_task(idempotency_key)
+            if pending is not None:
+                return pending
+            # A worker claimed the pending task in between, so it no longer
+            # stands in the way of a new one
+
+    if settings.TASKS_EAGER:
+        transaction.on_commit(lambda: run_claimed(claim(new_task.pk)))
+    return new_task
+
+
+def claimable():
+    """
+    Tasks that are due, and tasks whose worker seems to have died.
+    """
+    current = now()
+    return Task.objects.filter(
+        Q(status=Task.PENDING, run_after__lte=current) |
+        Q(status=Task.RUNNING, started__lt=current - timedelta(seconds=settings.TASK_LEASE_SECONDS))
+    )
+
+
+def claim(pk):
+    """
+    Marks the task as running if nobody else did first and returns it.
+    The conditional UPDATE is the lock, so workers need no row locking.
+    """
+    claimed = claimable().filter(pk=pk).update(
+        status=Task.RUNNING,
+        started=now(),
+        attempts=F('attempts') + 1,
+    )
+    if claimed:
+        return Task.objects.get(pk=pk)
+    return None
+
+
+def claim_next(batch_size=10):
+    for pk in claimable().order_by('run_after', 'pk').values_list('pk', flat=True)[:batch_size]:
+        claimed_task = claim(pk)
+        if claimed_task is not None:
+            return claimed_task
+    return None
+
+
+def run_claimed(claimed_task):
+    """
+    Runs a claimed task in a transaction of its own and records how it
+    went and how long it took. Returns whether it succeeded.
+    """
+    if claimed_task is None:
+        return False
+    func = registry.get(claimed_task.name)
+
+    start = time.perf_counter()
+    error = None
+    if func is None:
+        error = f'Unknown task {claimed_task.name}'
+    else:
+        try:
+            with transaction.atomic():
+                func(**json.loads(claimed_task.kwargs))
+        except Exception:
+            error = traceback.format_exc()
+            logger.exception('Task %s (%s) failed', claimed_task.pk, claimed_task.name)
+    duration = time.perf_counter() - start
+
+    rows = Task.objects.filter(pk=claimed_task.pk, status=Task.RUNNING)
+    if error is None:
+        rows.update(status=Task.DONE, finished=now(), duration=duration, last_error='')
+        return True
+
+    if func is None or claimed_task.attempts >= claimed_task.max_attempts:
+        rows.update(status=Task.FAILED, finished=now(), duration=duration, last_error=error)
+        return False
+
+    delay = settings.TASK_RETRY_DELAY * 2 ** (claimed_task.attempts - 1)
+    try:
+        with transaction.atomic():
+            rows.update(
+                status=Task.PENDING,
+                run_after=now() + timedelta(seconds=delay),
+                duration=duration,
+                last_error=error,
+            )
+    except IntegrityError:
+        # A newer pending task with the same key does the same work
+        rows.update(status=Task.DONE, finished=now(), duration=duration, last_error=error)
+    return False
+
+
+def purge_finished(days):
+    """
+    Deletes tasks that finished more than days ago and returns how many.
+    """
+    deleted, _ = Task.objects.filter(
+        status__in=[Task.DONE, Task.FAILED],
+        finished__lt=now() - timedelta(days=days),
+    ).delete()
+    return deleted
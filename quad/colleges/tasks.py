@@ -0,0 +1,20 @@
+from .models import Thread, Comment
+from .search import index_thread, index_comment
+from .taskqueue import task
+
+
+# Side effects of writing posts, run once the write is committed. Each
+# reads the current rows, so coalesced or retried runs come out the same.
+
+@task(key=lambda pk: f'index-thread:{pk}')
+def index_thread_task(pk):
+    thread = Thread.objects.filter(pk=pk).first()
+    if thread is not None:
+        index_thread(thread)
+
+
+@task(key=lambda pk: f'index-comment:{pk}')
+def index_comment_task(pk):
+    comment = Comment.objects.select_related('thread').filter(pk=pk).first()
+    if comment is not None:
+        index_comment(comment, comment.thread.college_id)
@@ -0,0 +1,16 @@
+from django import template
+
+from colleges.fragments import slot as make_slot, render_thread_post
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def slot(kind, key):
+    return make_slot(kind, key)
+
+
+@register.simple_tag(takes_context=True)
+def thread_post(context, thread):
+    return render_thread_post(thread, context['user'], context['names']['thread'])
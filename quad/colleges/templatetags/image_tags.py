@@ -0,0 +1,16 @@
+from django import template
+
+from colleges.images import get_image_variants
+
+
+register = template.Library()
+
+
+@register.simple_tag
+def image_variants(college):
+    return get_image_variants(college.pk, college.images_generation)
+
+
+@register.filter
+def srcset(variants):
+    return ', '.join(f'{url} {width}w' for url, width, height in variants)
@@ -0,0 +1,110 @@
+import os
+import re
+import tempfile
+from html import unescape
+from io import StringIO
+from unittest import mock
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase
+
+from users.models import MyUser
+
+from ..forum_cache import forum_cache
+from ..hits import HitCounter
+from ..models import College, Thread, Comment
+
+
+def clear_caches():
+    # Every test rolls the generations its caches are keyed on back, so the
+    # next one would find entries for the same keys holding other rows
+    forum_cache.clear()
+    cache.clear()
+
+
+class ForumTestCase(TestCase):
+    """
+    A college with two users, a thread by the first one and a comment on
+    it, and a signed in client for each user.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.college = College.objects.create(full_name='Test College', short_name='TC')
+        cls.author = MyUser.objects.create_user('author@test.edu', 'password', college=cls.college)
+        cls.voter = MyUser.objects.create_user('voter@test.edu', 'password', college=cls.college)
+        cls.thread = Thread.objects.create(
+            author=cls.author,
+            college=cls.college,
+            title='Housing question',
+            body='Which dorm is best?',
+        )
+        cls.comment = Comment.objects.create(author=cls.author, thread=cls.thread, body='Anyone?')
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.author)
+        self.voter_client = self.client_class()
+        self.voter_client.force_login(self.voter)
+
+
+
+class GeneratedForumTestCase(TestCase):
+    """
+    A small forum from generate_forum_data, the same every run.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        call_command(
+            'generate_forum_data',
+            colleges=1,
+            users=10,
+            threads=20,
+            comments=15,
+            seed=1,
+            stdout=StringIO(),
+        )
+        cls.college = College.objects.get()
+        cls.thread = cls.college.threads.order_by('-comments_count', 'pk').first()
+        cls.comment = Comment.objects.filter(
+            thread=cls.thread
+        ).order_by('-replies_count', 'pk').first()
+        cls.user = MyUser.objects.filter(college=cls.college).order_by('pk').first()
+
+    def setUp(self):
+        clear_caches()
+        self.client.force_login(self.user)
+
+
+
+def use_hit_counter(test):
+    """
+    Counts the thread views of test in a counter of its own, which logs to
+    a temporary directory and is flushed before the test database goes
+    away. Returns the counter.
+    """
+    log_dir = tempfile.TemporaryDirectory()
+    test.addCleanup(log_dir.cleanup)
+    counter = HitCounter(os.path.join(log_dir.name, 'hits.log'), flush_interval=3600)
+    patcher = mock.patch('colleges.hits.hit_counter', counter)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    test.addCleanup(lambda: counter.timer and counter.timer.cancel())
+    test.addCleanup(lambda: counter.log.close())
+    test.addCleanup(counter.flush)
+    return counter
+
+
+# Comment cards and "load more" links in rendered comment HTML
+COMMENT_ID_RE = re.compile(r'id="comment-(\d+)"')
+MORE_URL_RE = re.compile(r'data-url="([^"]+)"')
+
+
+def comment_pks(html):
+    return [int(pk) for pk in COMMENT_ID_RE.findall(html)]
+
+
+def more_urls(html):
+    return [unescape(url) for url in MORE_URL_RE.findall(html)]
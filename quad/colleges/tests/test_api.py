@@ -0,0 +1,192 @@
+import json
+
+from django.urls import reverse
+
+from users.models import MyUser
+
+from ..comment_tree import COMMENTS_PER_PAGE
+from ..models import College, Thread, Comment
+from ..pagination import THREADS_PER_PAGE
+from .base import ForumTestCase, GeneratedForumTestCase
+
+
+def streamed_json(response):
+    return json.loads(b''.join(response.streaming_content))
+
+
+class ForumThreadsAPITests(ForumTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        for number in range(THREADS_PER_PAGE + 5):
+            Thread.objects.create(
+                author=cls.voter,
+                college=cls.college,
+                title=f'Thread {number}',
+                body='Body',
+                score=number % 7,
+            )
+
+    def get_threads(self, **params):
+        response = self.client.get(
+            reverse('api_forum_threads', args=[self.college.slug]), params
+        )
+        self.assertEqual(response['Content-Type'], 'application/json')
+        return response, json.loads(response.content)
+
+    def test_cursors_page_through_every_thread(self):
+        for sort in ('hot', 'new', 'top', 'discussed'):
+            with self.subTest(sort=sort):
+                response, page = self.get_threads(sort=sort, fields='pk')
+                first = page['threads']
+                self.assertEqual(len(first), THREADS_PER_PAGE)
+                self.assertIsNone(page['prev'])
+
+                response, page = self.get_threads(sort=sort, fields='pk', after=page['next'])
+                self.assertIsNone(page['next'])
+                pks = [thread['pk'] for thread in first + page['threads']]
+                self.assertCountEqual(
+                    pks, Thread.objects.filter(college=self.college).values_list('pk', flat=True)
+                )
+
+                response, page = self.get_threads(sort=sort, fields='pk', before=page['prev'])
+                self.assertEqual(page['threads'], first)
+
+    def test_fields_selection(self):
+        response, page = self.get_threads(fields='slug,score')
+        for thread in page['threads']:
+            self.assertEqual(set(thread), {'slug', 'score'})
+
+        response, page = self.get_threads()
+        self.assertEqual(set(page['threads'][0]), {
+            'pk', 'slug', 'url', 'title', 'body', 'author', 'score',
+            'commentsCount', 'hits', 'timestamp', 'editedTimestamp',
+        })
+
+    def test_errors_are_json(self):
+        response, body = self.get_threads(fields='pk,password')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(body, {'error': 'Unknown fields: password'})
+
+        response, page = self.get_threads(sort='top')
+        tampered = page['next'][:-1] + ('x' if page['next'][-1] != 'x' else 'y')
+        response, body = self.get_threads(sort='top', after=tampered)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(body, {'error': 'Invalid page cursor'})
+
+        response = self.client.get(reverse('api_forum_threads', args=['no-such-college']))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(json.loads(response.content), {'error': 'Not found'})
+
+        self.client.logout()
+        response, body = self.get_threads()
+        self.assertEqual(response.status_code, 401)
+
+    def test_other_colleges_are_forbidden(self):
+        other = College.objects.create(full_name='Other College', short_name='OC')
+        outsider = MyUser.objects.create_user('outsider@other.edu', 'password', college=other)
+        self.client.force_login(outsider)
+        for response in (
+            self.client.get(reverse('api_forum_threads', args=[self.college.slug])),
+            self.client.get(reverse('api_thread', args=[self.thread.slug])),
+            self.client.get(reverse('api_comment_tree', args=[self.comment.pk])),
+        ):
+            self.assertEqual(response.status_code, 403)
+            self.assertEqual(
+                json.loads(response.content), {'error': 'You do not belong to this college'}
+            )
+
+
+class ThreadAPITests(GeneratedForumTestCase):
+
+    def test_missing_posts_are_json_404s(self):
+        for url in (
+            reverse('api_thread', args=['no-such-thread']),
+            reverse('api_thread_comments', args=['no-such-thread']),
+            reverse('api_thread_tree', args=['no-such-thread']),
+            reverse('api_comment_tree', args=[Comment.objects.count() + 1000]),
+        ):
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 404)
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(json.loads(response.content), {'error': 'Not found'})
+
+    def test_thread_detail(self):
+        response = self.client.get(
+            reverse('api_thread', args=[self.thread.slug]), {'fields': 'pk,commentsCount'}
+        )
+        self.assertEqual(json.loads(response.content), {'thread': {
+            'pk': self.thread.pk,
+            'commentsCount': self.thread.comments_count,
+        }})
+
+    def assertMatchesTree(self, nodes, parent):
+        self.assertEqual(
+            [node['pk'] for node in nodes],
+            list(Comment.objects.filter(
+                thread=self.thread, parent=parent
+            ).order_by('path').values_list('pk', flat=True)),
+        )
+        for node in nodes:
+            self.assertEqual(set(node), {'pk', 'depth', 'replies'})
+            self.assertMatchesTree(node['replies'], node['pk'])
+
+    def test_thread_tree_streams_every_comment(self):
+        response = self.client.get(
+            reverse('api_thread_tree', args=[self.thread.slug]), {'fields': 'pk,depth'}
+        )
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'application/json')
+        self.assertMatchesTree(streamed_json(response)['comments'], None)
+
+    def test_comment_tree_streams_the_subtree(self):
+        self.assertGreater(self.comment.replies_count, 0)
+        response = self.client.get(
+            reverse('api_comment_tree', args=[self.comment.pk]), {'fields': 'pk,depth'}
+        )
+        [root] = streamed_json(response)['comments']
+        self.assertEqual(root['pk'], self.comment.pk)
+        self.assertMatchesTree(root['replies'], self.comment.pk)
+
+    def test_empty_fields_still_nest_replies(self):
+        thread = Thread.objects.create(
+            author=self.user, college=self.college, title='Empty', body='Body'
+        )
+        parent = Comment.objects.create(author=self.user, thread=thread, body='Parent')
+        Comment.objects.create(author=self.user, thread=thread, parent=parent, body='Reply')
+        response = self.client.get(reverse('api_thread_tree', args=[thread.slug]), {'fields': ','})
+        self.assertEqual(streamed_json(response), {'comments': [{'replies': [{'replies': []}]}]})
+
+    def test_comment_pages_follow_cursors(self):
+        thread = Thread.objects.create(
+            author=self.user, college=self.college, title='Busy', body='Body'
+        )
+        for number in range(COMMENTS_PER_PAGE + 5):
+            Comment.objects.create(
+                author=self.user, thread=thread, body='Top', score=number % 4
+            )
+        parent = thread.comments.first()
+        Comment.objects.create(author=self.user, thread=thread, parent=parent, body='Reply')
+
+        url = reverse('api_thread_comments', args=[thread.slug])
+        page = json.loads(self.client.get(url, {'fields': 'pk,score'}).content)
+        self.assertEqual(len(page['comments']), COMMENTS_PER_PAGE)
+        comments = page['comments']
+        page = json.loads(self.client.get(
+            url, {'fields': 'pk,score', 'after': page['next']}
+        ).content)
+        self.assertIsNone(page['next'])
+        comments += page['comments']
+        scores = [(comment['score'], comment['pk']) for comment in comments]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+        self.assertCountEqual(
+            [comment['pk'] for comment in comments],
+            thread.comments.filter(depth=0).values_list('pk', flat=True),
+        )
+
+        page = json.loads(self.client.get(url, {'parent': parent.pk}).content)
+        self.assertEqual([comment['parent'] for comment in page['comments']], [parent.pk])
+        response = self.client.get(url, {'parent': 'first'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(json.loads(response.content), {'error': 'Invalid parent'})
@@ -0,0 +1,61 @@
+from collections import Counter
+
+from django.urls import reverse
+
+from ..models import Comment, MAX_COMMENT_DEPTH, path_segment
+from .base import ForumTestCase, GeneratedForumTestCase
+
+
+class CommentPathTests(ForumTestCase):
+
+    def test_replies_extend_the_parent_path(self):
+        reply = Comment.objects.create(
+            author=self.voter, thread=self.thread, parent=self.comment, body='Reply',
+        )
+        nested = Comment.objects.create(
+            author=self.author, thread=self.thread, parent=reply, body='Nested',
+        )
+        self.assertEqual(self.comment.path, path_segment(self.comment.pk))
+        self.assertEqual(reply.path, self.comment.path + path_segment(reply.pk))
+        self.assertEqual(nested.path, reply.path + path_segment(nested.pk))
+        self.assertEqual([self.comment.depth, reply.depth, nested.depth], [0, 1, 2])
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).replies_count, 1)
+        self.assertEqual(Comment.objects.get(pk=reply.pk).replies_count, 1)
+
+    def test_path_order_is_tree_order(self):
+        reply = Comment.objects.create(
+            author=self.voter, thread=self.thread, parent=self.comment, body='Reply',
+        )
+        second = Comment.objects.create(author=self.voter, thread=self.thread, body='Second')
+        nested = Comment.objects.create(
+            author=self.author, thread=self.thread, parent=reply, body='Nested',
+        )
+        self.assertEqual(
+            list(Comment.objects.filter(thread=self.thread).order_by('path')),
+            [self.comment, reply, nested, second],
+        )
+
+    def test_reply_view_stops_at_max_depth(self):
+        parent = self.comment
+        for _ in range(MAX_COMMENT_DEPTH):
+            parent = Comment.objects.create(
+                author=self.author, thread=self.thread, parent=parent, body='Deeper',
+            )
+        self.assertEqual(parent.depth, MAX_COMMENT_DEPTH)
+        self.client.post(reverse('reply_comment', args=[parent.pk]), {'body': 'Too deep'})
+        self.assertFalse(Comment.objects.filter(parent=parent).exists())
+
+
+
+class GeneratedPathTests(GeneratedForumTestCase):
+
+    def test_generated_paths_and_reply_counts(self):
+        comments = {comment.pk: comment for comment in Comment.objects.all()}
+        replies = Counter(comment.parent_id for comment in comments.values() if comment.parent_id)
+        for comment in comments.values():
+            parent = comments.get(comment.parent_id)
+            parent_path = parent.path if parent else ''
+            self.assertEqual(comment.path, parent_path + path_segment(comment.pk))
+            self.assertEqual(comment.depth, parent.depth + 1 if parent else 0)
+            self.assertEqual(comment.replies_count, replies[comment.pk])
+
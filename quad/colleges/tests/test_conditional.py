@@ -0,0 +1,67 @@
+import json
+
+from django.urls import reverse
+
+from ..models import Thread, ThreadVote
+from ..votes import update_like_status
+from .base import ForumTestCase, use_hit_counter
+
+
+class ThreadETagTests(ForumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        use_hit_counter(self)
+        self.url = reverse('thread', args=[self.thread.slug])
+
+    def assertChangesETag(self, change):
+        # The first page sets the CSRF cookie the ETag covers
+        self.client.get(self.url)
+        etag = self.client.get(self.url)['ETag']
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_votes_change_the_etag(self):
+        self.assertChangesETag(lambda: self.voter_client.post(
+            reverse('like_thread', args=[self.thread.slug]), {'hasLiked': 'true'}
+        ))
+        self.assertChangesETag(lambda: self.voter_client.post(
+            reverse('like_comment', args=[self.comment.pk]), {'hasLiked': 'true'}
+        ))
+        self.assertChangesETag(lambda: self.voter_client.post(reverse('vote_batch'), {
+            'votes': json.dumps([{'target_type': 'comment', 'pk': self.comment.pk, 'hasLiked': True}]),
+        }))
+
+    def test_posts_and_edits_change_the_etag(self):
+        self.assertChangesETag(lambda: self.voter_client.post(
+            reverse('new_comment', args=[self.thread.slug]), {'body': 'New'}
+        ))
+        # Followed, so the page shows the alert and it doesn't hold back the
+        # ETag of the pages after
+        self.assertChangesETag(lambda: self.client.post(
+            reverse('edit_comment', args=[self.comment.pk]), {'body': 'Edited'}, follow=True,
+        ))
+        self.assertChangesETag(lambda: self.client.post(
+            reverse('edit_thread', args=[self.thread.slug]),
+            {'title': 'Edited', 'body': 'Edited'},
+            follow=True,
+        ))
+
+
+
+class ForumGenerationTests(ForumTestCase):
+
+    def test_votes_reach_cached_listings_and_etags(self):
+        url = reverse('forum', args=[self.college.slug])
+        # The first page sets the CSRF cookie the ETag covers
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertEqual([thread.score for thread in response.context['page']], [0])
+
+        # Votes only have to reach the database, like those of another
+        # process would
+        update_like_status(self.voter, ThreadVote, Thread.objects.get(pk=self.thread.pk), True)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([thread.score for thread in response.context['page']], [1])
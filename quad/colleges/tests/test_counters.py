@@ -0,0 +1,120 @@
+from unittest import mock
+
+from django.db.models import F
+from django.urls import reverse
+from django.utils import timezone
+
+from users.models import MyUser
+
+from ..counters import rebuild_counters, shift_comments_count
+from ..models import College, Thread, Comment, ThreadVote, CommentVote, DELETED_BODY
+from ..ranking import hot_rank
+from ..votes import update_like_status
+from .base import ForumTestCase, GeneratedForumTestCase
+
+
+class EditWhileVotingTests(ForumTestCase):
+    """
+    Votes cast between an edit or delete reading its post and saving it
+    must not be written over.
+    """
+
+    def vote_then_now(self, VoteClass, model, pk):
+        real_now = timezone.now
+
+        # The views call now() after reading the post and before saving it
+        def side_effect():
+            update_like_status(self.voter, VoteClass, model.objects.get(pk=pk), True)
+            return real_now()
+        return mock.patch('colleges.views.now', side_effect=side_effect)
+
+    def test_edit_thread_keeps_votes(self):
+        with self.vote_then_now(ThreadVote, Thread, self.thread.pk):
+            self.client.post(
+                reverse('edit_thread', args=[self.thread.slug]),
+                {'title': 'New title', 'body': 'New body'},
+            )
+        thread = Thread.objects.get(pk=self.thread.pk)
+        self.assertEqual(thread.title, 'New title')
+        self.assertEqual(thread.score, 1)
+        self.assertEqual(thread.rank, hot_rank(1, thread.comments_count, thread.timestamp))
+
+    def test_delete_thread_keeps_votes(self):
+        with self.vote_then_now(ThreadVote, Thread, self.thread.pk):
+            self.client.post(reverse('delete_thread', args=[self.thread.slug]))
+        thread = Thread.objects.get(pk=self.thread.pk)
+        self.assertEqual(thread.body, DELETED_BODY)
+        self.assertEqual(thread.score, 1)
+        # The vote's karma went to the author and is taken off again
+        self.assertEqual(MyUser.objects.get(pk=self.author.pk).karma, 0)
+
+    def test_edit_comment_keeps_votes(self):
+        with self.vote_then_now(CommentVote, Comment, self.comment.pk):
+            self.client.post(reverse('edit_comment', args=[self.comment.pk]), {'body': 'Edited'})
+        comment = Comment.objects.get(pk=self.comment.pk)
+        self.assertEqual(comment.body, 'Edited')
+        self.assertEqual(comment.score, 1)
+
+    def test_delete_comment_keeps_votes(self):
+        with self.vote_then_now(CommentVote, Comment, self.comment.pk):
+            self.client.post(reverse('delete_comment', args=[self.comment.pk]))
+        comment = Comment.objects.get(pk=self.comment.pk)
+        self.assertEqual(comment.body, DELETED_BODY)
+        self.assertEqual(comment.score, 1)
+        self.assertEqual(MyUser.objects.get(pk=self.author.pk).karma, 0)
+
+
+
+class CounterTests(GeneratedForumTestCase):
+
+    def counters(self):
+        return (
+            list(Thread.objects.order_by('pk').values_list('comments_count', 'rank')),
+            list(College.objects.order_by('pk').values_list('threads_count', 'comments_count')),
+            list(MyUser.objects.order_by('pk').values_list('posts_count', 'karma')),
+        )
+
+    def test_posting_shifts_counters(self):
+        college = College.objects.get(pk=self.college.pk)
+        user = MyUser.objects.get(pk=self.user.pk)
+        thread = Thread.objects.get(pk=self.thread.pk)
+
+        self.client.post(reverse('new_comment', args=[thread.slug]), {'body': 'Counted'})
+        comment = Comment.objects.latest('pk')
+        self.client.post(reverse('delete_comment', args=[comment.pk]))
+        self.client.post(reverse('new_thread', args=[college.slug]), {'title': 'Counted', 'body': 'Too'})
+
+        self.assertEqual(
+            Thread.objects.get(pk=thread.pk).comments_count, thread.comments_count
+        )
+        updated = College.objects.get(pk=college.pk)
+        self.assertEqual(updated.threads_count, college.threads_count + 1)
+        self.assertEqual(updated.comments_count, college.comments_count)
+        # The deleted comment has no author any more
+        self.assertEqual(MyUser.objects.get(pk=user.pk).posts_count, user.posts_count + 1)
+
+        # The shifted counters are what a rebuild computes
+        before = self.counters()
+        self.assertEqual(rebuild_counters(), 0)
+        self.assertEqual(self.counters(), before)
+
+    def test_concurrent_shifts_add_up(self):
+        thread = Thread.objects.get(pk=self.thread.pk)
+        # Two requests that read the thread before either wrote
+        stale = Thread.objects.get(pk=thread.pk)
+        shift_comments_count(thread, 1)
+        shift_comments_count(stale, 1)
+        self.assertEqual(
+            Thread.objects.get(pk=thread.pk).comments_count, thread.comments_count + 1
+        )
+        self.assertEqual(stale.comments_count, thread.comments_count + 1)
+
+    def test_rebuild_counters_repairs_drift(self):
+        before = self.counters()
+        Thread.objects.filter(pk=self.thread.pk).update(comments_count=F('comments_count') + 5)
+        College.objects.update(threads_count=0, comments_count=0)
+        MyUser.objects.update(posts_count=0, karma=0)
+
+        self.assertEqual(rebuild_counters(), 1)
+        self.assertEqual(self.counters(), before)
+
@@ -0,0 +1,76 @@
+from unittest import mock
+
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from ..fragments import render_fragments
+from ..models import Comment
+from .base import ForumTestCase, use_hit_counter, comment_pks
+
+
+class FragmentCacheTests(ForumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        use_hit_counter(self)
+        self.url = reverse('thread', args=[self.thread.slug])
+
+    def test_unchanged_posts_are_rendered_once(self):
+        with mock.patch(
+            'colleges.fragments.render_to_string', wraps=render_to_string
+        ) as render:
+            for _ in range(2):
+                html = render_fragments(
+                    'comment', 'forum/comment_card.html', [Comment.objects.get(pk=self.comment.pk)]
+                )
+            self.assertEqual(render.call_count, 1)
+            self.assertIn('Anyone?', html[self.comment.pk])
+
+            Comment.objects.filter(pk=self.comment.pk).update(score=3)
+            render_fragments(
+                'comment', 'forum/comment_card.html', [Comment.objects.get(pk=self.comment.pk)]
+            )
+            self.assertEqual(render.call_count, 2)
+
+    def test_edits_replace_cached_posts(self):
+        self.assertContains(self.client.get(self.url), 'Which dorm is best?')
+        self.client.post(
+            reverse('edit_thread', args=[self.thread.slug]),
+            {'title': 'Housing question', 'body': 'Which dining hall is best?'},
+            follow=True,
+        )
+        self.client.post(
+            reverse('edit_comment', args=[self.comment.pk]),
+            {'body': 'Still wondering'},
+            follow=True,
+        )
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Which dining hall is best?')
+        self.assertNotContains(response, 'Which dorm is best?')
+        self.assertContains(response, 'Still wondering')
+        self.assertNotContains(response, 'Anyone?')
+
+    def test_votes_replace_cached_scores(self):
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Score: 0')
+        self.assertContains(response, '0 points')
+        self.voter_client.post(reverse('like_thread', args=[self.thread.slug]), {'hasLiked': 'true'})
+        self.voter_client.post(reverse('like_comment', args=[self.comment.pk]), {'hasLiked': 'false'})
+        response = self.client.get(self.url)
+        self.assertContains(response, 'Score: 1')
+        self.assertContains(response, '-1 points')
+
+    def test_new_replies_reach_cached_subtrees(self):
+        self.client.get(self.url)
+        reply = Comment.objects.create(
+            author=self.voter, thread=self.thread, parent=self.comment, body='Try the east dorm'
+        )
+        html = self.client.get(self.url).content.decode()
+        self.assertEqual(comment_pks(html), [self.comment.pk, reply.pk])
+        self.assertIn('Try the east dorm', html)
+
+    def test_owner_links_are_per_viewer(self):
+        edit_url = reverse('edit_comment', args=[self.comment.pk])
+        self.assertContains(self.client.get(self.url), edit_url)
+        # Same cached card, filled in for somebody else
+        self.assertNotContains(self.voter_client.get(self.url), edit_url)
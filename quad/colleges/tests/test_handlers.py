@@ -0,0 +1,81 @@
+import asyncio
+import threading
+from unittest import mock
+
+from django.http import StreamingHttpResponse
+from django.test import SimpleTestCase, override_settings
+
+from quad.handlers import PooledASGIHandler
+
+from ..live import live_updates
+
+
+class RecordingResponse(StreamingHttpResponse):
+
+    def __init__(self, parts, threads):
+        self.threads = threads
+
+        def body():
+            for part in parts:
+                threads.append(threading.get_ident())
+                yield part
+        super().__init__(body())
+
+    def close(self):
+        self.threads.append(threading.get_ident())
+        super().close()
+
+
+@override_settings(ASGI_READ_THREADS=4)
+class PooledStreamTests(SimpleTestCase):
+
+    def setUp(self):
+        self.handler = PooledASGIHandler()
+        self.addCleanup(self.handler.read_executor.shutdown)
+        self.addCleanup(self.handler.write_executor.shutdown)
+        self.threads = []
+        self.sent = []
+
+    def serve(self, parts, send=None):
+        def view(request):
+            self.assertTrue(live_updates(request))
+            self.threads.append(threading.get_ident())
+            return RecordingResponse(parts, self.threads)
+
+        async def receive():
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def record(message):
+            self.sent.append(message)
+
+        scope = {
+            'type': 'http',
+            'method': 'GET',
+            'path': '/',
+            'query_string': b'',
+            'headers': [],
+            'server': ('testserver', 80),
+        }
+        with mock.patch.object(self.handler, 'get_response', side_effect=view):
+            asyncio.run(self.handler(scope, receive, send or record))
+
+    def test_body_is_produced_on_the_view_thread(self):
+        parts = [b'part %d' % number for number in range(50)]
+        self.serve(parts)
+        body = b''.join(message.get('body', b'') for message in self.sent[1:])
+        self.assertEqual(body, b''.join(parts))
+        self.assertFalse(self.sent[-1].get('more_body'))
+        # The view, every part and close()
+        self.assertEqual(len(self.threads), len(parts) + 2)
+        self.assertEqual(len(set(self.threads)), 1)
+
+    def test_gone_client_stops_the_body(self):
+        async def send(message):
+            if message['type'] == 'http.response.body':
+                raise OSError('client went away')
+
+        with self.assertRaises(OSError):
+            self.serve([b'part'] * 100, send)
+        # Stopped well before the end, and closed on the view thread
+        self.assertLess(len(self.threads), 50)
+        self.assertEqual(len(set(self.threads)), 1)
@@ -0,0 +1,49 @@
+import os
+
+from django.test import override_settings
+from django.urls import reverse
+
+from ..hits import HitCounter
+from ..models import Thread
+from .base import ForumTestCase, use_hit_counter
+
+
+class HitCounterTests(ForumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.counter = use_hit_counter(self)
+
+    def hits(self):
+        return Thread.objects.get(pk=self.thread.pk).hits
+
+    @override_settings(HIT_COUNTER_DEDUP_SECONDS=None)
+    def test_unchanged_pages_count(self):
+        url = reverse('thread', args=[self.thread.slug])
+        # The first page sets the CSRF cookie the ETag covers
+        self.client.get(url)
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.assertEqual(self.counter.flush(), 3)
+        self.assertEqual(self.hits(), 3)
+
+    def test_repeated_views_count_once(self):
+        url = reverse('thread', args=[self.thread.slug])
+        self.client.get(url)
+        self.client.get(url)
+        self.assertEqual(self.counter.flush(), 1)
+
+    def test_views_of_killed_processes_are_replayed(self):
+        self.counter.record(self.thread.slug)
+        self.counter.record(self.thread.slug)
+        # A counter on the same log stands in for the next process, as if
+        # this one had been killed before flushing
+        replayed = HitCounter(self.counter.base_log_path, flush_interval=3600)
+        self.addCleanup(lambda: replayed.timer and replayed.timer.cancel())
+        self.addCleanup(lambda: replayed.log.close())
+        self.assertEqual(replayed.flush(), 2)
+        self.assertEqual(self.hits(), 2)
+        # Flushed views leave the log
+        with open(replayed.log_path) as log:
+            self.assertEqual(log.read(), '')
+        self.assertTrue(os.path.exists(replayed.log_path))
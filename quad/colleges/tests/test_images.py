@@ -0,0 +1,64 @@
+import tempfile
+from io import BytesIO
+from unittest import mock
+
+from django.core.files.base import ContentFile
+from django.test import TestCase, override_settings
+from PIL import Image
+
+from ..images import build_college_images, get_image_variants
+from ..models import College, CollegeImageVariant
+
+
+class CollegeImageTests(TestCase):
+
+    def setUp(self):
+        media_root = tempfile.TemporaryDirectory()
+        self.addCleanup(media_root.cleanup)
+        media = override_settings(MEDIA_ROOT=media_root.name)
+        media.enable()
+        self.addCleanup(media.disable)
+        self.college = College.objects.create(full_name='Test College', short_name='TC')
+
+    def upload(self, data):
+        self.college.logo.save('logo.png', ContentFile(data))
+
+    def test_variants_are_built(self):
+        output = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(output, 'PNG')
+        self.upload(output.getvalue())
+        build_college_images(college_id=self.college.pk)
+        variants = CollegeImageVariant.objects.filter(college=self.college, field='logo')
+        self.assertTrue(variants.exists())
+        self.assertTrue(all(variant.width <= 400 for variant in variants))
+
+    def test_built_variants_get_a_new_generation(self):
+        before = College.objects.get(pk=self.college.pk)
+        self.assertEqual(get_image_variants(before.pk, before.images_generation), {})
+        output = BytesIO()
+        Image.new('RGB', (400, 200), 'red').save(output, 'PNG')
+        self.upload(output.getvalue())
+        build_college_images(college_id=self.college.pk)
+
+        after = College.objects.get(pk=self.college.pk)
+        self.assertNotEqual(after.images_generation, before.images_generation)
+        self.assertIn('logo', get_image_variants(after.pk, after.images_generation))
+        # Saving a copy read before the build doesn't take it back
+        before.full_name = 'Renamed College'
+        before.save()
+        self.assertEqual(
+            College.objects.get(pk=self.college.pk).images_generation, after.images_generation
+        )
+
+    def test_unreadable_image_is_skipped(self):
+        self.upload(b'not an image')
+        with self.assertLogs('colleges.images', 'ERROR'):
+            build_college_images(college_id=self.college.pk)
+        self.assertFalse(CollegeImageVariant.objects.filter(college=self.college).exists())
+
+    def test_storage_errors_fail_the_task(self):
+        self.upload(b'not an image')
+        with mock.patch('django.db.models.fields.files.FieldFile.open', side_effect=OSError):
+            with self.assertRaises(OSError):
+                build_college_images(college_id=self.college.pk)
+
@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.test import override_settings
+from django.urls import reverse
+
+from quad.instrumentation import QueryBudgetExceeded
+
+from .base import GeneratedForumTestCase, use_hit_counter
+
+
+@override_settings(QUERY_BUDGETS_STRICT=True)
+class QueryBudgetTests(GeneratedForumTestCase):
+    """
+    Strict budgets make a request over its budget raise, so every budgeted
+    view only has to be requested.
+    """
+
+    def setUp(self):
+        super().setUp()
+        # Views counted by thread requests are written before the test
+        # database goes away
+        use_hit_counter(self)
+
+    def test_budgeted_views(self):
+        requests = [
+            ('forum', 'get', reverse('forum', args=[self.college.slug]), None),
+            ('thread', 'get', reverse('thread', args=[self.thread.slug]), None),
+            ('more_comments', 'get', reverse('more_comments', args=[self.thread.slug]), None),
+            ('comment_replies', 'get', reverse('comment_replies', args=[self.comment.pk]), None),
+            ('like_thread', 'post', reverse('like_thread', args=[self.thread.slug]), {'hasLiked': 'true'}),
+            ('like_comment', 'post', reverse('like_comment', args=[self.comment.pk]), {'hasLiked': 'true'}),
+        ]
+        self.assertEqual({name for name, *_ in requests}, set(settings.QUERY_BUDGETS))
+        # Twice, so both the cold and the cached paths are checked
+        for _ in range(2):
+            for name, method, url, data in requests:
+                with self.subTest(name):
+                    response = getattr(self.client, method)(url, data)
+                    self.assertEqual(response.status_code, 200)
+
+    def test_over_budget_raises(self):
+        with override_settings(QUERY_BUDGETS={'forum': 0}):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse('forum', args=[self.college.slug]))
+
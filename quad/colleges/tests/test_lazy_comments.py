@@ -0,0 +1,90 @@
+import json
+
+from django.urls import reverse
+
+from ..comment_tree import COMMENTS_PER_PAGE, REPLIES_PER_COMMENT
+from ..models import Comment
+from .base import ForumTestCase, use_hit_counter, comment_pks, more_urls
+
+
+class LazyCommentTests(ForumTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.extra = COMMENTS_PER_PAGE + 4
+        for number in range(cls.extra):
+            Comment.objects.create(
+                author=cls.voter, thread=cls.thread, body='Top', score=number % 5
+            )
+            Comment.objects.create(
+                author=cls.voter, thread=cls.thread, parent=cls.comment, body='Reply',
+                score=number % 3,
+            )
+        # Keeps the comment with all the replies on top of the first page
+        Comment.objects.filter(pk=cls.comment.pk).update(score=10)
+        cls.comment.refresh_from_db()
+
+    def setUp(self):
+        super().setUp()
+        use_hit_counter(self)
+
+    def get_json(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def best_first(self, comments):
+        return list(comments.order_by('-score', '-pk').values_list('pk', flat=True))
+
+    def test_reply_pages_follow_cursors(self):
+        data = self.get_json(reverse('comment_replies', args=[self.comment.pk]))
+        first = comment_pks(data['html'])
+        self.assertEqual(len(first), COMMENTS_PER_PAGE)
+        self.assertEqual(set(data['comments']), {str(pk) for pk in first})
+        [url] = more_urls(data['html'])
+        self.assertIn('Load more replies', data['html'])
+        self.assertTrue(url.startswith(reverse('comment_replies', args=[self.comment.pk]) + '?after='))
+
+        data = self.get_json(url)
+        self.assertEqual(more_urls(data['html']), [])
+        self.assertEqual(
+            first + comment_pks(data['html']), self.best_first(self.comment.children.all())
+        )
+
+    def test_thread_page_links_the_rest_of_the_replies(self):
+        html = self.client.get(reverse('thread', args=[self.thread.slug])).content.decode()
+        replies = self.best_first(self.comment.children.all())
+        shown = replies[:REPLIES_PER_COMMENT]
+        self.assertEqual(comment_pks(html)[1:REPLIES_PER_COMMENT + 1], shown)
+
+        reply_urls = [
+            url for url in more_urls(html)
+            if url.startswith(reverse('comment_replies', args=[self.comment.pk]))
+        ]
+        [url] = reply_urls
+        self.assertIn(f'({self.extra - REPLIES_PER_COMMENT})', html)
+        # Picks up right after the last reply shown
+        data = self.get_json(url)
+        self.assertEqual(
+            comment_pks(data['html']),
+            replies[REPLIES_PER_COMMENT:REPLIES_PER_COMMENT + COMMENTS_PER_PAGE],
+        )
+
+    def test_more_comments_follow_cursors(self):
+        html = self.client.get(reverse('thread', args=[self.thread.slug])).content.decode()
+        [url] = [
+            url for url in more_urls(html)
+            if url.startswith(reverse('more_comments', args=[self.thread.slug]))
+        ]
+        data = self.get_json(url)
+        self.assertEqual(more_urls(data['html']), [])
+        top_level = self.best_first(self.thread.comments.filter(depth=0))
+        self.assertEqual(comment_pks(data['html']), top_level[COMMENTS_PER_PAGE:])
+
+    def test_bad_cursors_are_404s(self):
+        for url in (
+            reverse('comment_replies', args=[self.comment.pk]),
+            reverse('more_comments', args=[self.thread.slug]),
+        ):
+            self.assertEqual(self.client.get(url, {'after': 'garbage'}).status_code, 404)
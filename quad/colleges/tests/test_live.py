@@ -0,0 +1,26 @@
+from unittest import mock
+
+from django.urls import reverse
+
+from .base import ForumTestCase, use_hit_counter
+
+
+class LiveUpdateTests(ForumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        use_hit_counter(self)
+
+    def test_other_servers_stop_the_stream(self):
+        response = self.client.get(reverse('thread_events', args=[self.thread.slug]))
+        self.assertEqual(response.status_code, 204)
+        page = self.client.get(reverse('thread', args=[self.thread.slug]))
+        self.assertNotContains(page, 'EventSource')
+
+    def test_pooled_asgi_handler_streams(self):
+        with mock.patch('colleges.views.live_updates', return_value=True):
+            response = self.client.get(reverse('thread_events', args=[self.thread.slug]))
+            page = self.client.get(reverse('thread', args=[self.thread.slug]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.assertTrue(response.streaming)
+        self.assertContains(page, 'EventSource')
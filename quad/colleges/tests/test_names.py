@@ -0,0 +1,20 @@
+from django.urls import reverse
+
+from ..models import AnonymousName, Thread
+from ..names import get_anon_names
+from .base import ForumTestCase
+
+
+class AnonNameTests(ForumTestCase):
+
+    def test_new_posters_reach_cached_names(self):
+        self.assertNotIn(self.voter.pk, get_anon_names(Thread.objects.get(pk=self.thread.pk)))
+        self.voter_client.post(
+            reverse('new_comment', args=[self.thread.slug]),
+            {'body': 'Me too', 'is_anonymous': True},
+        )
+        anon_name = AnonymousName.objects.get(user=self.voter, thread=self.thread)
+        self.assertEqual(
+            get_anon_names(Thread.objects.get(pk=self.thread.pk))[self.voter.pk],
+            f'[anonymous {anon_name.pk}]',
+        )
@@ -0,0 +1,141 @@
+from datetime import timedelta
+
+from django.urls import reverse
+from django.utils import timezone
+
+from ..models import Thread, ThreadVote
+from ..pagination import (
+    paginate, encode_cursor, InvalidCursor, SORT_FIELDS, THREADS_PER_PAGE,
+)
+from ..ranking import hot_rank, RANK_EPOCH, HOT_DECAY_SECONDS
+from ..votes import update_like_status
+from .base import ForumTestCase
+
+
+class KeysetPaginationTests(ForumTestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        start = timezone.now() - timedelta(days=3)
+        # Few distinct values in every sort field, so pages split ties
+        for number in range(THREADS_PER_PAGE * 2 + 3):
+            Thread.objects.create(
+                author=cls.voter,
+                college=cls.college,
+                title=f'Thread {number}',
+                body='Body',
+                score=number % 3,
+                comments_count=number % 2,
+                timestamp=start + timedelta(hours=number // 4),
+            )
+
+    def expected_order(self, sort):
+        field = SORT_FIELDS[sort]
+        return list(
+            self.college.threads.order_by(f'-{field}', '-pk').values_list('pk', flat=True)
+        )
+
+    def walk_forward(self, sort):
+        pages = [paginate(self.college.threads.all(), sort=sort)]
+        while pages[-1].next_cursor:
+            pages.append(paginate(self.college.threads.all(), sort=sort, after=pages[-1].next_cursor))
+        return pages
+
+    def test_after_visits_every_thread_once_in_order(self):
+        for sort in SORT_FIELDS:
+            with self.subTest(sort=sort):
+                pages = self.walk_forward(sort)
+                self.assertEqual(len(pages), 3)
+                self.assertIsNone(pages[0].prev_cursor)
+                self.assertEqual(
+                    [thread.pk for page in pages for thread in page],
+                    self.expected_order(sort),
+                )
+
+    def test_before_walks_back_to_the_same_pages(self):
+        for sort in SORT_FIELDS:
+            with self.subTest(sort=sort):
+                pages = self.walk_forward(sort)
+                page = pages[-1]
+                for expected in reversed(pages[:-1]):
+                    page = paginate(self.college.threads.all(), sort=sort, before=page.prev_cursor)
+                    self.assertEqual([thread.pk for thread in page], [thread.pk for thread in expected])
+                    # Walking back always leaves a way forward again
+                    self.assertIsNotNone(page.next_cursor)
+                self.assertIsNone(page.prev_cursor)
+
+    def test_cursors_survive_new_threads(self):
+        first = paginate(self.college.threads.all(), sort='new')
+        Thread.objects.create(
+            author=self.voter, college=self.college, title='Newest', body='Body'
+        )
+        second = paginate(self.college.threads.all(), sort='new', after=first.next_cursor)
+        # The new thread went to the top, nothing shifts onto the next page
+        self.assertEqual(
+            [thread.pk for thread in second],
+            self.expected_order('new')[THREADS_PER_PAGE + 1:THREADS_PER_PAGE * 2 + 1],
+        )
+
+    def test_tampered_cursors_are_rejected(self):
+        cursor = paginate(self.college.threads.all(), sort='top').next_cursor
+        tampered = cursor[:-1] + ('x' if cursor[-1] != 'x' else 'y')
+        for bad in (tampered, 'garbage', encode_cursor(self.thread, 'timestamp')):
+            with self.subTest(cursor=bad):
+                with self.assertRaises(InvalidCursor):
+                    paginate(self.college.threads.all(), sort='top', after=bad)
+                with self.assertRaises(InvalidCursor):
+                    paginate(self.college.threads.all(), sort='top', before=bad)
+
+    def test_forum_pages(self):
+        url = reverse('forum', args=[self.college.slug])
+        for sort in SORT_FIELDS:
+            with self.subTest(sort=sort):
+                response = self.client.get(url, {'sort': sort})
+                page = response.context['page']
+                self.assertEqual(
+                    [thread.pk for thread in page], self.expected_order(sort)[:THREADS_PER_PAGE]
+                )
+                self.assertContains(response, f'after={page.next_cursor}'.replace(':', '%3A'))
+
+                response = self.client.get(url, {'sort': sort, 'after': page.next_cursor})
+                self.assertEqual(
+                    [thread.pk for thread in response.context['page']],
+                    self.expected_order(sort)[THREADS_PER_PAGE:THREADS_PER_PAGE * 2],
+                )
+
+        response = self.client.get(url, {'sort': 'top', 'after': 'garbage'})
+        self.assertEqual(response.status_code, 404)
+
+
+class HotRankTests(ForumTestCase):
+
+    def test_points_and_recency(self):
+        timestamp = RANK_EPOCH + timedelta(days=10)
+        self.assertGreater(hot_rank(10, 0, timestamp), hot_rank(1, 0, timestamp))
+        # Comments count for half a point each
+        self.assertEqual(hot_rank(0, 20, timestamp), hot_rank(10, 0, timestamp))
+        self.assertLess(hot_rank(-10, 0, timestamp), hot_rank(0, 0, timestamp))
+        # Ten times the points are worth HOT_DECAY_SECONDS of recency
+        later = timestamp + timedelta(seconds=HOT_DECAY_SECONDS)
+        self.assertAlmostEqual(hot_rank(100, 0, timestamp), hot_rank(10, 0, later))
+        self.assertGreater(hot_rank(1, 0, later), hot_rank(1, 0, timestamp))
+
+    def test_votes_rerank_the_hot_listing(self):
+        older = Thread.objects.create(
+            author=self.voter,
+            college=self.college,
+            title='Older',
+            body='Body',
+            timestamp=self.thread.timestamp - timedelta(hours=1),
+        )
+        url = reverse('forum', args=[self.college.slug])
+        response = self.client.get(url, {'sort': 'hot'})
+        self.assertEqual([thread.pk for thread in response.context['page']], [self.thread.pk, older.pk])
+
+        for user in (self.author, self.voter):
+            update_like_status(user, ThreadVote, Thread.objects.get(pk=older.pk), True)
+        older.refresh_from_db()
+        self.assertEqual(older.rank, hot_rank(2, 0, older.timestamp))
+        response = self.client.get(url, {'sort': 'hot'})
+        self.assertEqual([thread.pk for thread in response.context['page']], [older.pk, self.thread.pk])
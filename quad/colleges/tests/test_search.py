@@ -0,0 +1,105 @@
+from types import SimpleNamespace
+from unittest import skipUnless
+
+from django.db import connection
+
+from ..models import College, Thread, Comment, DELETED_BODY
+from ..search import (
+    ScanSearchBackend,
+    SQLiteSearchBackend,
+    get_search_backend,
+    index_comment,
+    index_thread,
+    search,
+)
+from .base import ForumTestCase
+
+
+class ScanSearchTests(ForumTestCase):
+
+    def test_other_databases_fall_back_to_scanning(self):
+        self.assertIsInstance(
+            get_search_backend(SimpleNamespace(vendor='mysql')), ScanSearchBackend
+        )
+
+    def test_every_word_has_to_match(self):
+        other = College.objects.create(full_name='Other College', short_name='OC')
+        Thread.objects.create(author=self.author, college=other, title='Dorm housing', body='')
+        reply = Comment.objects.create(
+            author=self.voter, thread=self.thread, body='The north dorm has good housing',
+        )
+        Comment.objects.create(author=self.voter, thread=self.thread, body='Dorm food')
+
+        # Words may match the title or the body, newest posts come first
+        rows = ScanSearchBackend(None).search(self.college.pk, 'housing DORM', 20, 0)
+        self.assertEqual(rows, [
+            (self.thread.pk, reply.pk, '', 'The north \x02dorm\x03 has good \x02housing\x03'),
+            (self.thread.pk, None, '\x02Housing\x03 question', 'Which \x02dorm\x03 is best?'),
+        ])
+        self.assertEqual(ScanSearchBackend(None).search(self.college.pk, 'housing DORM', 1, 1), rows[1:])
+
+
+
+@skipUnless(connection.vendor == 'sqlite', 'FTS5 index')
+class SQLiteSearchTests(ForumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.backend = SQLiteSearchBackend(connection)
+        index_thread(self.thread)
+        index_comment(self.comment, self.college.pk)
+
+    def post_thread(self, title, body, college=None):
+        thread = Thread.objects.create(
+            author=self.author, college=college or self.college, title=title, body=body,
+        )
+        index_thread(thread)
+        return thread
+
+    def test_title_matches_rank_first(self):
+        in_body = self.post_thread('Parking', 'Where do commuters park near the library?')
+        in_title = self.post_thread('Library hours', 'Open late during finals?')
+        rows = self.backend.search(self.college.pk, 'library', 20, 0)
+        self.assertEqual([row[0] for row in rows], [in_title.pk, in_body.pk])
+        self.assertEqual(rows[0][2], '\x02Library\x03 hours')
+        self.assertEqual(rows[1][3], 'Where do commuters park near the \x02library\x03?')
+        self.assertEqual(self.backend.search(self.college.pk, 'library', 1, 1), rows[1:])
+
+    def test_searches_stay_in_their_college(self):
+        other = College.objects.create(full_name='Other College', short_name='OC')
+        self.post_thread('Housing elsewhere', 'Dorms', college=other)
+        rows = self.backend.search(self.college.pk, 'housing', 20, 0)
+        self.assertEqual([row[0] for row in rows], [self.thread.pk])
+
+    def test_comment_matches(self):
+        reply = Comment.objects.create(
+            author=self.voter, thread=self.thread, body='The north dorm has good food',
+        )
+        index_comment(reply, self.college.pk)
+        rows = self.backend.search(self.college.pk, 'north food', 20, 0)
+        self.assertEqual(rows, [
+            (self.thread.pk, reply.pk, '', 'The \x02north\x03 dorm has good \x02food\x03'),
+        ])
+
+    def test_query_syntax_is_searched_for_literally(self):
+        thread = self.post_thread('NEAR OR NOT', 'college : c1 AND "quotes" body:* (x)')
+        # Every word has to be in the post, operators included
+        for query in ('NEAR OR', 'college:', '"quotes', 'body:*', '(x', 'c1 AND'):
+            with self.subTest(query):
+                rows = self.backend.search(self.college.pk, query, 20, 0)
+                self.assertEqual([row[0] for row in rows], [thread.pk])
+        for query in ('NOT housing', 'c1 OR dorm', 'college : c2'):
+            with self.subTest(query):
+                self.assertEqual(self.backend.search(self.college.pk, query, 20, 0), [])
+
+    def test_deleted_posts_leave_the_index(self):
+        self.comment.body = DELETED_BODY
+        index_comment(self.comment, self.college.pk)
+        self.assertEqual(self.backend.search(self.college.pk, 'anyone', 20, 0), [])
+
+    def test_results_are_escaped(self):
+        self.post_thread('<script>dorm</script>', 'Nothing')
+        results, has_next = search(self.college, 'dorm')
+        titles = [result.title for result in results]
+        self.assertIn('&lt;script&gt;<mark>dorm</mark>&lt;/script&gt;', titles)
+        self.assertFalse(has_next)
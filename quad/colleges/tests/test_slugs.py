@@ -0,0 +1,67 @@
+from types import SimpleNamespace
+from unittest import mock
+
+from django.db import IntegrityError
+from django.utils.http import int_to_base36
+
+from ..models import Thread
+from ..utils import save_with_unique_slug, unique_constraint_names, violates_unique
+from .base import ForumTestCase
+
+
+class SlugTests(ForumTestCase):
+
+    def test_taken_slug_gets_a_suffix(self):
+        first = Thread.objects.create(author=self.author, college=self.college, title='Parking')
+        second = Thread.objects.create(author=self.author, college=self.college, title='Parking')
+        self.assertEqual(first.slug, 'parking')
+        self.assertNotEqual(second.slug, first.slug)
+        self.assertTrue(second.slug.startswith('parking-'))
+
+    def test_suffixes_follow_the_clock(self):
+        Thread.objects.create(author=self.author, college=self.college, title='Parking')
+        stamp = int_to_base36(1600000000000)
+        with mock.patch('colleges.utils.time.time', return_value=1600000000):
+            second = Thread.objects.create(author=self.author, college=self.college, title='Parking')
+            third = Thread.objects.create(author=self.author, college=self.college, title='Parking')
+        self.assertEqual(second.slug, f'parking-{stamp}')
+        self.assertEqual(third.slug, f'parking-{stamp}1')
+
+    def test_titles_without_letters(self):
+        first = Thread.objects.create(author=self.author, college=self.college, title='???')
+        second = Thread.objects.create(author=self.author, college=self.college, title='!!!')
+        self.assertTrue(first.slug)
+        self.assertNotEqual(second.slug, first.slug)
+
+    def test_named_constraints(self):
+        table = Thread._meta.db_table
+        slug_index = next(iter(unique_constraint_names(table, 'slug')))
+        error = IntegrityError('duplicate key value violates unique constraint')
+        # What psycopg2 puts under the IntegrityError
+        error.__cause__ = Exception()
+        error.__cause__.diag = SimpleNamespace(constraint_name=slug_index)
+        self.assertTrue(violates_unique(error, Thread, 'slug'))
+        error.__cause__.diag.constraint_name = f'{table}_pkey'
+        self.assertFalse(violates_unique(error, Thread, 'slug'))
+
+    def test_long_titles_fit(self):
+        title = 'dorm ' * 100
+        max_length = Thread._meta.get_field('slug').max_length
+        first = Thread.objects.create(author=self.author, college=self.college, title=title)
+        second = Thread.objects.create(author=self.author, college=self.college, title=title)
+        self.assertEqual(len(first.slug), max_length)
+        self.assertLessEqual(len(second.slug), max_length)
+        self.assertNotEqual(second.slug, first.slug)
+
+    def test_other_integrity_errors_are_raised(self):
+        attempts = []
+
+        def save():
+            attempts.append(thread.slug)
+            raise IntegrityError('NOT NULL constraint failed: colleges_thread.body')
+
+        thread = Thread(author=self.author, college=self.college, title='Parking')
+        with self.assertRaises(IntegrityError):
+            save_with_unique_slug(thread, thread.title, save)
+        self.assertEqual(attempts, ['parking'])
+
@@ -0,0 +1,113 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.conf import settings
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from .. import taskqueue
+from ..models import AnonymousName, Task
+from ..taskqueue import task, claim, claim_next, run_claimed
+from .base import ForumTestCase
+
+
+@override_settings(TASKS_EAGER=False)
+class PublishCommentTests(ForumTestCase):
+
+    def test_new_anonymous_poster_is_published_by_number(self):
+        with mock.patch('colleges.views.publish_comment') as publish_comment:
+            self.voter_client.post(
+                reverse('new_comment', args=[self.thread.slug]),
+                {'body': 'Me too', 'is_anonymous': True},
+            )
+        anon_name = AnonymousName.objects.get(user=self.voter, thread=self.thread)
+        comment, name = publish_comment.call_args[0]
+        self.assertEqual(comment.body, 'Me too')
+        self.assertEqual(name, f'[anonymous {anon_name.pk}]')
+
+
+
+@task(key=lambda name: f'test-task:{name}', max_attempts=2)
+def failing_task(name):
+    raise ValueError(name)
+
+
+@task(key=lambda name: f'test-task:{name}')
+def passing_task(name):
+    pass
+
+
+@override_settings(TASKS_EAGER=False, TASK_RETRY_DELAY=10)
+class TaskQueueTests(TestCase):
+
+    def test_pending_tasks_are_coalesced(self):
+        first = passing_task.enqueue(name='a')
+        self.assertEqual(passing_task.enqueue(name='a').pk, first.pk)
+        self.assertNotEqual(passing_task.enqueue(name='b').pk, first.pk)
+
+    def test_enqueue_while_the_pending_task_is_claimed(self):
+        pk = passing_task.enqueue(name='a').pk
+        real_pending_task = taskqueue.pending_task
+
+        # A worker claims the pending task between the failed insert and
+        # the lookup of the task in the way
+        def claim_first(key):
+            claim(pk)
+            return real_pending_task(key)
+
+        with mock.patch('colleges.taskqueue.pending_task', side_effect=claim_first):
+            new_task = passing_task.enqueue(name='a')
+        self.assertNotEqual(new_task.pk, pk)
+        self.assertEqual(Task.objects.get(pk=new_task.pk).status, Task.PENDING)
+
+    def test_claim_is_exclusive(self):
+        pk = passing_task.enqueue(name='a').pk
+        claimed = claim(pk)
+        self.assertEqual(claimed.status, Task.RUNNING)
+        self.assertEqual(claimed.attempts, 1)
+        self.assertIsNone(claim(pk))
+        self.assertIsNone(claim_next())
+
+        # Running tasks don't coalesce new ones, those could miss changes
+        self.assertNotEqual(passing_task.enqueue(name='a').pk, pk)
+
+        self.assertTrue(run_claimed(claimed))
+        self.assertEqual(Task.objects.get(pk=pk).status, Task.DONE)
+
+    def test_failed_task_is_retried_then_given_up(self):
+        pk = failing_task.enqueue(name='a').pk
+        with self.assertLogs('colleges.taskqueue', 'ERROR'):
+            self.assertFalse(run_claimed(claim(pk)))
+        retried = Task.objects.get(pk=pk)
+        self.assertEqual(retried.status, Task.PENDING)
+        self.assertIn('ValueError', retried.last_error)
+        self.assertGreater(retried.run_after, timezone.now())
+        # Not due yet
+        self.assertIsNone(claim(pk))
+
+        Task.objects.filter(pk=pk).update(run_after=timezone.now())
+        with self.assertLogs('colleges.taskqueue', 'ERROR'):
+            self.assertFalse(run_claimed(claim(pk)))
+        failed = Task.objects.get(pk=pk)
+        self.assertEqual(failed.status, Task.FAILED)
+        self.assertEqual(failed.attempts, 2)
+
+    def test_abandoned_task_is_claimed_again(self):
+        pk = passing_task.enqueue(name='a').pk
+        claim(pk)
+        self.assertIsNone(claim(pk))
+        Task.objects.filter(pk=pk).update(
+            started=timezone.now() - timedelta(seconds=settings.TASK_LEASE_SECONDS + 1)
+        )
+        self.assertEqual(claim(pk).attempts, 2)
+
+    def test_retry_next_to_a_newer_pending_task(self):
+        pk = failing_task.enqueue(name='a').pk
+        claimed = claim(pk)
+        newer = failing_task.enqueue(name='a').pk
+        with self.assertLogs('colleges.taskqueue', 'ERROR'):
+            run_claimed(claimed)
+        # The newer task does the same work, so the old one is done
+        self.assertEqual(Task.objects.get(pk=pk).status, Task.DONE)
+        self.assertEqual(Task.objects.get(pk=newer).status, Task.PENDING)
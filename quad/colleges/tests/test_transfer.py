@@ -0,0 +1,82 @@
+from django.db.models import Max
+
+from ..counters import rebuild_counters
+from ..models import College, Thread, Comment, ThreadVote, CommentVote, path_segment
+from ..transfer import ForumImporter, TransferError, export_college
+from .base import GeneratedForumTestCase
+
+
+class TransferTests(GeneratedForumTestCase):
+
+    def export(self):
+        records = list(export_college(self.college))
+        # Imported next to the original, as a college of its own
+        records[0].update(slug='copy', short_name='COPY', full_name='Copy College')
+        return records
+
+    def test_import_remaps_pks_and_paths(self):
+        records = self.export()
+        originals = {
+            record['pk']: record for record in records if record['type'] == 'comment'
+        }
+        importer = ForumImporter(batch_size=7)
+        for record in records:
+            importer.add(record)
+        importer.finish()
+        rebuild_counters()
+
+        copy = College.objects.get(slug='copy')
+        comments = {
+            comment.pk: comment for comment in Comment.objects.filter(thread__college=copy)
+        }
+        self.assertEqual(len(comments), len(originals))
+        for comment in comments.values():
+            original = originals[comment.pk - importer.comment_offset]
+            self.assertEqual(comment.body, original['body'])
+            self.assertEqual(comment.depth, original['depth'])
+            self.assertEqual(comment.replies_count, original['replies_count'])
+            parent = comments.get(comment.parent_id)
+            self.assertEqual(comment.path, (parent.path if parent else '') + path_segment(comment.pk))
+
+        self.assertEqual(
+            ThreadVote.objects.filter(thread__college=copy).count(),
+            ThreadVote.objects.filter(thread__college=self.college).count(),
+        )
+        self.assertEqual(
+            CommentVote.objects.filter(comment__thread__college=copy).count(),
+            CommentVote.objects.filter(comment__thread__college=self.college).count(),
+        )
+        self.assertEqual(copy.threads_count, College.objects.get(pk=self.college.pk).threads_count)
+
+    def test_import_renames_taken_slugs(self):
+        importer = ForumImporter(batch_size=500)
+        for record in self.export():
+            importer.add(record)
+        importer.finish()
+        slugs = Thread.objects.values_list('slug', flat=True)
+        self.assertEqual(len(slugs), len(set(slugs)))
+
+    def test_renamed_slugs_are_checked_again(self):
+        records = self.export()
+        first = next(record for record in records if record['type'] == 'thread')
+        # Takes the slug the first imported thread would be renamed to
+        blocker_pk = Thread.objects.aggregate(last=Max('pk'))['last'] + 1
+        renamed = f"{first['slug']}-{first['pk'] + blocker_pk}"
+        Thread.objects.create(
+            pk=blocker_pk, author=self.user, college=self.college, title='Blocker', slug=renamed,
+        )
+
+        importer = ForumImporter(batch_size=500)
+        for record in records:
+            importer.add(record)
+        importer.finish()
+        imported = Thread.objects.get(pk=first['pk'] + importer.thread_offset)
+        self.assertNotIn(imported.slug, (first['slug'], renamed))
+        slugs = Thread.objects.values_list('slug', flat=True)
+        self.assertEqual(len(slugs), len(set(slugs)))
+
+    def test_records_before_the_college_are_refused(self):
+        importer = ForumImporter(batch_size=500)
+        with self.assertRaises(TransferError):
+            importer.add(self.export()[1])
+
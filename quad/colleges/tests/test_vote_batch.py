@@ -0,0 +1,145 @@
+import json
+import os
+import tempfile
+from unittest import mock
+
+from django.test import override_settings
+from django.urls import reverse
+
+from users.models import MyUser
+
+from ..models import College, Thread, Comment, ThreadVote, CommentVote
+from ..vote_buffer import VoteBuffer
+from ..views import MAX_BATCH_VOTES
+from .base import ForumTestCase
+
+
+def thread_vote(thread, has_liked):
+    return {'target_type': 'thread', 'pk': thread.pk, 'hasLiked': has_liked}
+
+
+def comment_vote(comment, has_liked):
+    return {'target_type': 'comment', 'pk': comment.pk, 'hasLiked': has_liked}
+
+
+class VoteBatchTests(ForumTestCase):
+
+    def post_votes(self, votes, client=None):
+        if not isinstance(votes, str):
+            votes = json.dumps(votes)
+        response = (client or self.voter_client).post(reverse('vote_batch'), {'votes': votes})
+        return response, json.loads(response.content)
+
+    def assertRejected(self, votes, error):
+        response, data = self.post_votes(votes)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(data, {'success': False, 'error': error})
+
+    def test_toggles_are_applied_in_order(self):
+        # Like, like again (which takes it back), dislike
+        response, data = self.post_votes([
+            thread_vote(self.thread, True),
+            thread_vote(self.thread, True),
+            thread_vote(self.thread, False),
+        ])
+        self.assertEqual(data['threads'], {str(self.thread.pk): {'score': -1, 'likeStatus': -1}})
+        self.assertFalse(ThreadVote.objects.get(thread=self.thread, voter=self.voter).is_like)
+
+        # Disliking again toggles the dislike off
+        response, data = self.post_votes([thread_vote(self.thread, False)])
+        self.assertEqual(data['threads'], {str(self.thread.pk): {'score': 0, 'likeStatus': 0}})
+        self.assertFalse(ThreadVote.objects.filter(thread=self.thread, voter=self.voter).exists())
+
+    def test_mixed_threads_and_comments(self):
+        other_comment = Comment.objects.create(author=self.author, thread=self.thread, body='Two')
+        # Somebody else's like is already counted in the score
+        self.post_votes([comment_vote(other_comment, True)], client=self.client)
+
+        response, data = self.post_votes([
+            comment_vote(self.comment, False),
+            thread_vote(self.thread, True),
+            comment_vote(other_comment, True),
+        ])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(data, {
+            'success': True,
+            'threads': {str(self.thread.pk): {'score': 1, 'likeStatus': 1}},
+            'comments': {
+                str(self.comment.pk): {'score': -1, 'likeStatus': -1},
+                str(other_comment.pk): {'score': 2, 'likeStatus': 1},
+            },
+        })
+        # The returned scores are the ones stored
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).score, 1)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).score, -1)
+        self.assertEqual(Comment.objects.get(pk=other_comment.pk).score, 2)
+        self.assertEqual(CommentVote.objects.filter(voter=self.voter).count(), 2)
+
+    def test_malformed_votes_are_rejected(self):
+        self.assertRejected('not json', 'Expected a JSON list of votes')
+        self.assertRejected({'votes': []}, f'Expected a list of at most {MAX_BATCH_VOTES} votes')
+        self.assertRejected(
+            [thread_vote(self.thread, True)] * (MAX_BATCH_VOTES + 1),
+            f'Expected a list of at most {MAX_BATCH_VOTES} votes',
+        )
+        self.assertRejected([['thread', self.thread.pk, True]], 'Every vote has to be an object')
+        for vote in (
+            {'target_type': 'user', 'pk': self.voter.pk, 'hasLiked': True},
+            {'target_type': 'thread', 'pk': str(self.thread.pk), 'hasLiked': True},
+            {'target_type': 'thread', 'pk': True, 'hasLiked': True},
+            {'target_type': 'thread', 'pk': self.thread.pk, 'hasLiked': 1},
+            {'target_type': 'thread', 'pk': self.thread.pk},
+        ):
+            with self.subTest(vote=vote):
+                self.assertRejected([vote], f'Invalid vote {vote!r}')
+
+        response = self.voter_client.post(reverse('vote_batch'))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(ThreadVote.objects.exists())
+
+    def test_foreign_targets_are_rejected(self):
+        other = College.objects.create(full_name='Other College', short_name='OC')
+        outsider = MyUser.objects.create_user('outsider@other.edu', 'password', college=other)
+        foreign_thread = Thread.objects.create(
+            author=outsider, college=other, title='Elsewhere', body='Body'
+        )
+        foreign_comment = Comment.objects.create(author=outsider, thread=foreign_thread, body='Hi')
+
+        # A single bad target rejects the whole batch
+        self.assertRejected(
+            [thread_vote(self.thread, True), thread_vote(foreign_thread, True)],
+            'Unknown thread',
+        )
+        self.assertRejected(
+            [thread_vote(self.thread, True), comment_vote(foreign_comment, True)],
+            'Unknown comment',
+        )
+        self.assertRejected(
+            [{'target_type': 'comment', 'pk': foreign_comment.pk + 1000, 'hasLiked': True}],
+            'Unknown comment',
+        )
+        self.assertFalse(ThreadVote.objects.exists())
+        self.assertFalse(CommentVote.objects.exists())
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).score, 0)
+
+    def test_buffered_results_match(self):
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        buffer = VoteBuffer(os.path.join(log_dir.name, 'votes.log'), flush_interval=3600)
+        self.addCleanup(lambda: buffer.timer and buffer.timer.cancel())
+        self.addCleanup(lambda: buffer.log.close())
+
+        with override_settings(VOTE_BUFFER_ENABLED=True), \
+                mock.patch('colleges.vote_buffer.get_vote_buffer', return_value=buffer):
+            response, data = self.post_votes([
+                thread_vote(self.thread, True),
+                comment_vote(self.comment, True),
+                comment_vote(self.comment, False),
+            ])
+        self.assertEqual(data['threads'], {str(self.thread.pk): {'score': 1, 'likeStatus': 1}})
+        self.assertEqual(data['comments'], {str(self.comment.pk): {'score': -1, 'likeStatus': -1}})
+        # Nothing is written until the flush
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).score, 0)
+        buffer.flush()
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).score, 1)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).score, -1)
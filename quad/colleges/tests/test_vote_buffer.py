@@ -0,0 +1,134 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from unittest import mock
+
+from ..models import Thread, Comment, ThreadVote, CommentVote
+from ..vote_buffer import VoteBuffer
+from ..votes import apply_vote_states
+from .base import ForumTestCase
+
+
+class VoteBufferTests(ForumTestCase):
+
+    def setUp(self):
+        super().setUp()
+        log_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(log_dir.cleanup)
+        self.log_path = os.path.join(log_dir.name, 'votes.log')
+
+    def make_buffer(self):
+        buffer = VoteBuffer(self.log_path, flush_interval=3600)
+        self.addCleanup(lambda: buffer.timer and buffer.timer.cancel())
+        self.addCleanup(lambda: buffer.log.close())
+        return buffer
+
+    def write_log(self, path, entries):
+        with open(path, 'w') as log:
+            for target, pk, voter, status in entries:
+                log.write(json.dumps({'target': target, 'pk': pk, 'voter': voter, 'status': status}) + '\n')
+
+    def test_flush_writes_final_statuses(self):
+        buffer = self.make_buffer()
+        # Like, unlike, dislike: only the dislike is written
+        for has_liked in (True, True, False):
+            buffer.record(self.voter, ThreadVote, Thread.objects.get(pk=self.thread.pk), has_liked)
+        buffer.record(self.voter, CommentVote, Comment.objects.get(pk=self.comment.pk), True)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertFalse(ThreadVote.objects.get(thread=self.thread, voter=self.voter).is_like)
+        self.assertTrue(CommentVote.objects.get(comment=self.comment, voter=self.voter).is_like)
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).score, -1)
+        self.assertEqual(Comment.objects.get(pk=self.comment.pk).score, 1)
+        self.assertEqual(buffer.flush(), 0)
+
+    def test_optimistic_score(self):
+        buffer = self.make_buffer()
+        thread = Thread.objects.get(pk=self.thread.pk)
+        buffer.record(self.voter, ThreadVote, thread, True)
+        self.assertEqual(thread.score, 1)
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).score, 0)
+
+    def test_votes_cast_during_a_flush(self):
+        buffer = self.make_buffer()
+        buffer.record(self.voter, ThreadVote, Thread.objects.get(pk=self.thread.pk), True)
+        statuses = []
+        real_apply_vote_states = apply_vote_states
+
+        # The voter clicks like again while the first like is being written
+        def click_during_flush(VoteClass, states):
+            if VoteClass is ThreadVote:
+                statuses.append(buffer.record(
+                    self.voter, ThreadVote, Thread.objects.get(pk=self.thread.pk), True,
+                ))
+            return real_apply_vote_states(VoteClass, states)
+
+        with mock.patch('colleges.vote_buffer.apply_vote_states', side_effect=click_during_flush):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertEqual(statuses, [0])
+        self.assertEqual(buffer.flush(), 1)
+        self.assertFalse(ThreadVote.objects.filter(thread=self.thread, voter=self.voter).exists())
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).score, 0)
+
+    def test_replay_after_crash(self):
+        buffer = self.make_buffer()
+        buffer.record(self.voter, ThreadVote, Thread.objects.get(pk=self.thread.pk), True)
+        buffer.record(self.author, ThreadVote, Thread.objects.get(pk=self.thread.pk), False)
+
+        # A new buffer on the same log stands in for the restarted process
+        with open(buffer.log_path) as log:
+            unflushed = log.read()
+        replayed = self.make_buffer()
+        self.assertEqual(replayed.flush(), 2)
+        self.assertTrue(ThreadVote.objects.get(thread=self.thread, voter=self.voter).is_like)
+        self.assertFalse(ThreadVote.objects.get(thread=self.thread, voter=self.author).is_like)
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).score, 0)
+
+        # Replaying votes that were already written, as after a crash right
+        # after a flush, changes nothing
+        with open(buffer.log_path, 'w') as log:
+            log.write(unflushed)
+        self.assertEqual(self.make_buffer().flush(), 2)
+        self.assertEqual(ThreadVote.objects.filter(thread=self.thread).count(), 2)
+        self.assertEqual(Thread.objects.get(pk=self.thread.pk).score, 0)
+
+    def test_flushed_votes_leave_the_log(self):
+        buffer = self.make_buffer()
+        buffer.record(self.voter, ThreadVote, Thread.objects.get(pk=self.thread.pk), True)
+        buffer.flush()
+        self.assertEqual(self.make_buffer().flush(), 0)
+
+    def test_takes_over_logs_of_dead_processes(self):
+        finished = subprocess.Popen([sys.executable, '-c', ''])
+        finished.wait()
+        dead_log = f'{self.log_path}.{finished.pid}'
+        live_log = f'{self.log_path}.{os.getppid()}'
+        self.write_log(dead_log, [('thread', self.thread.pk, self.voter.pk, 1)])
+        self.write_log(live_log, [('thread', self.thread.pk, self.author.pk, -1)])
+        with open(dead_log + '.tmp', 'w') as torn:
+            torn.write('{"target": "thr')
+
+        buffer = self.make_buffer()
+        self.assertFalse(os.path.exists(dead_log))
+        self.assertFalse(os.path.exists(dead_log + '.tmp'))
+        self.assertTrue(os.path.exists(live_log))
+        with open(buffer.log_path) as log:
+            self.assertEqual(len(log.readlines()), 1)
+
+        self.assertEqual(buffer.flush(), 1)
+        self.assertTrue(ThreadVote.objects.get(thread=self.thread, voter=self.voter).is_like)
+        self.assertFalse(ThreadVote.objects.filter(thread=self.thread, voter=self.author).exists())
+
+    def test_failed_rewrite_keeps_the_old_log(self):
+        buffer = self.make_buffer()
+        buffer.record(self.voter, ThreadVote, Thread.objects.get(pk=self.thread.pk), True)
+        with open(buffer.log_path) as log:
+            before = log.read()
+        with mock.patch('colleges.buffers.os.replace', side_effect=OSError):
+            with self.assertRaises(OSError):
+                buffer.flush()
+        with open(buffer.log_path) as log:
+            self.assertEqual(log.read(), before)
+
@@ -0,0 +1,363 @@
+import gzip
+import json
+from itertools import count
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+from django.utils.http import base36_to_int
+
+from .models import (
+    College,
+    CollegeEmail,
+    Thread,
+    Comment,
+    AnonymousName,
+    ThreadVote,
+    CommentVote,
+    DELETED_BODY,
+    PATH_SEGMENT_LENGTH,
+    path_segment,
+)
+from .ranking import hot_rank
+from .search import get_search_backend, thread_row, comment_row
+
+
+# Moves a college's forum between databases as JSON Lines, one record per
+# line with its kind under "type". Records come in the order they can be
+# inserted in: the college, its threads, their comments (parents before
+# replies), then votes and anonymous names. Users are referred to by email.
+#
+# Both directions stream, so memory stays flat however big the forum is.
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+def open_dump(path, mode):
+    """
+    Opens path for reading or writing text, gzipped if it ends with .gz.
+    """
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def timestamp(value):
+    return value.isoformat() if value else None
+
+
+def export_college(college):
+    """
+    Yields the records of college and everything posted in it.
+    """
+    yield {
+        'type': 'college',
+        'slug': college.slug,
+        'full_name': college.full_name,
+        'short_name': college.short_name,
+        'logo': college.logo.name or None,
+        'banner': college.banner.name or None,
+        'domains': list(college.emails.values_list('domain', flat=True)),
+    }
+
+    threads = Thread.objects.filter(college=college).order_by('pk').values_list(
+        'pk', 'author__email', 'slug', 'title', 'body', 'score', 'hits',
+        'comments_count', 'timestamp', 'edited_timestamp', 'is_anonymous',
+    )
+    for (pk, author, slug, title, body, score, hits, comments_count,
+            created, edited, is_anonymous) in threads.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': 'thread',
+            'pk': pk,
+            'author': author,
+            'slug': slug,
+            'title': title,
+            'body': body,
+            'score': score,
+            'hits': hits,
+            'comments_count': comments_count,
+            'timestamp': timestamp(created),
+            'edited_timestamp': timestamp(edited),
+            'is_anonymous': is_anonymous,
+        }
+
+    # A reply always has a greater pk than its parent
+    comments = Comment.objects.filter(thread__college=college).order_by('pk').values_list(
+        'pk', 'thread_id', 'parent_id', 'path', 'depth', 'replies_count', 'author__email',
+        'body', 'score', 'timestamp', 'edited_timestamp', 'is_anonymous',
+    )
+    for (pk, thread, parent, path, depth, replies_count, author, body, score,
+            created, edited, is_anonymous) in comments.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {
+            'type': 'comment',
+            'pk': pk,
+            'thread': thread,
+            'parent': parent,
+            'path': path,
+            'depth': depth,
+            'replies_count': replies_count,
+            'author': author,
+            'body': body,
+            'score': score,
+            'timestamp': timestamp(created),
+            'edited_timestamp': timestamp(edited),
+            'is_anonymous': is_anonymous,
+        }
+
+    thread_votes = ThreadVote.objects.filter(thread__college=college).order_by('pk')
+    for thread, voter, is_like in thread_votes.values_list(
+        'thread_id', 'voter__email', 'is_like'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {'type': 'thread_vote', 'thread': thread, 'voter': voter, 'is_like': is_like}
+
+    comment_votes = CommentVote.objects.filter(comment__thread__college=college).order_by('pk')
+    for comment, voter, is_like in comment_votes.values_list(
+        'comment_id', 'voter__email', 'is_like'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {'type': 'comment_vote', 'comment': comment, 'voter': voter, 'is_like': is_like}
+
+    # In pk order, so everybody keeps their relative anonymous number
+    anonymous_names = AnonymousName.objects.filter(thread__college=college).order_by('pk')
+    for thread, user in anonymous_names.values_list(
+        'thread_id', 'user__email'
+    ).iterator(chunk_size=EXPORT_CHUNK_SIZE):
+        yield {'type': 'anonymous_name', 'thread': thread, 'user': user}
+
+
+def write_records(records, out):
+    count = 0
+    for record in records:
+        out.write(json.dumps(record, separators=(',', ':')) + '\n')
+        count += 1
+    return count
+
+
+class TransferError(Exception):
+    pass
+
+
+class ForumImporter:
+    """
+    Inserts the records of an export with bulk_create, batch_size rows at a
+    time. Threads and comments get new pks past the greatest ones in the
+    database, shifted by a fixed offset so no mapping has to be kept, and
+    comment paths are rewritten segment by segment to match. Authors and
+    voters are looked up by email a batch at a time and created, without a
+    usable password, if they don't exist.
+
+    Run it in a transaction and call finish() at the end.
+    """
+
+    def __init__(self, batch_size):
+        self.batch_size = batch_size
+        self.thread_offset = Thread.objects.aggregate(last=Max('pk'))['last'] or 0
+        self.comment_offset = Comment.objects.aggregate(last=Max('pk'))['last'] or 0
+        self.college = None
+        self.pending = {model: [] for model in (
+            Thread, Comment, ThreadVote, CommentVote, AnonymousName,
+        )}
+        self.written = {model: 0 for model in self.pending}
+        self.search_backend = get_search_backend()
+
+    def add(self, record):
+        kind = record.get('type')
+        if kind == 'college':
+            self.add_college(record)
+            return
+        if self.college is None:
+            raise TransferError(f'A {kind} record comes before the college')
+        if kind == 'thread':
+            self.queue(Thread, record)
+        elif kind == 'comment':
+            self.queue(Comment, record)
+        elif kind == 'thread_vote':
+            self.queue(ThreadVote, record)
+        elif kind == 'comment_vote':
+            self.queue(CommentVote, record)
+        elif kind == 'anonymous_name':
+            self.queue(AnonymousName, record)
+        else:
+            raise TransferError(f'Unknown record type {kind!r}')
+
+    def add_college(self, record):
+        if self.college is not None:
+            raise TransferError('An export holds a single college')
+        taken = College.objects.filter(slug=record['slug']) | College.objects.filter(
+            short_name=record['short_name']
+        ) | College.objects.filter(full_name=record['full_name'])
+        if taken.exists():
+            raise TransferError(f"College {record['short_name']} already exists")
+        self.college = College.objects.create(
+            slug=record['slug'],
+            full_name=record['full_name'],
+            short_name=record['short_name'],
+            logo=record['logo'],
+            banner=record['banner'],
+        )
+        CollegeEmail.objects.bulk_create([
+            CollegeEmail(college=self.college, domain=domain) for domain in record['domains']
+        ])
+
+    def queue(self, model, record):
+        # Records come grouped by kind, so whatever is pending of the kinds
+        # before is written before the rows referring to it
+        for other in self.pending:
+            if other is not model:
+                self.flush(other)
+        records = self.pending[model]
+        records.append(record)
+        if len(records) >= self.batch_size:
+            self.flush(model)
+
+    def flush(self, model):
+        records = self.pending[model]
+        if not records:
+            return
+        users = self.user_pks(records)
+        build = {
+            Thread: self.build_thread,
+            Comment: self.build_comment,
+            ThreadVote: self.build_thread_vote,
+            CommentVote: self.build_comment_vote,
+            AnonymousName: self.build_anonymous_name,
+        }[model]
+        objs = [build(record, users) for record in records]
+        if model is Thread:
+            self.fix_slug_collisions(objs)
+        model.objects.bulk_create(objs)
+        self.written[model] += len(objs)
+        self.index(objs)
+        records.clear()
+
+    def user_pks(self, records):
+        """
+        Maps the emails of the users in records to their pks, creating the
+        ones that don't exist yet.
+        """
+        emails = {
+            record[field] for record in records
+            for field in ('author', 'voter', 'user') if record.get(field)
+        }
+        users = get_user_model().objects.filter(email__in=emails)
+        pks = dict(users.values_list('email', 'pk'))
+        missing = emails - set(pks)
+        if missing:
+            password = make_password(None)
+            get_user_model().objects.bulk_create([
+                get_user_model()(email=email, password=password, college=self.college)
+                for email in missing
+            ])
+            pks.update(users.filter(email__in=missing).values_list('email', 'pk'))
+        return pks
+
+    def comment_path(self, path):
+        return ''.join(
+            path_segment(base36_to_int(path[start:start + PATH_SEGMENT_LENGTH]) + self.comment_offset)
+            for start in range(0, len(path), PATH_SEGMENT_LENGTH)
+        )
+
+    def build_thread(self, record, users):
+        created = parse_datetime(record['timestamp'])
+        return Thread(
+            pk=record['pk'] + self.thread_offset,
+            college=self.college,
+            author_id=users.get(record['author']),
+            slug=record['slug'],
+            title=record['title'],
+            body=record['body'],
+            score=record['score'],
+            hits=record['hits'],
+            comments_count=record['comments_count'],
+            rank=hot_rank(record['score'], record['comments_count'], created),
+            timestamp=created,
+            edited_timestamp=parse_datetime(record['edited_timestamp'] or ''),
+            is_anonymous=record['is_anonymous'],
+        )
+
+    def build_comment(self, record, users):
+        return Comment(
+            pk=record['pk'] + self.comment_offset,
+            thread_id=record['thread'] + self.thread_offset,
+            parent_id=record['parent'] + self.comment_offset if record['parent'] else None,
+            path=self.comment_path(record['path']),
+            depth=record['depth'],
+            replies_count=record['replies_count'],
+            author_id=users.get(record['author']),
+            body=record['body'],
+            score=record['score'],
+            timestamp=parse_datetime(record['timestamp']),
+            edited_timestamp=parse_datetime(record['edited_timestamp'] or ''),
+            is_anonymous=record['is_anonymous'],
+        )
+
+    def build_thread_vote(self, record, users):
+        return ThreadVote(
+            thread_id=record['thread'] + self.thread_offset,
+            voter_id=users[record['voter']],
+            is_like=record['is_like'],
+        )
+
+    def build_comment_vote(self, record, users):
+        return CommentVote(
+            comment_id=record['comment'] + self.comment_offset,
+            voter_id=users[record['voter']],
+            is_like=record['is_like'],
+        )
+
+    def build_anonymous_name(self, record, users):
+        return AnonymousName(
+            thread_id=record['thread'] + self.thread_offset,
+            user_id=users[record['user']],
+        )
+
+    def fix_slug_collisions(self, threads):
+        # Slugs are unique across colleges, so a thread whose slug is taken
+        # gets its new pk appended, much like save_with_unique_slug would
+        # add a suffix. The new slug can be taken too, so they are checked
+        # again until none is, with a counter after the pk from then on.
+        max_length = Thread._meta.get_field('slug').max_length
+        originals = {thread.pk: thread.slug for thread in threads}
+        settled = set()
+        pending = threads
+        for attempt in count(1):
+            taken = settled | set(Thread.objects.filter(
+                slug__in=[thread.slug for thread in pending]
+            ).values_list('slug', flat=True))
+            colliding = []
+            for thread in pending:
+                if thread.slug in taken:
+                    colliding.append(thread)
+                else:
+                    # Also keeps two threads of the batch from ending up
+                    # with the same slug
+                    taken.add(thread.slug)
+                    settled.add(thread.slug)
+            if not colliding:
+                return
+            for thread in colliding:
+                suffix = f'-{thread.pk}' if attempt == 1 else f'-{thread.pk}-{attempt}'
+                thread.slug = originals[thread.pk][:max_length - len(suffix)] + suffix
+            pending = colliding
+
+    def index(self, objs):
+        rows = [
+            thread_row(obj) if isinstance(obj, Thread) else comment_row(obj, self.college.pk)
+            for obj in objs
+            if isinstance(obj, (Thread, Comment)) and obj.body != DELETED_BODY
+        ]
+        if rows:
+            self.search_backend.upsert(rows)
+
+    def finish(self):
+        """
+        Writes what is left and makes the database hand out pks after the
+        imported ones.
+        """
+        for model in self.pending:
+            self.flush(model)
+        with connection.cursor() as cursor:
+            for sql in connection.ops.sequence_reset_sql(no_style(), [Thread, Comment]):
+                cursor.execute(sql)
@@ -1,9 +1,14 @@
 from django.urls import path, include
 
+from . import api
 from .views import (
     view_forum,
+    search_forum,
     create_thread,
     view_thread,
+    thread_events,
+    more_comments,
+    comment_replies,
     edit_thread,
     delete_thread,
     create_comment,
@@ -12,20 +17,32 @@ from .views import (
     reply_comment,
     like_thread,
     like_comment,
+    vote_batch,
 )
 
 
 urlpatterns = [
     path('<slug:college_slug>', view_forum, name='forum'),
     path('<slug:college_slug>/new', create_thread, name='new_thread'),
+    path('<slug:college_slug>/search', search_forum, name='search_forum'),
     path('thread/<slug:thread_slug>', view_thread, name='thread'),
     path('thread/<slug:thread_slug>/edit', edit_thread, name='edit_thread'),
     path('thread/<slug:thread_slug>/delete', delete_thread, name='delete_thread'),
     path('thread/<slug:thread_slug>/like', like_thread, name='like_thread'),
+    path('thread/<slug:thread_slug>/events', thread_events, name='thread_events'),
     path('comments/<slug:thread_slug>/new', create_comment, name='new_comment'),
+    path('comments/<slug:thread_slug>/more', more_comments, name='more_comments'),
+    path('comments/<int:comment_pk>/replies', comment_replies, name='comment_replies'),
     path('comments/<int:comment_pk>/edit', edit_comment, name='edit_comment'),
     path('comments/<int:comment_pk>/delete', delete_comment, name='delete_comment'),
     path('comments/<int:comment_pk>/reply', reply_comment, name='reply_comment'),
     path('comments/<int:comment_pk>/like', like_comment, name='like_comment'),
+    path('votes/batch', vote_batch, name='vote_batch'),
+    path('api/v1/forums/<slug:college_slug>/threads', api.forum_threads, name='api_forum_threads'),
+    path('api/v1/threads/<slug:thread_slug>', api.thread_detail, name='api_thread'),
+    path('api/v1/threads/<slug:thread_slug>/comments', api.thread_comments, name='api_thread_comments'),
+    path('api/v1/threads/<slug:thread_slug>/tree', api.thread_tree, name='api_thread_tree'),
+    path('api/v1/threads/<slug:thread_slug>/votes', api.thread_votes, name='api_thread_votes'),
+    path('api/v1/comments/<int:comment_pk>/tree', api.comment_tree, name='api_comment_tree'),
 ]
 
@@ -1,19 +1,66 @@
+import time
+from functools import lru_cache
+from itertools import count
+
+from django.db import IntegrityError, connection, transaction
+from django.utils.http import int_to_base36
 from django.utils.text import slugify
 
-from random import choice
-from string import ascii_lowercase, digits
 
+MAX_SLUG_ATTEMPTS = 5
+
+
+def slug_candidates(max_length, sluggified):
+    base_slug = slugify(sluggified)[:max_length]
+    if base_slug:
+        yield base_slug
+    # Taken slugs get the time in milliseconds, then a counter for slugs
+    # taken within the same millisecond
+    stamp = int_to_base36(int(time.time() * 1000))
+    for number in count():
+        suffix = stamp + (int_to_base36(number) if number else '')
+        stem = base_slug[:max_length - len(suffix) - 1]
+        yield f'{stem}-{suffix}' if stem else suffix
+
+
+@lru_cache(maxsize=None)
+def unique_constraint_names(table, column):
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, table)
+    return {
+        name for name, constraint in constraints.items()
+        if constraint['unique'] and constraint['columns'] == [column]
+    }
 
-def random_string_generator(size=10, chars=ascii_lowercase + digits):
-    return ''.join(choice(chars) for _ in range(size))
 
+def violates_unique(error, model, field_name):
+    """
+    Whether error is the unique index of model's field_name rejecting a
+    value.
+    """
+    table = model._meta.db_table
+    column = model._meta.get_field(field_name).column
+    # psycopg2 names the constraint, SQLite only the table and column
+    constraint = getattr(getattr(error.__cause__, 'diag', None), 'constraint_name', None)
+    if constraint:
+        return constraint in unique_constraint_names(table, column)
+    return f'{table}.{column}' in str(error)
 
-# sluggified is the field to be turned into a slug
-def unique_slugify(instance, new_slug, sluggified):
-    if not new_slug:
-        new_slug = slugify(sluggified)
-        base_slug = new_slug
-        while instance.objects.filter(slug=new_slug).exists():
-            new_slug = base_slug + random_string_generator()
 
-    return new_slug
+# Gives instance a slug made from sluggified and inserts it with save().
+# Nothing is looked up beforehand: the slug's unique index rejects a taken
+# one and the insert is retried in a savepoint with a suffix, so a free
+# slug costs no extra queries.
+def save_with_unique_slug(instance, sluggified, save):
+    model = type(instance)
+    max_length = model._meta.get_field('slug').max_length
+    candidates = slug_candidates(max_length, sluggified)
+    for attempt in range(MAX_SLUG_ATTEMPTS):
+        instance.slug = next(candidates)
+        try:
+            with transaction.atomic():
+                return save()
+        except IntegrityError as error:
+            # Anything but a taken slug isn't for us to retry
+            if attempt == MAX_SLUG_ATTEMPTS - 1 or not violates_unique(error, model, 'slug'):
+                raise
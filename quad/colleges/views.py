@@ -1,11 +1,55 @@
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponse
+from django.db import transaction
+from django.db.models import F
+from django.http import HttpResponse, Http404
 from django.shortcuts import render, redirect, get_object_or_404
-from django.views.decorators.http import require_POST
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+from django.utils.http import urlencode
+from django.utils.timezone import now
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition, require_POST
 
 import json
+from .comment_tree import (
+    load_comment_page,
+    build_comment_tree,
+    render_comment_subtrees,
+    personalize_comments,
+)
+from .conditional import (
+    forum_etag,
+    forum_last_modified,
+    thread_etag,
+)
+from .counters import (
+    count_thread_created,
+    count_thread_deleted,
+    count_comment_created,
+    count_comment_deleted,
+)
 from .forms import ThreadForm, ThreadEditForm, CommentForm, CommentEditForm
+from .forum_cache import forum_cache, forum_page_key
+from .fragments import stitch
+from .hits import counts_hits
+from .live import (
+    EventStreamResponse,
+    live_updates,
+    publish_comment,
+    publish_delete,
+    publish_edit,
+    thread_channel,
+)
 from .messages import alert
+from .names import get_anon_names, get_display_name, with_author_name
+from .pagination import paginate, InvalidCursor, SORT_FIELDS, DEFAULT_SORT
+from .search import search
+from .ranking import ranked_threads, TOP_WINDOWS, DEFAULT_TOP_WINDOW
+from .tasks import index_thread_task, index_comment_task
+from .vote_buffer import cast_vote, cast_votes
+from .votes import get_thread_like_statuses
 from .models import (
     College,
     Thread,
@@ -13,8 +57,18 @@ from .models import (
     ThreadVote,
     CommentVote,
     AnonymousName,
+    DELETED_BODY,
+    MAX_COMMENT_DEPTH,
 )
 
+# Edits and deletes save only what they change. The counters are kept
+# current with F() updates by other requests, and a full save would write
+# back the stale values read at the start of this one.
+THREAD_EDIT_FIELDS = ['title', 'body', 'edited_timestamp', 'author', 'is_anonymous', 'generation']
+THREAD_COUNTER_FIELDS = ['score', 'hits', 'comments_count', 'rank', 'generation']
+COMMENT_EDIT_FIELDS = ['body', 'edited_timestamp', 'author']
+COMMENT_COUNTER_FIELDS = ['score', 'replies_count']
+
 
 def user_belongs(request, college):
     if request.user.college == college or request.user.is_staff:
@@ -27,22 +81,90 @@ def user_owns(request, author):
     return request.user == author or request.user.is_staff
 
 
+# Pages are per viewer and revalidated on every request, which costs a
+# single query while nothing changed
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=forum_etag, last_modified_func=forum_last_modified)
 def view_forum(request, college_slug):
     college = get_object_or_404(College, slug=college_slug)
 
     if not user_belongs(request, college):
         return redirect('home')
 
+    sort = request.GET.get('sort')
+    if sort not in SORT_FIELDS:
+        sort = DEFAULT_SORT
+    window = request.GET.get('t')
+    if window not in TOP_WINDOWS:
+        window = DEFAULT_TOP_WINDOW
+    after = request.GET.get('after')
+    before = request.GET.get('before')
+
+    # The listing is shared by everybody in the college, only the names of
+    # the viewer's own threads are filled in per request
+    key = forum_page_key(college, sort, window, after, before)
+    listing = forum_cache.get(key)
+    if listing is None:
+        listing = build_forum_listing(college, sort, window, after, before)
+        forum_cache.set(key, listing)
+
+    slots = {}
+    for thread in listing['page']:
+        if thread.author_id is not None and thread.author_id == request.user.pk:
+            slots[('name', str(thread.pk))] = '[me]'
+        else:
+            slots[('name', str(thread.pk))] = escape(listing['names'][thread.pk])
+
     template_name = 'forum/forum.html'
-    threads = college.threads.all().select_related('author')
-    names = {
-        thread.slug: get_display_name(user=request.user, post=thread) for thread in threads
-    }
     context = {
         'college': college,
-        'threads': threads,
+        'page': listing['page'],
+        'window': window,
+        'rows_html': stitch(listing['rows_html'], slots),
+    }
+
+    return render(request, template_name, context)
+
+
+def build_forum_listing(college, sort, window, after, before):
+    threads = with_author_name(ranked_threads(college, sort, window))
+    try:
+        page = paginate(threads, sort=sort, after=after, before=before)
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+
+    # Display names are only worked out for the threads on this page
+    names = {thread.pk: get_display_name(user=None, post=thread) for thread in page}
+    rows_html = render_to_string('forum/thread_rows.html', {'threads': page})
+    return {
+        'page': page,
         'names': names,
+        'rows_html': rows_html,
+    }
+
+
+@login_required
+def search_forum(request, college_slug):
+    college = get_object_or_404(College, slug=college_slug)
+
+    if not user_belongs(request, college):
+        return redirect('home')
+
+    query = request.GET.get('q', '').strip()
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        page = 1
+    results, has_next = search(college, query, page) if query else ([], False)
+
+    template_name = 'forum/search.html'
+    context = {
+        'college': college,
+        'query': query,
+        'results': results,
+        'page': page,
+        'has_next': has_next,
     }
 
     return render(request, template_name, context)
@@ -66,8 +188,11 @@ def create_thread(request, college_slug):
                 body=form.cleaned_data['body'],
                 is_anonymous=form.cleaned_data['is_anonymous'],
             )
-            new_thread.save()
-            AnonymousName.objects.get_or_create(user=user, thread=new_thread)
+            with transaction.atomic():
+                new_thread.save()
+                count_thread_created(new_thread)
+                index_thread_task.enqueue(pk=new_thread.pk)
+                AnonymousName.objects.get_or_create(user=user, thread=new_thread)
             alert(request, 'Thread successfully created!', 'success')
             return redirect(new_thread)
         else:
@@ -82,70 +207,176 @@ def create_thread(request, college_slug):
     
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@counts_hits
+@condition(etag_func=thread_etag)
 def view_thread(request, thread_slug):
     thread = get_object_or_404(
-        Thread.objects.select_related('college'),
+        with_author_name(Thread.objects.select_related('college')),
         slug=thread_slug
     )
-    author = thread.author
     college = thread.college
     user = request.user
 
     if not user_belongs(request, college):
         return redirect('home')
 
-    # Preprocesses author display names for comments and thread
-    # Names maps every comment PK or 'thread' to its corresponding display name
-    anons = AnonymousName.objects.filter(thread=thread)
-    anon_names = {anon.user: f'[anonymous {anon.id}]' for anon in anons}
-    comments = thread.comments.all().select_related('author')
-    names = {
-        comment.pk: get_display_name(user=user, post=comment, anon_names=anon_names) for comment in comments
-    }
-    names['thread'] = get_display_name(user=user, post=thread, anon_names=anon_names)
-
-    comment_like_statuses = {
-        comment.pk: {'score': comment.score, 'likeStatus': 0} for comment in comments
-    }
-
-    for vote in user.commentvote_votes.prefetch_related('voter'):
-        pk = vote.comment.pk
-        is_like = vote.is_like
-        if pk in comment_like_statuses:
-            comment_like_statuses[pk]['likeStatus'] = 1 if is_like else -1
+    try:
+        roots, descendants, next_cursor = load_comment_page(thread)
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+    anon_names = get_anon_names(thread)
+    comments_html, comment_like_statuses, thread_like_status = render_comments(
+        user, thread, roots, descendants, anon_names
+    )
+    comments_html += more_comments_link(thread, next_cursor)
+    names = {'thread': get_display_name(user=user, post=thread, anon_names=anon_names)}
 
     template_name = 'forum/thread.html'
     context = {
         'college': college,
         'thread': thread,
         'names': names,
-        'comments': comments,
-        'thread_like_status': get_like_status(user, ThreadVote, thread),
-        'comment_like_statuses': comment_like_statuses
+        'comments_html': comments_html,
+        'thread_like_status': thread_like_status,
+        'comment_like_statuses': comment_like_statuses,
+        'live_updates': live_updates(request),
     }
 
     return render(request, template_name, context)
 
 
-def get_display_name(user, post, anon_names={}):
-    author = post.author
-    
-    if author == user:
-        return '[me]'
-    elif not author:
-        return '[deleted]'
-    elif post.is_anonymous:
-        if author in anon_names:
-            return anon_names[author]
-        return '[anonymous]'
-    
-    return author
+@login_required
+def thread_events(request, thread_slug):
+    thread = get_object_or_404(
+        Thread.objects.select_related('college'),
+        slug=thread_slug
+    )
+    if not user_belongs(request, thread.college):
+        return redirect('home')
+
+    if not live_updates(request):
+        # Browsers don't reconnect an EventSource answered with a 204
+        return HttpResponse(status=204)
+    return EventStreamResponse(thread_channel(thread.pk))
+
+
+@login_required
+def more_comments(request, thread_slug):
+    thread = get_object_or_404(
+        Thread.objects.select_related('college'),
+        slug=thread_slug
+    )
+    if not user_belongs(request, thread.college):
+        return redirect('home')
+
+    try:
+        roots, descendants, next_cursor = load_comment_page(
+            thread,
+            after=request.GET.get('after'),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+    comments_html, comment_like_statuses, _ = render_comments(
+        request.user, thread, roots, descendants, get_anon_names(thread)
+    )
+    data = {
+        'html': comments_html + more_comments_link(thread, next_cursor),
+        'comments': comment_like_statuses,
+    }
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+@login_required
+def comment_replies(request, comment_pk):
+    parent_comment = get_object_or_404(
+        Comment.objects.select_related('thread__college'),
+        pk=comment_pk
+    )
+    thread = parent_comment.thread
+    if not user_belongs(request, thread.college):
+        return redirect('home')
+
+    try:
+        roots, descendants, next_cursor = load_comment_page(
+            thread,
+            parent=parent_comment,
+            after=request.GET.get('after'),
+        )
+    except InvalidCursor:
+        raise Http404('Invalid page cursor')
+    comments_html, comment_like_statuses, _ = render_comments(
+        request.user, thread, roots, descendants, get_anon_names(thread)
+    )
+    if next_cursor:
+        url = reverse('comment_replies', args=[parent_comment.pk])
+        url += '?' + urlencode({'after': next_cursor})
+        comments_html += render_to_string(
+            'forum/load_more.html',
+            {'url': url, 'label': 'Load more replies'},
+        )
+    data = {
+        'html': comments_html,
+        'comments': comment_like_statuses,
+    }
+    return HttpResponse(json.dumps(data), content_type='application/json')
+
+
+def render_comments(user, thread, roots, descendants, anon_names):
+    """
+    Renders roots and the loaded descendants below them for user. Returns
+    the HTML, the score and like status of every rendered comment and the
+    user's like status on the thread itself.
+    """
+    # Public names maps every comment PK to the name everybody else sees
+    public_names = {
+        comment.pk: get_display_name(user=None, post=comment, anon_names=anon_names)
+        for comment in roots + descendants
+    }
+
+    # The comment tree is rendered without viewer-specific bits so unchanged
+    # subtrees can be served from the cache, and then personalized
+    comments = build_comment_tree(roots, descendants, public_names)
+    comments_html = personalize_comments(
+        render_comment_subtrees(roots),
+        comments,
+        user,
+        public_names,
+    )
+
+    thread_like_status, like_statuses = get_thread_like_statuses(user, thread)
+    comment_like_statuses = {
+        comment.pk: {
+            'score': comment.score,
+            'likeStatus': like_statuses.get(comment.pk, 0),
+        } for comment in comments
+    }
+    return comments_html, comment_like_statuses, thread_like_status
+
+
+# Tells open pages of thread about a comment that was just written
+def publish_new_comment(comment, thread):
+    comment = with_author_name(Comment.objects.all()).get(pk=comment.pk)
+    name = get_display_name(user=None, post=comment, anon_names=get_anon_names(thread))
+    publish_comment(comment, name)
+
+
+def more_comments_link(thread, cursor):
+    # Safe even when empty, it is added to the rendered comments
+    if not cursor:
+        return mark_safe('')
+    url = reverse('more_comments', args=[thread.slug])
+    url += '?' + urlencode({'after': cursor})
+    return render_to_string(
+        'forum/load_more.html',
+        {'url': url, 'label': 'Load more comments'},
+    )
 
 
 @login_required
 def delete_thread(request, thread_slug):
     thread = get_object_or_404(
-        Thread.objects.select_related('college', 'author'),
+        with_author_name(Thread.objects.select_related('college', 'author')),
         slug=thread_slug
     )
     college = thread.college
@@ -159,18 +390,32 @@ def delete_thread(request, thread_slug):
         return redirect(thread)
         
     if request.method == 'POST':
+        already_deleted = thread.body == DELETED_BODY
         thread.author = None
-        thread.title = '[deleted]'
-        thread.body = '[deleted]'
-        thread.save()
+        thread.title = DELETED_BODY
+        thread.body = DELETED_BODY
+        thread.edited_timestamp = now()
+        thread.generation = F('generation') + 1
+        with transaction.atomic():
+            thread.save(update_fields=THREAD_EDIT_FIELDS)
+            # The UPDATE locks the row, so no vote changes the score taken
+            # off the author's karma
+            thread.refresh_from_db(fields=THREAD_COUNTER_FIELDS)
+            if not already_deleted:
+                count_thread_deleted(thread, author.pk if author else None)
+            index_thread_task.enqueue(pk=thread.pk)
+        publish_delete('thread', thread.pk, thread.pk)
         alert(request, 'Thread successfully deleted!', 'success')
         return redirect(college)
 
+    names = {'thread': get_display_name(user=user, post=thread, anon_names=get_anon_names(thread))}
+
     template_name = 'forum/delete_thread.html'
     context = {
         'thread': thread,
         'college': college,
         'author': author,
+        'names': names,
     }
     return render(request, template_name, context)
 
@@ -181,7 +426,6 @@ def edit_thread(request, thread_slug):
         Thread.objects.select_related('author'),
         slug=thread_slug
     )
-    user = request.user
 
     author = thread.author
     if not user_owns(request, author):
@@ -192,7 +436,13 @@ def edit_thread(request, thread_slug):
         if form.is_valid():
             thread.title = form.cleaned_data['title']
             thread.body = form.cleaned_data['body']
-            thread.save()
+            thread.edited_timestamp = now()
+            thread.generation = F('generation') + 1
+            with transaction.atomic():
+                thread.save(update_fields=THREAD_EDIT_FIELDS)
+                thread.refresh_from_db(fields=THREAD_COUNTER_FIELDS)
+                index_thread_task.enqueue(pk=thread.pk)
+            publish_edit('thread', thread, thread.pk)
             alert(request, 'Thread successfully updated!', 'success')
             return redirect(thread)
         else:
@@ -231,10 +481,14 @@ def create_comment(request, thread_slug):
                 body=form.cleaned_data['body'],
                 is_anonymous=form.cleaned_data['is_anonymous'],
             )
-            new_comment.save()
-            AnonymousName.objects.get_or_create(user=user, thread=thread)
-            thread.comments_count += 1
-            thread.save()
+            with transaction.atomic():
+                new_comment.save()
+                count_comment_created(new_comment, thread)
+                index_comment_task.enqueue(pk=new_comment.pk)
+                # Written here rather than in a task, the name is published
+                # right below
+                AnonymousName.objects.get_or_create(user=user, thread=thread)
+            publish_new_comment(new_comment, thread)
             alert(request, 'Comment successfully created!', 'success')
             return redirect(thread)
         else:
@@ -261,6 +515,10 @@ def reply_comment(request, comment_pk):
     if not user_belongs(request, college):
         return redirect('home')
 
+    if parent_comment.depth >= MAX_COMMENT_DEPTH:
+        alert(request, 'This conversation is nested too deeply to reply to.', 'warning')
+        return redirect(thread)
+
     if request.method == 'POST':
         form = CommentForm(request.POST)
         if form.is_valid():
@@ -271,9 +529,11 @@ def reply_comment(request, comment_pk):
                 is_anonymous=form.cleaned_data['is_anonymous'],
                 parent=parent_comment
             )
-            new_comment.save()
-            thread.comments_count += 1
-            thread.save()
+            with transaction.atomic():
+                new_comment.save()
+                count_comment_created(new_comment, thread)
+                index_comment_task.enqueue(pk=new_comment.pk)
+            publish_new_comment(new_comment, thread)
             alert(request, 'Comment successfully created!', 'success')
             return redirect(thread)
         else:
@@ -293,7 +553,6 @@ def edit_comment(request, comment_pk):
         Comment.objects.select_related('author', 'thread'),
         pk=comment_pk
     )
-    author = comment.author
     thread = comment.thread
     user = request.user
 
@@ -305,7 +564,13 @@ def edit_comment(request, comment_pk):
         form = CommentEditForm(request.POST)
         if form.is_valid():
             comment.body = form.cleaned_data['body']
-            comment.save()
+            comment.edited_timestamp = now()
+            with transaction.atomic():
+                comment.save(update_fields=COMMENT_EDIT_FIELDS)
+                comment.refresh_from_db(fields=COMMENT_COUNTER_FIELDS)
+                Thread.objects.filter(pk=thread.pk).update(generation=F('generation') + 1)
+                index_comment_task.enqueue(pk=comment.pk)
+            publish_edit('comment', comment, thread.pk)
             alert(request, 'Comment successfully updated!', 'success')
             return redirect(thread)
         else:
@@ -335,8 +600,14 @@ def delete_comment(request, comment_pk):
 
     if request.method == 'POST':
         comment.author = None
-        comment.body = '[deleted]'
-        comment.save()
+        comment.body = DELETED_BODY
+        comment.edited_timestamp = now()
+        with transaction.atomic():
+            comment.save(update_fields=COMMENT_EDIT_FIELDS)
+            comment.refresh_from_db(fields=COMMENT_COUNTER_FIELDS)
+            count_comment_deleted(comment, thread, author.pk)
+            index_comment_task.enqueue(pk=comment.pk)
+        publish_delete('comment', comment.pk, thread.pk)
         alert(request, 'Comment successfully deleted!', 'success')
         return redirect(thread)
 
@@ -366,89 +637,13 @@ def like_thread(request, thread_slug):
     if isinstance(has_liked, bool):
         data = {
             'success': True,
-            'likeStatus': update_like_status(user, ThreadVote, thread, has_liked),
+            'likeStatus': cast_vote(user, ThreadVote, thread, has_liked),
             'newScore': thread.score
         }
 
     return HttpResponse(json.dumps(data), content_type='application/json')
 
 
-# Returns if the user has disliked (-1), liked (+1), or neither yet (0).
-def get_like_status(user, VoteClass, foreign_key):
-    like_status = 0
-    try:
-        kwargs = {'voter': user}
-        if isinstance(foreign_key, Thread):
-            kwargs['thread'] = foreign_key
-        else:
-            kwargs['comment'] = foreign_key
-
-        vote = VoteClass.objects.get(**kwargs)
-        like_status = 1 if vote.is_like else -1
-    except:
-        pass
-
-    return like_status
-
-
-def update_like_status(user, VoteClass, foreign_key, has_liked):
-    foreign_keys = {
-        ThreadVote: {
-            'fk_model': Thread,
-            'fk_string': 'thread',
-        },
-        CommentVote: {
-            'fk_model': Comment,
-            'fk_string': 'comment',
-        }
-    }
-    if VoteClass not in foreign_keys:
-        raise ValueError('Incorrect vote_class')
-    if not isinstance(foreign_key, foreign_keys[VoteClass]['fk_model']):
-        raise ValueError('Incorrect foreign key for that vote')
-
-    try:
-        fk_string = foreign_keys[VoteClass]['fk_string']
-        kwargs = {
-            'voter': user,
-            fk_string: foreign_key,
-        }
-        curr_vote = VoteClass.objects.get(**kwargs)
-        if curr_vote.is_like:
-            if has_liked:  # case: hit like once, hit like again to toggle
-                like_status = 0
-                foreign_key.score -= 1
-                curr_vote.delete()
-            else:  # case: hit like once, hit dislike
-                like_status = -1
-                curr_vote.is_like = False
-                curr_vote.save()
-                foreign_key.score -= 2
-        else:
-            if has_liked:  # case: hit dislike once, hit like
-                like_status = 1
-                curr_vote.is_like = True
-                curr_vote.save()
-                foreign_key.score += 2
-            else:  # case: hit dislike once, hit dislike again to toggle
-                like_status= 0
-                foreign_key.score += 1
-                curr_vote.delete()
-    except VoteClass.DoesNotExist:
-        kwargs['is_like'] = has_liked
-        new_vote = VoteClass(**kwargs)
-        new_vote.save()
-        if has_liked:  # case: hit like once
-            like_status = 1
-            foreign_key.score += 1
-        else:  # case: hit dislike once
-            like_status = -1
-            foreign_key.score -= 1
-
-    foreign_key.save()
-    return like_status
-
-
 @login_required
 @require_POST
 def like_comment(request, comment_pk):
@@ -467,10 +662,74 @@ def like_comment(request, comment_pk):
     if isinstance(has_liked, bool):
         result = {
             'success': True,
-            'likeStatus': update_like_status(user, CommentVote, comment, has_liked),
+            'likeStatus': cast_vote(user, CommentVote, comment, has_liked),
             'newScore': comment.score
         }
         return HttpResponse(
             json.dumps(result),
             content_type='application/json'
         )
+
+
+# Votes a single batch may contain, keyed by the target types it accepts
+MAX_BATCH_VOTES = 100
+BATCH_VOTE_TARGETS = {
+    'thread': (ThreadVote, Thread, 'college_id'),
+    'comment': (CommentVote, Comment, 'thread__college_id'),
+}
+
+
+def batch_vote_error(message):
+    return HttpResponse(
+        json.dumps({'success': False, 'error': message}),
+        content_type='application/json',
+        status=400,
+    )
+
+
+@login_required
+@require_POST
+def vote_batch(request):
+    """
+    Applies a list of {target_type, pk, hasLiked} clicks in order, with the
+    same toggling as like_thread and like_comment, and returns the score and
+    like status of every target.
+    """
+    user = request.user
+    try:
+        votes = json.loads(request.POST['votes'])
+    except (KeyError, ValueError):
+        return batch_vote_error('Expected a JSON list of votes')
+    if not isinstance(votes, list) or len(votes) > MAX_BATCH_VOTES:
+        return batch_vote_error(f'Expected a list of at most {MAX_BATCH_VOTES} votes')
+
+    intents = []
+    pks = {target_type: set() for target_type in BATCH_VOTE_TARGETS}
+    for vote in votes:
+        if not isinstance(vote, dict):
+            return batch_vote_error('Every vote has to be an object')
+        target_type = vote.get('target_type')
+        pk = vote.get('pk')
+        has_liked = vote.get('hasLiked')
+        if (target_type not in BATCH_VOTE_TARGETS or type(pk) is not int
+                or not isinstance(has_liked, bool)):
+            return batch_vote_error(f'Invalid vote {vote!r}')
+        intents.append((BATCH_VOTE_TARGETS[target_type][0], pk, has_liked))
+        pks[target_type].add(pk)
+
+    # Every target has to exist and belong to the user's college
+    for target_type, (_, model, college_field) in BATCH_VOTE_TARGETS.items():
+        targets = model.objects.filter(pk__in=pks[target_type])
+        if not user.is_staff:
+            targets = targets.filter(**{college_field: user.college_id})
+        if targets.count() != len(pks[target_type]):
+            return batch_vote_error(f'Unknown {target_type}')
+
+    results = cast_votes(user, intents)
+    data = {'success': True}
+    for target_type, (VoteClass, _, _) in BATCH_VOTE_TARGETS.items():
+        data[target_type + 's'] = {
+            pk: {'score': score, 'likeStatus': like_status}
+            for pk, (score, like_status) in results.get(VoteClass, {}).items()
+        }
+    return HttpResponse(json.dumps(data), content_type='application/json')
@@ -0,0 +1,216 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+
+from .buffers import LoggedFlusher
+from .models import ThreadVote, CommentVote
+from .votes import (
+    VOTE_TARGETS,
+    apply_vote_intents,
+    apply_vote_states,
+    get_like_status,
+    get_vote_target,
+    next_like_status,
+    update_like_status,
+)
+
+
+logger = logging.getLogger(__name__)
+
+VOTE_CLASSES = {
+    'thread': ThreadVote,
+    'comment': CommentVote,
+}
+
+
+def buffer_enabled():
+    return getattr(settings, 'VOTE_BUFFER_ENABLED', False)
+
+
+def cast_vote(user, VoteClass, foreign_key, has_liked):
+    """
+    Entry point for the like views. Without the buffer this is just
+    update_like_status, with it the vote is recorded in memory and written
+    to the database by the next flush.
+    """
+    if not buffer_enabled():
+        return update_like_status(user, VoteClass, foreign_key, has_liked)
+    return get_vote_buffer().record(user, VoteClass, foreign_key, has_liked)
+
+
+def cast_votes(user, intents):
+    """
+    Entry point for the batch vote view, takes the same intents and returns
+    the same results as apply_vote_intents.
+    """
+    if not buffer_enabled():
+        return apply_vote_intents(user, intents)
+
+    buffer = get_vote_buffer()
+    targets = {}
+    for VoteClass, target_pk, _ in intents:
+        targets.setdefault(VoteClass, set()).add(target_pk)
+    scores = {
+        VoteClass: dict(VOTE_TARGETS[VoteClass]['fk_model'].objects.filter(
+            pk__in=pks,
+        ).values_list('pk', 'score'))
+        for VoteClass, pks in targets.items()
+    }
+
+    results = {VoteClass: {} for VoteClass in targets}
+    for VoteClass, target_pk, has_liked in intents:
+        if target_pk not in scores[VoteClass]:
+            continue
+        # record() adds the buffered votes to the score it is given, so every
+        # click starts from the score in the database
+        foreign_key = VOTE_TARGETS[VoteClass]['fk_model'](
+            pk=target_pk, score=scores[VoteClass][target_pk]
+        )
+        like_status = buffer.record(user, VoteClass, foreign_key, has_liked)
+        results[VoteClass][target_pk] = (foreign_key.score, like_status)
+    return results
+
+
+class PendingVote:
+    def __init__(self, base_status, like_status):
+        # base_status is the status stored in the database when the vote was
+        # first buffered, or None when it is not known (replayed votes)
+        self.base_status = base_status
+        self.like_status = like_status
+
+    @property
+    def delta(self):
+        if self.base_status is None:
+            return 0
+        return self.like_status - self.base_status
+
+
+class VoteBuffer(LoggedFlusher):
+    """
+    Coalesces votes in memory and writes them in batches.
+
+    Every buffered vote stores the like status it should end up with rather
+    than the click that produced it, and is logged (see LoggedFlusher)
+    before it is acknowledged. Replaying the log after a crash therefore
+    writes the same final statuses again, which is harmless even if some of
+    them had already been flushed.
+    """
+
+    def __init__(self, log_path, flush_interval):
+        super(VoteBuffer, self).__init__(log_path, flush_interval)
+        self.flush_lock = threading.Lock()
+        self.pending = {}  # (fk_string, target_pk, voter_pk) -> PendingVote
+        self.flushing = {}  # the batch being written by flush()
+        replayed = self.replay()
+        if replayed:
+            logger.info('Replaying %d buffered votes', replayed)
+
+    def log_entry(self, key, like_status):
+        fk_string, target_pk, voter_pk = key
+        return {'target': fk_string, 'pk': target_pk, 'voter': voter_pk, 'status': like_status}
+
+    def log_entries(self):
+        return [self.log_entry(key, vote.like_status) for key, vote in self.pending.items()]
+
+    def replay_entry(self, entry):
+        key = (entry['target'], entry['pk'], entry['voter'])
+        self.pending[key] = PendingVote(None, entry['status'])
+
+    def start_pending(self, key, db_status):
+        """
+        Buffers a new vote for key, starting from the status it has in the
+        database: that of the same vote being flushed right now, or
+        db_status. Returns None if neither is known. Needs self.lock.
+        """
+        in_flight = self.flushing.get(key)
+        base_status = in_flight.like_status if in_flight else db_status
+        if base_status is None:
+            return None
+        pending = PendingVote(base_status, base_status)
+        self.pending[key] = pending
+        return pending
+
+    def record(self, user, VoteClass, foreign_key, has_liked):
+        fk_string = get_vote_target(VoteClass, foreign_key)['fk_string']
+        key = (fk_string, foreign_key.pk, user.pk)
+
+        db_status = None
+        while True:
+            with self.lock:
+                pending = self.pending.get(key) or self.start_pending(key, db_status)
+                if pending is not None:
+                    pending.like_status = next_like_status(pending.like_status, has_liked)
+                    self.append_log(self.log_entry(key, pending.like_status))
+
+                    # foreign_key.score was just read from the database, so
+                    # adding everything still buffered or being flushed for
+                    # it gives the optimistic score
+                    foreign_key.score += sum(
+                        vote.delta
+                        for votes in (self.pending, self.flushing)
+                        for (target, pk, _), vote in votes.items()
+                        if target == fk_string and pk == foreign_key.pk
+                    )
+                    like_status = pending.like_status
+                    break
+            # Read outside the lock, the database is the slow part
+            db_status = get_like_status(user, VoteClass, foreign_key)
+
+        self.schedule_flush()
+        return like_status
+
+    def flush(self):
+        """
+        Writes every buffered vote in one transaction per vote class and
+        returns how many votes were written.
+        """
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, {}
+                # Votes cast meanwhile start from these, not from the
+                # database they are not in yet
+                self.flushing = batch
+            if not batch:
+                return 0
+
+            states = {fk_string: {} for fk_string in VOTE_CLASSES}
+            for (fk_string, target_pk, voter_pk), vote in batch.items():
+                states[fk_string][(target_pk, voter_pk)] = vote.like_status
+
+            try:
+                for fk_string, VoteClass in VOTE_CLASSES.items():
+                    apply_vote_states(VoteClass, states[fk_string])
+            except Exception:
+                # Votes buffered since the batch was taken are newer and win,
+                # but started from the batch's statuses
+                with self.lock:
+                    self.flushing = {}
+                    for key, vote in batch.items():
+                        if key in self.pending:
+                            self.pending[key].base_status = vote.base_status
+                        else:
+                            self.pending[key] = vote
+                raise
+
+            # The log only has to cover what is still buffered now
+            with self.lock:
+                self.flushing = {}
+                self.rewrite_log()
+            return len(batch)
+
+vote_buffer = None
+vote_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    global vote_buffer
+    with vote_buffer_lock:
+        if vote_buffer is None:
+            vote_buffer = VoteBuffer(
+                log_path=settings.VOTE_BUFFER_LOG,
+                flush_interval=settings.VOTE_BUFFER_FLUSH_INTERVAL,
+            )
+            atexit.register(vote_buffer.flush)
+    return vote_buffer
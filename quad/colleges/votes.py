@@ -0,0 +1,320 @@
+from django.db import IntegrityError, transaction
+from django.db.models import F, Case, When, Value, IntegerField, FloatField
+
+from .counters import shift_karma
+from .live import publish_score
+from .models import Thread, Comment, ThreadVote, CommentVote
+from .ranking import hot_rank
+from .signals import send_threads_changed
+
+
+VOTE_TARGETS = {
+    ThreadVote: {
+        'fk_model': Thread,
+        'fk_string': 'thread',
+    },
+    CommentVote: {
+        'fk_model': Comment,
+        'fk_string': 'comment',
+    },
+}
+
+# A vote that could not be inserted because a concurrent request inserted
+# the same (voter, target) row first is retried this many times
+MAX_VOTE_ATTEMPTS = 3
+
+
+def get_vote_target(VoteClass, foreign_key=None):
+    if VoteClass not in VOTE_TARGETS:
+        raise ValueError('Incorrect vote_class')
+    target = VOTE_TARGETS[VoteClass]
+    if foreign_key is not None and not isinstance(foreign_key, target['fk_model']):
+        raise ValueError('Incorrect foreign key for that vote')
+    return target
+
+
+def to_like_status(is_like):
+    if is_like is None:
+        return 0
+    return 1 if is_like else -1
+
+
+# Liking twice (or disliking twice) toggles the vote back off
+def next_like_status(like_status, has_liked):
+    target_status = 1 if has_liked else -1
+    return 0 if like_status == target_status else target_status
+
+
+# Returns if the user has disliked (-1), liked (+1), or neither yet (0).
+def get_like_status(user, VoteClass, foreign_key):
+    fk_string = get_vote_target(VoteClass, foreign_key)['fk_string']
+    is_like = VoteClass.objects.filter(
+        voter=user,
+        **{fk_string: foreign_key}
+    ).values_list('is_like', flat=True).first()
+    return to_like_status(is_like)
+
+
+def get_thread_like_statuses(user, thread):
+    """
+    Returns the user's like status on thread and a dict mapping the pks of
+    the thread's comments the user voted on to their like statuses. Both
+    come from a single query scoped to the thread.
+    """
+    thread_votes = ThreadVote.objects.filter(
+        voter=user,
+        thread=thread,
+    ).values_list('is_like', Value(None, output_field=IntegerField()))
+    comment_votes = CommentVote.objects.filter(
+        voter=user,
+        comment__thread=thread,
+    ).values_list('is_like', 'comment_id')
+
+    thread_like_status = 0
+    comment_like_statuses = {}
+    for is_like, comment_pk in thread_votes.union(comment_votes, all=True):
+        if comment_pk is None:
+            thread_like_status = to_like_status(is_like)
+        else:
+            comment_like_statuses[comment_pk] = to_like_status(is_like)
+    return thread_like_status, comment_like_statuses
+
+
+def update_like_status(user, VoteClass, foreign_key, has_liked):
+    """
+    Toggles user's vote on foreign_key and returns the new like status.
+    foreign_key.score is refreshed with the score that was committed.
+    """
+    get_vote_target(VoteClass, foreign_key)
+
+    for attempt in range(MAX_VOTE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return _update_like_status(user, VoteClass, foreign_key, has_liked)
+        except IntegrityError:
+            if attempt == MAX_VOTE_ATTEMPTS - 1:
+                raise
+
+
+def apply_vote_intents(user, intents):
+    """
+    Applies many of user's clicks at once. intents is a list of
+    (VoteClass, target_pk, has_liked) toggled in order, exactly as if every
+    one of them went through update_like_status, but with a few bulk
+    queries per VoteClass in a single transaction. Returns a dict mapping
+    every VoteClass to {target_pk: (score, like_status)}.
+    """
+    by_class = {}
+    for VoteClass, target_pk, has_liked in intents:
+        get_vote_target(VoteClass)
+        by_class.setdefault(VoteClass, []).append((target_pk, has_liked))
+
+    results = {}
+    with transaction.atomic():
+        for VoteClass, class_intents in by_class.items():
+            target = VOTE_TARGETS[VoteClass]
+            fk_id = target['fk_string'] + '_id'
+            like_statuses = {target_pk: 0 for target_pk, _ in class_intents}
+            votes = VoteClass.objects.select_for_update().filter(**{
+                'voter': user,
+                f'{fk_id}__in': like_statuses,
+            }).values_list(fk_id, 'is_like')
+            for target_pk, is_like in votes:
+                like_statuses[target_pk] = to_like_status(is_like)
+
+            for target_pk, has_liked in class_intents:
+                like_statuses[target_pk] = next_like_status(like_statuses[target_pk], has_liked)
+            apply_vote_states(VoteClass, {
+                (target_pk, user.pk): like_status
+                for target_pk, like_status in like_statuses.items()
+            })
+
+            scores = target['fk_model'].objects.filter(
+                pk__in=like_statuses,
+            ).values_list('pk', 'score')
+            results[VoteClass] = {
+                target_pk: (score, like_statuses[target_pk]) for target_pk, score in scores
+            }
+    return results
+
+
+def _update_like_status(user, VoteClass, foreign_key, has_liked):
+    target = VOTE_TARGETS[VoteClass]
+    fk_string = target['fk_string']
+    kwargs = {
+        'voter': user,
+        fk_string: foreign_key,
+    }
+
+    curr_vote = VoteClass.objects.select_for_update().filter(
+        **kwargs
+    ).values_list('pk', 'is_like').first()
+    if curr_vote:
+        vote_pk, is_like = curr_vote
+    else:
+        vote_pk, is_like = None, None
+
+    old_status = to_like_status(is_like)
+    like_status = next_like_status(old_status, has_liked)
+
+    if like_status == 0:
+        VoteClass.objects.filter(pk=vote_pk).delete()
+    elif vote_pk is None:
+        # The unique (voter, target) constraint turns a concurrent duplicate
+        # into an IntegrityError, which update_like_status retries
+        VoteClass.objects.create(is_like=(like_status == 1), **kwargs)
+    else:
+        VoteClass.objects.filter(pk=vote_pk).update(is_like=(like_status == 1))
+
+    apply_score_delta(foreign_key, like_status - old_status)
+    return like_status
+
+
+# Shifts foreign_key's score (and its author's karma) by delta in a single
+# UPDATE on the score column and refreshes foreign_key.score (and a thread's
+# rank) from the database. A comment's thread gets a new generation with one
+# more UPDATE.
+def apply_score_delta(foreign_key, delta):
+    model = type(foreign_key)
+    rows = model.objects.filter(pk=foreign_key.pk)
+    if delta:
+        if model is Thread:
+            rows.update(score=F('score') + delta, generation=F('generation') + 1)
+        else:
+            rows.update(score=F('score') + delta)
+            Thread.objects.filter(pk=foreign_key.thread_id).update(
+                generation=F('generation') + 1
+            )
+
+    if isinstance(foreign_key, Thread):
+        score, comments_count, timestamp = rows.values_list(
+            'score', 'comments_count', 'timestamp'
+        ).get()
+        rank = hot_rank(score, comments_count, timestamp)
+        if delta:
+            rows.update(rank=rank)
+            send_threads_changed({foreign_key.college_id})
+        foreign_key.comments_count = comments_count
+        foreign_key.rank = rank
+        target, thread_id = 'thread', foreign_key.pk
+    else:
+        score = rows.values_list('score', flat=True).get()
+        target, thread_id = 'comment', foreign_key.thread_id
+
+    foreign_key.score = score
+    if delta:
+        # Last, like posting locks the thread, then the college, then users
+        shift_karma({foreign_key.author_id: delta})
+        publish_score(target, foreign_key.pk, thread_id, score)
+
+
+def apply_vote_states(VoteClass, states):
+    """
+    Writes many votes of one VoteClass at once. states maps
+    (target_pk, voter_pk) to the like status each vote should end up with.
+    Returns the net score change of every target that changed.
+    """
+    get_vote_target(VoteClass)
+
+    for attempt in range(MAX_VOTE_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return _apply_vote_states(VoteClass, states)
+        except IntegrityError:
+            if attempt == MAX_VOTE_ATTEMPTS - 1:
+                raise
+
+
+def _apply_vote_states(VoteClass, states):
+    target = VOTE_TARGETS[VoteClass]
+    fk_id = target['fk_string'] + '_id'
+    if not states:
+        return {}
+
+    # One query for every existing vote, narrowed down to exact pairs here
+    existing = {}
+    votes = VoteClass.objects.select_for_update().filter(**{
+        f'{fk_id}__in': {target_pk for target_pk, _ in states},
+        'voter_id__in': {voter_pk for _, voter_pk in states},
+    }).values_list(fk_id, 'voter_id', 'pk', 'is_like')
+    for target_pk, voter_pk, vote_pk, is_like in votes:
+        if (target_pk, voter_pk) in states:
+            existing[(target_pk, voter_pk)] = (vote_pk, to_like_status(is_like))
+
+    new_votes = []
+    likes, dislikes, deletes = [], [], []
+    deltas = {}
+    for (target_pk, voter_pk), like_status in states.items():
+        vote_pk, old_status = existing.get((target_pk, voter_pk), (None, 0))
+        if like_status == old_status:
+            continue
+
+        if like_status == 0:
+            deletes.append(vote_pk)
+        elif vote_pk is None:
+            new_votes.append(VoteClass(
+                voter_id=voter_pk,
+                is_like=(like_status == 1),
+                **{fk_id: target_pk}
+            ))
+        elif like_status == 1:
+            likes.append(vote_pk)
+        else:
+            dislikes.append(vote_pk)
+        deltas[target_pk] = deltas.get(target_pk, 0) + like_status - old_status
+
+    VoteClass.objects.bulk_create(new_votes)
+    if likes:
+        VoteClass.objects.filter(pk__in=likes).update(is_like=True)
+    if dislikes:
+        VoteClass.objects.filter(pk__in=dislikes).update(is_like=False)
+    if deletes:
+        VoteClass.objects.filter(pk__in=deletes).delete()
+
+    deltas = {pk: delta for pk, delta in deltas.items() if delta}
+    apply_score_deltas(target['fk_model'], deltas)
+    return deltas
+
+
+# Same as apply_score_delta, for many rows of one model in a single UPDATE.
+# Thread ranks are refreshed with one more read and one more UPDATE, the
+# generations of comments' threads with one more UPDATE, and authors' karma
+# with one more UPDATE.
+def apply_score_deltas(model, deltas):
+    if not deltas:
+        return
+
+    rows = model.objects.filter(pk__in=deltas)
+    scores = {'score': F('score') + Case(
+        *[When(pk=pk, then=Value(delta)) for pk, delta in deltas.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )}
+    if model is Thread:
+        rows.update(generation=F('generation') + 1, **scores)
+    else:
+        rows.update(**scores)
+
+    karma = {}
+    if model is Thread:
+        ranks = []
+        college_ids = set()
+        for pk, author_id, college_id, score, comments_count, timestamp in rows.values_list(
+            'pk', 'author_id', 'college_id', 'score', 'comments_count', 'timestamp'
+        ):
+            ranks.append(When(pk=pk, then=Value(hot_rank(score, comments_count, timestamp))))
+            college_ids.add(college_id)
+            karma[author_id] = karma.get(author_id, 0) + deltas[pk]
+            publish_score('thread', pk, pk, score)
+        rows.update(rank=Case(*ranks, default=F('rank'), output_field=FloatField()))
+        send_threads_changed(college_ids)
+    else:
+        thread_ids = set()
+        for pk, author_id, thread_id, score in rows.values_list(
+            'pk', 'author_id', 'thread_id', 'score'
+        ):
+            thread_ids.add(thread_id)
+            karma[author_id] = karma.get(author_id, 0) + deltas[pk]
+            publish_score('comment', pk, thread_id, score)
+        Thread.objects.filter(pk__in=thread_ids).update(generation=F('generation') + 1)
+    shift_karma(karma)
@@ -9,8 +9,13 @@ https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'quad.settings')
+django.setup(set_prefix=False)
 
-application = get_asgi_application()
+# Django's own handler would run every view on asyncio's default executor,
+# see quad.handlers for why the pools are split and bounded
+from .handlers import PooledASGIHandler
+
+application = PooledASGIHandler()
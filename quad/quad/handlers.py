@@ -0,0 +1,229 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core import signals
+from django.core.handlers.asgi import ASGIHandler
+from django.core.exceptions import RequestAborted
+from django.urls import set_script_prefix
+
+
+# Methods that only read, served from the read pool
+READ_METHODS = {'GET', 'HEAD', 'OPTIONS'}
+
+# Parts of a streaming body produced ahead of the client
+STREAM_PARTS_AHEAD = 8
+
+# Ends the queue of a streaming body
+END_OF_BODY = object()
+
+
+class PooledASGIHandler(ASGIHandler):
+    """
+    ASGI handler that runs Django's synchronous views on two bounded thread
+    pools, one for reads and one for writes, instead of asyncio's shared
+    default executor.
+
+    Reading the request and sending the response happen on the event loop,
+    so a slow client only holds a thread while its view actually runs and
+    one process can keep many more of them waiting. The pool sizes bound
+    the number of database connections, and writes (which SQLite serializes
+    anyway) can never use up the threads the read path needs.
+
+    Django's database connections belong to the thread that opened them,
+    so the view, the iteration of a streaming body (which may hold a
+    server-side cursor) and the close() that sends request_finished all run
+    in one call on one pool thread. It hands the body's parts to the event
+    loop through a small queue, and keeps its thread until the body is
+    sent. Only bodies produced on the event loop (see send_async_stream)
+    give their thread back early, so they must not query.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.read_executor = ThreadPoolExecutor(
+            max_workers=settings.ASGI_READ_THREADS,
+            thread_name_prefix='asgi-read',
+        )
+        self.write_executor = ThreadPoolExecutor(
+            max_workers=settings.ASGI_WRITE_THREADS,
+            thread_name_prefix='asgi-write',
+        )
+
+    def get_executor(self, request):
+        if request.method in READ_METHODS:
+            return self.read_executor
+        return self.write_executor
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            raise ValueError(
+                'Django can only handle ASGI/HTTP connections, not %s.'
+                % scope['type']
+            )
+        try:
+            body_file = await self.read_body(receive)
+        except RequestAborted:
+            return
+
+        request, error_response = self.create_request(scope, body_file)
+        if request is None:
+            await self.send_response(error_response, send)
+            return
+        # Tells views that async_stream() bodies are sent without a thread
+        request.sends_async_streams = True
+
+        executor = self.get_executor(request)
+        loop = asyncio.get_event_loop()
+        parts = asyncio.Queue(maxsize=STREAM_PARTS_AHEAD)
+        stopped = threading.Event()
+        serving = loop.run_in_executor(
+            executor, self.serve, scope, request, loop, parts, stopped
+        )
+        # The response comes first through the queue, a streaming body's
+        # parts after it
+        first = asyncio.ensure_future(parts.get())
+        await asyncio.wait({first, serving}, return_when=asyncio.FIRST_COMPLETED)
+        if not first.done():
+            first.cancel()
+            serving.result()
+        response = first.result()
+        if hasattr(response, 'async_stream'):
+            await serving
+            await self.send_async_stream(response, receive, send, loop, executor)
+        elif response.streaming:
+            await self.send_pooled_stream(response, send, parts, stopped, serving)
+        else:
+            await serving
+            await self.send_response(response, send)
+
+    def serve(self, scope, request, loop, parts, stopped):
+        """
+        Runs the view and puts the response into parts, followed by the
+        body of a streaming response and END_OF_BODY. Waits while parts is
+        full, and stops producing once stopped is set.
+        """
+        def put(item):
+            asyncio.run_coroutine_threadsafe(parts.put(item), loop).result()
+
+        response = self.respond(scope, request)
+        put(response)
+        if not response.streaming or hasattr(response, 'async_stream'):
+            return
+        try:
+            for part in response:
+                if stopped.is_set():
+                    break
+                put(part)
+        finally:
+            try:
+                response.close()
+            finally:
+                put(END_OF_BODY)
+
+    def respond(self, scope, request):
+        set_script_prefix(self.get_script_prefix(scope))
+        signals.request_started.send(sender=self.__class__, scope=scope)
+        response = self.get_response(request)
+        response._handler_class = self.__class__
+        if not response.streaming:
+            # The body is already rendered, so the request is finished as
+            # far as the database is concerned
+            response.close()
+        return response
+
+    async def send_pooled_stream(self, response, send, parts, stopped, serving):
+        """
+        Sends the parts serve() produces for a streaming response. If the
+        client goes away, serve() is stopped and the parts it already
+        produced are thrown away, so it never waits on a full queue.
+        """
+        finished = False
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': self.response_headers(response),
+            })
+            while True:
+                part = await parts.get()
+                if part is END_OF_BODY:
+                    finished = True
+                    break
+                for chunk, _ in self.chunk_bytes(part):
+                    await send({
+                        'type': 'http.response.body',
+                        'body': chunk,
+                        'more_body': True,
+                    })
+            # Raises what broke the body instead of ending it as if complete
+            await serving
+            await send({'type': 'http.response.body'})
+        finally:
+            stopped.set()
+            while not finished:
+                finished = await parts.get() is END_OF_BODY
+            await serving
+
+    async def send_async_stream(self, response, receive, send, loop, executor):
+        """
+        Sends responses that can produce their body on the event loop (like
+        colleges.live.EventStreamResponse) without taking up a thread, until
+        the body ends or the client goes away.
+        """
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': self.response_headers(response),
+        })
+        disconnected = asyncio.ensure_future(receive())
+        stream = response.async_stream()
+        try:
+            while True:
+                part = asyncio.ensure_future(stream.__anext__())
+                await asyncio.wait({part, disconnected}, return_when=asyncio.FIRST_COMPLETED)
+                if not part.done():
+                    part.cancel()
+                    await asyncio.gather(part, return_exceptions=True)
+                    break
+                try:
+                    body = part.result()
+                except StopAsyncIteration:
+                    await send({'type': 'http.response.body'})
+                    break
+                await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+        finally:
+            disconnected.cancel()
+            await stream.aclose()
+            await loop.run_in_executor(executor, response.close)
+
+    async def send_response(self, response, send):
+        # Streaming responses were closed by serve() and the others by
+        # respond(), in the thread that ran the view
+        await send({
+            'type': 'http.response.start',
+            'status': response.status_code,
+            'headers': self.response_headers(response),
+        })
+        for chunk, last in self.chunk_bytes(response.content):
+            await send({
+                'type': 'http.response.body',
+                'body': chunk,
+                'more_body': not last,
+            })
+
+    @staticmethod
+    def response_headers(response):
+        headers = []
+        for header, value in response.items():
+            if isinstance(header, str):
+                header = header.encode('ascii')
+            if isinstance(value, str):
+                value = value.encode('latin1')
+            headers.append((bytes(header), bytes(value)))
+        for cookie in response.cookies.values():
+            headers.append(
+                (b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+            )
+        return headers
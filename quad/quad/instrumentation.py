@@ -0,0 +1,187 @@
+import json
+import logging
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse, Http404
+from django.template.backends.django import DjangoTemplates
+
+
+logger = logging.getLogger(__name__)
+
+# Metrics of the request the current thread is serving
+current = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.rendering = False
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.sql_time += time.perf_counter() - start
+
+
+def current_metrics():
+    return getattr(current, 'metrics', None)
+
+
+class TimedTemplate:
+    """
+    Wraps a backend template to add its render time to the current request.
+    Templates rendered while another one is rendering (by template tags,
+    say) are already part of the outer render's time.
+    """
+
+    def __init__(self, template):
+        self.template = template
+
+    def __getattr__(self, name):
+        return getattr(self.template, name)
+
+    def render(self, context=None, request=None):
+        metrics = current_metrics()
+        if metrics is None or metrics.rendering:
+            return self.template.render(context, request)
+        metrics.rendering = True
+        start = time.perf_counter()
+        try:
+            return self.template.render(context, request)
+        finally:
+            metrics.template_time += time.perf_counter() - start
+            metrics.rendering = False
+
+
+class InstrumentedTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code))
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name))
+
+
+class ViewStats:
+    """
+    Running totals of every view's requests, kept in memory per process.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def record(self, view_name, metrics, total_time):
+        with self.lock:
+            stats = self.views.setdefault(view_name, {
+                'requests': 0,
+                'queries': 0,
+                'max_queries': 0,
+                'sql_ms': 0.0,
+                'template_ms': 0.0,
+                'total_ms': 0.0,
+                'max_total_ms': 0.0,
+            })
+            stats['requests'] += 1
+            stats['queries'] += metrics.queries
+            stats['max_queries'] = max(stats['max_queries'], metrics.queries)
+            stats['sql_ms'] += 1000 * metrics.sql_time
+            stats['template_ms'] += 1000 * metrics.template_time
+            stats['total_ms'] += 1000 * total_time
+            stats['max_total_ms'] = max(stats['max_total_ms'], 1000 * total_time)
+
+    def summary(self):
+        with self.lock:
+            return {
+                view_name: {
+                    'requests': stats['requests'],
+                    'avg_queries': stats['queries'] / stats['requests'],
+                    'max_queries': stats['max_queries'],
+                    'avg_sql_ms': stats['sql_ms'] / stats['requests'],
+                    'avg_template_ms': stats['template_ms'] / stats['requests'],
+                    'avg_total_ms': stats['total_ms'] / stats['requests'],
+                    'max_total_ms': stats['max_total_ms'],
+                    'query_budget': settings.QUERY_BUDGETS.get(view_name),
+                }
+                for view_name, stats in self.views.items()
+            }
+
+    def clear(self):
+        with self.lock:
+            self.views.clear()
+
+
+view_stats = ViewStats()
+
+
+def check_query_budget(view_name, queries):
+    budget = settings.QUERY_BUDGETS.get(view_name)
+    if budget is None or queries <= budget:
+        return
+    message = f'{view_name} ran {queries} queries, its budget is {budget}'
+    if settings.QUERY_BUDGETS_STRICT:
+        raise QueryBudgetExceeded(message)
+    logger.warning(message)
+
+
+class InstrumentationMiddleware:
+    """
+    Counts the SQL queries of every request and times them, the template
+    renders and the whole request. The numbers go out in a Server-Timing
+    header and into view_stats, and are checked against QUERY_BUDGETS.
+
+    Queries run by streaming responses after the view returned aren't
+    counted.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        metrics = RequestMetrics()
+        current.metrics = metrics
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(metrics.record_query))
+                response = self.get_response(request)
+        finally:
+            current.metrics = None
+        total_time = time.perf_counter() - start
+
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={1000 * metrics.sql_time:.1f};desc="{metrics.queries} queries"',
+            f'tpl;dur={1000 * metrics.template_time:.1f}',
+            f'total;dur={1000 * total_time:.1f}',
+        ])
+
+        match = getattr(request, 'resolver_match', None)
+        if match is not None:
+            view_stats.record(match.view_name, metrics, total_time)
+            check_query_budget(match.view_name, metrics.queries)
+        return response
+
+
+def metrics_view(request):
+    """
+    The view_stats of this process as JSON, for staff and INTERNAL_IPS.
+    """
+    if not (request.user.is_staff or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS):
+        raise Http404
+    return HttpResponse(
+        json.dumps(view_stats.summary(), indent=2, sort_keys=True),
+        content_type='application/json',
+    )
@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'quad.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,7 +60,8 @@ ROOT_URLCONF = 'quad.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # DjangoTemplates that times renders, see quad.instrumentation
+        'BACKEND': 'quad.instrumentation.InstrumentedTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -75,6 +77,15 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'quad.wsgi.application'
 
+# Thread pools views run on under ASGI, see quad.handlers. Every thread
+# keeps its own database connection.
+ASGI_READ_THREADS = 8
+ASGI_WRITE_THREADS = 2
+
+# Live thread updates, see colleges.live
+LIVE_BROKER = 'colleges.live.LocalBroker'
+LIVE_STREAM_SECONDS = 5 * 60  # browsers reconnect after this
+
 
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
@@ -132,6 +143,13 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Resized variants of college images, see colleges.images
+IMAGE_VARIANT_WIDTHS = {
+    'logo': (64, 128, 256),
+    'banner': (640, 1280, 1920),
+}
+IMAGE_VARIANT_QUALITY = 80
+
 AUTH_USER_MODEL = 'users.MyUser'
 AUTHENTICATION_BACKENDS = (
     'django.contrib.auth.backends.ModelBackend',
@@ -142,3 +160,47 @@ LOGOUT_REDIRECT_URL = 'home'
 LOGIN_URL = 'login'
 
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
+
+# Write-behind vote buffer, see colleges.vote_buffer
+VOTE_BUFFER_ENABLED = False
+VOTE_BUFFER_FLUSH_INTERVAL = 2  # seconds
+# Every process appends its pid to the name of its log
+VOTE_BUFFER_LOG = os.path.join(BASE_DIR, 'vote_buffer.log')
+
+# Buffered thread view counter, see colleges.hits
+HIT_COUNTER_FLUSH_INTERVAL = 10  # seconds
+# Every process appends its pid to the name of its log
+HIT_COUNTER_LOG = os.path.join(BASE_DIR, 'hit_counter.log')
+HIT_COUNTER_DEDUP_SECONDS = 30 * 60  # None counts every single view
+
+# In-process cache of forum listings, see colleges.forum_cache
+FORUM_CACHE_SIZE = 256  # listings, 0 disables the cache
+FORUM_CACHE_TTL = 30  # seconds
+
+# Shared HTML of thread posts and comment cards, see colleges.fragments
+FRAGMENT_CACHE_TIMEOUT = 60  # seconds, bounds how stale "5 minutes ago" gets
+
+# Background tasks, see colleges.taskqueue. Eager tasks run in the web
+# process right after the commit, so development needs no run_tasks worker.
+TASKS_EAGER = DEBUG
+TASK_MAX_ATTEMPTS = 5
+TASK_RETRY_DELAY = 10  # seconds, doubled after every failed attempt
+TASK_LEASE_SECONDS = 5 * 60  # running tasks older than this are retried
+TASK_RETENTION_DAYS = 7  # finished tasks are purged after this
+
+# Most queries a request to each view may run (session and user lookups
+# included), see quad.instrumentation. Strict mode raises instead of
+# logging a warning, so tests fail when a view goes over its budget.
+# vote_batch has none since its queries grow with the batch.
+QUERY_BUDGETS = {
+    'forum': 7,
+    'thread': 9,
+    'more_comments': 8,
+    'comment_replies': 8,
+    'like_thread': 13,
+    'like_comment': 12,
+}
+QUERY_BUDGETS_STRICT = False
+
+# Clients allowed to read the metrics endpoint without signing in as staff
+INTERNAL_IPS = ['127.0.0.1']
@@ -18,6 +18,7 @@ from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
+from .instrumentation import metrics_view
 from .views import HomePageView
 
 
@@ -26,6 +27,7 @@ urlpatterns = [
     path('users/', include('users.urls')),
     path('users/', include('django.contrib.auth.urls')),
     path('colleges/', include('colleges.urls')),
+    path('metrics/', metrics_view, name='metrics'),
     path('', HomePageView.as_view(), name='home'),
 ]
 
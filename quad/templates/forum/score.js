@@ -55,12 +55,15 @@ document.addEventListener("DOMContentLoaded", function() {
     updateThreadButtons({{ thread_like_status }});
     updateScore(threadScore, {{ thread.score }});
 
-    const comments = {{ comment_like_statuses|safe }};
+    updateComments({{ comment_like_statuses|safe }});
+});
+
+function updateComments(comments) {
     for (let pk in comments) {
         updateCommentButtons(comments[pk]['likeStatus'], pk);
         updateScore(getCommentScore(pk), comments[pk]['score']);
     }
-});
+}
 
 function updateThreadButtons(likeStatus) {
     const hasLiked = (likeStatus === 1);
@@ -102,15 +105,34 @@ function updateScore(scoreObject, score) {
 
 const token = '{{ csrf_token }}';
 
-function handleThreadClick(hasLiked) {
+// Clicks are sent in batches, so going through a thread costs a request
+// per pause rather than a request per click
+const voteBatchDelay = 300;
+let pendingVotes = [];
+let voteBatchTimer = null;
+
+function queueVote(targetType, pk, hasLiked) {
+    pendingVotes.push({ target_type: targetType, pk: pk, hasLiked: hasLiked });
+    if (voteBatchTimer === null) {
+        voteBatchTimer = setTimeout(sendVotes, voteBatchDelay);
+    }
+}
+
+function sendVotes() {
+    const votes = pendingVotes;
+    pendingVotes = [];
+    voteBatchTimer = null;
     $.ajax({
         type: "POST",
         headers: { "X-CSRFToken": token },
-        url: "{% url 'like_thread' thread.slug %}",
-        data: { hasLiked: hasLiked },
+        url: "{% url 'vote_batch' %}",
+        data: { votes: JSON.stringify(votes) },
         success: function(data) {
-            updateScore(threadScore, data.newScore);
-            updateThreadButtons(data.likeStatus);
+            for (let pk in data.threads) {
+                updateScore(threadScore, data.threads[pk].score);
+                updateThreadButtons(data.threads[pk].likeStatus);
+            }
+            updateComments(data.comments);
         },
         error: function() {
             console.log('broke');
@@ -118,19 +140,78 @@ function handleThreadClick(hasLiked) {
     });
 }
 
+function handleThreadClick(hasLiked) {
+    queueVote('thread', {{ thread.pk }}, hasLiked);
+}
+
 function handleCommentClick(hasLiked, pk) {
-    const likeCommentURL = `/colleges/comments/${pk}/like`;
+    queueVote('comment', pk, hasLiked);
+}
+
+function loadMoreComments(link) {
     $.ajax({
-        type: "POST",
-        headers: { "X-CSRFToken": token },
-        url: likeCommentURL,
-        data: { hasLiked: hasLiked },
+        type: "GET",
+        url: link.dataset.url,
         success: function(data) {
-            updateScore(getCommentScore(pk), data.newScore);
-            updateCommentButtons(data.likeStatus, pk);
+            $(link).replaceWith(data.html);
+            updateComments(data.comments);
         },
         error: function() {
             console.log('broke');
         }
     });
 }
+
+
+// Live updates from the server, see colleges.live
+{% if live_updates %}
+const liveEvents = new EventSource("{% url 'thread_events' thread.slug %}");
+
+liveEvents.addEventListener('score', function(event) {
+    const data = JSON.parse(event.data);
+    if (data.target === 'thread') {
+        updateScore(threadScore, data.score);
+    } else {
+        updateScore(getCommentScore(data.pk), data.score);
+    }
+});
+
+liveEvents.addEventListener('comment', function(event) {
+    const data = JSON.parse(event.data);
+    if ($(`#comment-${data.pk}`).length) {
+        return;
+    }
+    if (data.parent === null) {
+        $('#comments').append(data.html);
+        return;
+    }
+    // Replies only show up under parents that are on the page
+    const parent = $(`#comment-${data.parent}`);
+    if (parent.length) {
+        if (!parent.children('.card-footer').length) {
+            parent.append('<div class="card-footer"></div>');
+        }
+        parent.children('.card-footer').append(data.html);
+    }
+});
+
+liveEvents.addEventListener('edit', function(event) {
+    const data = JSON.parse(event.data);
+    if (data.target === 'thread') {
+        $('#thread-title').text(data.title);
+        $('#thread-body').text(data.body);
+    } else {
+        $(`#comment-body-${data.pk}`).text(data.body);
+    }
+});
+
+liveEvents.addEventListener('delete', function(event) {
+    const data = JSON.parse(event.data);
+    if (data.target === 'thread') {
+        $('#thread-title').text('[deleted]');
+        $('#thread-body').text('[deleted]');
+    } else {
+        $(`#comment-body-${data.pk}`).text('[deleted]');
+    }
+});
+{% endif %}
@@ -0,0 +1,23 @@
+# Generated by Django 3.0.1 on 2026-10-18 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='myuser',
+            name='karma',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='myuser',
+            name='posts_count',
+            field=models.IntegerField(default=0, editable=False),
+        ),
+    ]
@@ -17,6 +17,10 @@ class MyUser(AbstractBaseUser, PermissionsMixin):
         on_delete=models.SET_NULL
     )
 
+    # Denormalized from the user's threads and comments, see colleges.counters
+    posts_count = models.IntegerField(default=0, editable=False)
+    karma = models.IntegerField(default=0, editable=False)
+
     is_staff = models.BooleanField(
         _('staff status'),
         default=False,